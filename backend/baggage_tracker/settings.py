@@ -33,7 +33,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
-    # 'channels',  # temporarily disabled
+    'channels',
     
     # Local apps
     'tracking',
@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tracking.routers.read_your_writes_middleware',
 ]
 
 ROOT_URLCONF = 'baggage_tracker.urls'
@@ -69,15 +70,41 @@ TEMPLATES = [
 ]
 
 # ASGI/WSGI configuration
-# ASGI_APPLICATION = 'baggage_tracker.asgi.application'  # temporarily disabled
+ASGI_APPLICATION = 'baggage_tracker.asgi.application'
 WSGI_APPLICATION = 'baggage_tracker.wsgi.application'
 
 # Database
+# Connections are kept open for CONN_MAX_AGE seconds and checked before
+# they are reused
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Read replica for passenger lookups and dashboards. Set
+    # BAGGAGE_REPLICA_DB to a second SQLite file (e.g. a copy of db.sqlite3)
+    # to route reads to it locally; otherwise it is the primary itself and
+    # reads are not routed. Tests use it as a mirror of default.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BAGGAGE_REPLICA_DB', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['tracking.routers.ReplicaRouter']
+
+# Views marked with tracking.routers.replica_reads read from a random alias
+# in REPLICAS. Clients that made a successful write read from the primary
+# for STICKY_SECONDS after it, so they see their own changes.
+REPLICA_ROUTING = {
+    'REPLICAS': ['replica'] if os.environ.get('BAGGAGE_REPLICA_DB') else [],
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'primary_reads',
 }
 
 # Password validation
@@ -110,6 +137,40 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# QR code rendering
+# 'background' renders tag images in an in-process worker pool after the bag
+# is saved; 'inline' renders them during the request that creates the bag;
+# 'on_demand' never writes images and serves them from
+# /api/baggage/qr/<qr_code>/image.png|svg instead.
+QR_RENDER = {
+    'MODE': 'background',
+    'WORKERS': 2,
+    'BATCH_SIZE': 50,
+    'USE_PROCESSES': False,  # use a process pool instead of threads
+    'BACKFILL_ON_START': False,  # queue bags missing an image when the pool starts
+    'CACHE_SIZE': 1024,  # on-demand images kept in memory
+}
+
+# Caches
+# Local memory is per process; point 'default' at a shared backend such as
+# django.core.cache.backends.filebased.FileBasedCache or Redis when running
+# several workers so invalidations reach all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'baggage-tracker',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Read-through cache of the public QR status lookup
+BAGGAGE_STATUS_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,  # seconds an unchanged response stays cached
+    'WAIT_TIMEOUT': 5,  # seconds a lookup waits for a concurrent rebuild
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -198,12 +259,130 @@ CORS_ALLOW_HEADERS = [
     'pragma',
 ]
 
-# Channels configuration for WebSockets (using in-memory for demo) - temporarily disabled
-# CHANNEL_LAYERS = {
-#     "default": {
-#         "BACKEND": "channels.layers.InMemoryChannelLayer"
-#     }
-# }
+# Channels configuration for WebSockets (using in-memory for demo).
+# The in-memory layer only reaches sockets served by the same process. Set
+# BAGGAGE_CHANNEL_SOCKETS to a directory private to the server's user to fan
+# out between worker processes on one host without a broker, or use
+# channels_redis.core.RedisChannelLayer to span several hosts.
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer"
+    }
+}
+if os.environ.get('BAGGAGE_CHANNEL_SOCKETS'):
+    CHANNEL_LAYERS['default'] = {
+        "BACKEND": "tracking.layers.UnixSocketChannelLayer",
+        "CONFIG": {
+            "path": os.environ['BAGGAGE_CHANNEL_SOCKETS'],
+            "capacity": 100,  # messages waiting per channel before ChannelFull
+        },
+    }
+
+# Status broadcasts to WebSocket subscribers. Updates to the same bag that
+# arrive within COALESCE_WINDOW seconds are sent as one event.
+WEBSOCKET_BROADCAST = {
+    'ENABLED': True,
+    'COALESCE_WINDOW': 0.1,
+}
+
+# Delta sync (/api/baggage/changes/). Bags changed within the last
+# SETTLE_WINDOW seconds are sent again by the next sync, so rows committed
+# late are not skipped.
+CHANGE_SYNC = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 500,
+    'SETTLE_WINDOW': 2.0,
+}
+
+# Server-Sent Events streams (/api/baggage/<id>/events/ and
+# /api/flights/<flight>/events/). HEARTBEAT is in seconds, RETRY (the
+# reconnect delay suggested to clients) in milliseconds.
+EVENT_STREAMS = {
+    'HEARTBEAT': 15,
+    'QUEUE_SIZE': 64,
+    'REPLAY_BATCH': 200,
+    'RETRY': 3000,
+}
+
+# Connection-storm protection for ws/baggage/<id>/. Bag snapshots are shared
+# between connections for SNAPSHOT_TTL seconds and at most MAX_SNAPSHOT_READS
+# are read at once. Beyond MAX_CONNECTING concurrent connection setups,
+# clients wait up to WAIT_TIMEOUT seconds; once MAX_WAITING are waiting, or
+# the wait times out, they are closed with code 1013 and a retry hint.
+WEBSOCKET_ADMISSION = {
+    'SNAPSHOT_TTL': 2.0,
+    'MAX_SNAPSHOT_READS': 4,
+    'MAX_CONNECTING': 100,
+    'MAX_WAITING': 1000,
+    'WAIT_TIMEOUT': 5.0,
+    'RETRY_AFTER': 5,
+}
+
+# Group commit of single status updates. When enabled, updates from
+# concurrent requests are recorded by one writer thread, up to MAX_BATCH per
+# transaction, waiting at most MAX_DELAY seconds for a group to fill.
+# Requests give up after TIMEOUT seconds. Mostly useful with SQLite.
+STATUS_GROUP_COMMIT = {
+    'ENABLED': False,
+    'MAX_BATCH': 200,
+    'MAX_DELAY': 0.005,
+    'TIMEOUT': 10,
+}
+
+# RFID portal reads (/api/baggage/rfid/reads/). Reads of the same tag at
+# the same location within WINDOW seconds of each other are dropped; at most
+# MAX_TRACKED recent (tag, location) pairs are remembered. READERS maps each
+# reader location to the status a read there means.
+RFID_AGGREGATION = {
+    'WINDOW': 30.0,
+    'MAX_TRACKED': 100000,
+    'READERS': {
+        'SECURITY-BELT-1': 'SECURITY_CLEARED',
+        'MAKEUP-BELT-1': 'LOADED',
+        'ARRIVALS-CAROUSEL-1': 'ARRIVED',
+    },
+}
+
+# Hot/cold archival (manage.py archive_baggage). Bags that have been in one
+# of TERMINAL_STATUSES for more than AFTER_DAYS days are moved with their
+# timelines to the archive table, BATCH_SIZE bags per transaction. QR and
+# detail lookups fall back to the archive.
+BAGGAGE_ARCHIVE = {
+    'AFTER_DAYS': 30,
+    'TERMINAL_STATUSES': ['ARRIVED'],
+    'BATCH_SIZE': 500,
+}
+
+# Stage dwell-time analytics (/api/staff/analytics/dwell-times/). STAGES are
+# (from, to) status pairs; stages still open MAX_DWELL_HOURS after the end of
+# the day are ignored. Reports are cached in CACHE_ALIAS for BUCKET_SECONDS
+# while the day can still change, then for FINAL_CACHE_TIMEOUT seconds.
+DWELL_TIME_ANALYTICS = {
+    'STAGES': [
+        ('CHECKED_IN', 'SECURITY_CLEARED'),
+        ('SECURITY_CLEARED', 'LOADED'),
+    ],
+    'PERCENTILES': [50, 90, 99],
+    'MAX_DWELL_HOURS': 24,
+    'CACHE_ALIAS': 'default',
+    'BUCKET_SECONDS': 300,
+    'FINAL_CACHE_TIMEOUT': 86400,
+}
+
+# Hourly throughput rollups (/api/staff/analytics/throughput/). New status
+# updates are folded in BATCH_SIZE at a time; charts span at most
+# MAX_RANGE_DAYS days. manage.py rebuild_throughput_rollups backfills them.
+THROUGHPUT_ROLLUPS = {
+    'BATCH_SIZE': 5000,
+    'MAX_RANGE_DAYS': 31,
+}
+
+# Streaming export (/api/staff/export/). Bags are read CHUNK_SIZE at a time
+# with their status updates; output is flushed every BUFFER_SIZE characters.
+BAGGAGE_EXPORT = {
+    'CHUNK_SIZE': 2000,
+    'BUFFER_SIZE': 65536,
+}
 
 # Baggage status choices
 BAGGAGE_STATUSES = [
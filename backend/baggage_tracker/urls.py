@@ -27,15 +27,29 @@ def api_root(request):
                 'list_create': '/api/baggage/',
                 'detail': '/api/baggage/{id}/',
                 'by_qr': '/api/baggage/qr/{qr_code}/',
+                'qr_image': '/api/baggage/qr/{qr_code}/image.{png|svg}',
                 'update_status': '/api/baggage/{id}/update/',
                 'timeline': '/api/baggage/{id}/timeline/',
+                'events': '/api/baggage/{id}/events/',
+                'flight_events': '/api/flights/{flight_number}/events/?token={staff access token}',
+                'changes': '/api/baggage/changes/?since={cursor}',
+                'batch_scans': '/api/baggage/scans/batch/',
+                'bsm_ingest': '/api/baggage/bsm/',
+                'rfid_reads': '/api/baggage/rfid/reads/',
             },
             'staff': {
                 'dashboard_stats': '/api/staff/dashboard/stats/',
+                'qr_render_status': '/api/staff/qr-render/status/',
+                'status_cache_status': '/api/staff/status-cache/status/',
+                'rfid_status': '/api/staff/rfid/status/',
+                'dwell_times': '/api/staff/analytics/dwell-times/?date={YYYY-MM-DD}&group_by={flight,location,hour}',
+                'throughput': '/api/staff/analytics/throughput/?start={time}&end={time}&group_by={location,status,flight_number}',
+                'export': '/api/staff/export/?from={time}&to={time}&format={csv|ndjson}',
             },
             'websocket': {
                 'baggage_updates': '/ws/baggage/{baggage_id}/',
                 'notifications': '/ws/notifications/',
+                'subscriptions': '/ws/subscriptions/?flights={flight_number,...}&bags={id,...}&token={staff access token}',
             }
         }
     })
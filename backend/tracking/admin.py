@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Baggage, StatusUpdate, UserProfile
+from .models import ArchivedBaggage, Baggage, StatusUpdate, UserProfile, StatusCounter, ThroughputRollup
 
 
 @admin.register(Baggage)
@@ -10,15 +10,15 @@ class BaggageAdmin(admin.ModelAdmin):
         'destination', 'current_status', 'created_at'
     ]
     list_filter = ['current_status', 'created_at', 'destination']
-    search_fields = ['qr_code', 'passenger_name', 'flight_number', 'passenger_email']
-    readonly_fields = ['id', 'qr_code', 'qr_code_image_preview', 'created_at', 'updated_at']
+    search_fields = ['qr_code', 'tag_number', 'passenger_name', 'flight_number', 'passenger_email']
+    readonly_fields = ['id', 'qr_code', 'tag_number', 'qr_code_image_preview', 'created_at', 'updated_at']
     
     fieldsets = (
         ('Passenger Information', {
             'fields': ('passenger_name', 'passenger_email', 'flight_number', 'destination')
         }),
         ('Baggage Details', {
-            'fields': ('id', 'qr_code', 'qr_code_image_preview', 'current_status')
+            'fields': ('id', 'qr_code', 'tag_number', 'qr_code_image_preview', 'current_status')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -75,3 +75,33 @@ class UserProfileAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(StatusCounter)
+class StatusCounterAdmin(admin.ModelAdmin):
+    list_display = ['status', 'flight_number', 'day', 'count']
+    list_filter = ['status', 'day']
+    search_fields = ['flight_number']
+    readonly_fields = ['status', 'flight_number', 'day', 'count']
+
+
+@admin.register(ArchivedBaggage)
+class ArchivedBaggageAdmin(admin.ModelAdmin):
+    list_display = ['qr_code', 'passenger_name', 'flight_number', 'current_status', 'archive_day', 'archived_at']
+    list_filter = ['archive_day']
+    search_fields = ['qr_code', 'tag_number', 'passenger_name', 'flight_number']
+    exclude = ['timeline']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ThroughputRollup)
+class ThroughputRollupAdmin(admin.ModelAdmin):
+    list_display = ['hour', 'location', 'status', 'flight_number', 'count']
+    list_filter = ['status', 'location']
+    search_fields = ['location', 'flight_number']
+    readonly_fields = ['hour', 'location', 'status', 'flight_number', 'count']
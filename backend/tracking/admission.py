@@ -0,0 +1,137 @@
+"""
+Connection-storm protection for the baggage WebSocket consumer
+
+When a flight lands hundreds of passengers open a socket within seconds.
+Three mechanisms keep that from exhausting the thread pool and database:
+
+* bag snapshots sent on connect are shared between connections for a
+  short TTL, and concurrent misses for the same bag share one read
+* snapshot reads that do reach the database are bounded by a semaphore
+* admission control limits how many connections are set up at once;
+  further connections wait for a slot, and are shed with close code 1013
+  (try again later) once too many are waiting or the wait times out
+
+All state is per process and per event loop.
+"""
+import asyncio
+import time
+import weakref
+
+from django.conf import settings
+
+DEFAULT_ADMISSION_SETTINGS = {
+    'SNAPSHOT_TTL': 2.0,
+    'MAX_SNAPSHOT_READS': 4,
+    'MAX_CONNECTING': 100,
+    'MAX_WAITING': 1000,
+    'WAIT_TIMEOUT': 5.0,
+    'RETRY_AFTER': 5,
+}
+
+# WebSocket close code for "Try Again Later"
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+def admission_settings():
+    return {**DEFAULT_ADMISSION_SETTINGS, **getattr(settings, 'WEBSOCKET_ADMISSION', {})}
+
+
+class ConnectionGate:
+    """
+    Snapshot cache, read limiter and admission control for one event loop
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._snapshots = {}  # baggage id -> (expires, snapshot)
+        self._reads = {}  # baggage id -> future of an in-progress read
+        self._read_slots = asyncio.Semaphore(config['MAX_SNAPSHOT_READS'])
+        self._connect_slots = asyncio.Semaphore(config['MAX_CONNECTING'])
+        self._waiting = 0
+        self.counters = {
+            'admitted': 0,
+            'deferred': 0,
+            'shed': 0,
+            'snapshot_hits': 0,
+            'snapshot_reads': 0,
+        }
+
+    async def admit(self):
+        """Wait for a connection slot; returns False if the connection should be shed"""
+        if not self._connect_slots.locked():
+            await self._connect_slots.acquire()
+            self.counters['admitted'] += 1
+            return True
+
+        if self._waiting >= self.config['MAX_WAITING']:
+            self.counters['shed'] += 1
+            return False
+
+        self._waiting += 1
+        self.counters['deferred'] += 1
+        try:
+            await asyncio.wait_for(self._connect_slots.acquire(), self.config['WAIT_TIMEOUT'])
+        except asyncio.TimeoutError:
+            self.counters['shed'] += 1
+            return False
+        finally:
+            self._waiting -= 1
+        self.counters['admitted'] += 1
+        return True
+
+    def release(self):
+        self._connect_slots.release()
+
+    async def snapshot(self, baggage_id, read):
+        """
+        Return the snapshot of a bag, calling the coroutine function
+        ``read`` only if no fresh copy is cached or already being read
+        """
+        cached = self._snapshots.get(baggage_id)
+        if cached is not None and cached[0] > time.monotonic():
+            self.counters['snapshot_hits'] += 1
+            return cached[1]
+
+        pending = self._reads.get(baggage_id)
+        if pending is not None:
+            self.counters['snapshot_hits'] += 1
+            return await asyncio.shield(pending)
+
+        pending = self._reads[baggage_id] = asyncio.get_running_loop().create_future()
+        try:
+            async with self._read_slots:
+                self.counters['snapshot_reads'] += 1
+                snapshot = await read()
+        except BaseException as error:
+            pending.set_exception(error)
+            pending.exception()  # waiters re-raise it; don't warn about it here
+            raise
+        else:
+            self._snapshots[baggage_id] = (time.monotonic() + self.config['SNAPSHOT_TTL'], snapshot)
+            pending.set_result(snapshot)
+            return snapshot
+        finally:
+            del self._reads[baggage_id]
+            self._evict_expired()
+
+    def forget(self, baggage_id):
+        """Drop a cached snapshot, e.g. when the bag has changed"""
+        self._snapshots.pop(baggage_id, None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for baggage_id, (expires, _) in list(self._snapshots.items()):
+            if expires <= now:
+                del self._snapshots[baggage_id]
+
+
+_gates = weakref.WeakKeyDictionary()
+
+
+def get_gate():
+    """The gate of the running event loop"""
+    loop = asyncio.get_running_loop()
+    gate = _gates.get(loop)
+    if gate is None:
+        gate = _gates[loop] = ConnectionGate(admission_settings())
+    return gate
@@ -0,0 +1,256 @@
+"""
+Stage dwell-time analytics for the staff dashboard
+
+A stage is a pair of consecutive statuses such as ``CHECKED_IN ->
+SECURITY_CLEARED``. A bag's dwell time in it runs from the bag's first
+update to the first status until its first update to the second. A report
+covers the stages that started on one local day and breaks them down by any
+of flight, location (where the stage started) and hour (when it started).
+
+The status updates of the day are read with one query whose raw rows skip
+Django's per-value converters; they are transposed into NumPy columns and
+encoded with ``np.unique``. Stages are matched per bag and percentiles
+computed per group with sorts and index arithmetic over whole arrays, so
+apart from the database driver building the rows no Python code runs per
+row. Reports are cached per ``BUCKET_SECONDS`` time bucket while the
+day can still change, and for ``FINAL_CACHE_TIMEOUT`` seconds after that.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import StatusUpdate
+
+DEFAULT_DWELL_TIME_SETTINGS = {
+    'STAGES': [
+        ('CHECKED_IN', 'SECURITY_CLEARED'),
+        ('SECURITY_CLEARED', 'LOADED'),
+    ],
+    'PERCENTILES': [50, 90, 99],
+    # Stages still open this long after the end of the day are ignored
+    'MAX_DWELL_HOURS': 24,
+    'CACHE_ALIAS': 'default',
+    'BUCKET_SECONDS': 300,
+    'FINAL_CACHE_TIMEOUT': 86400,
+}
+
+GROUP_BY_CHOICES = ('flight', 'location', 'hour')
+
+KEY_PREFIX = 'dwell-times'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def dwell_time_settings():
+    return {**DEFAULT_DWELL_TIME_SETTINGS, **getattr(settings, 'DWELL_TIME_ANALYTICS', {})}
+
+
+def day_bounds(day):
+    """Aware start and end of the local ``day``"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def factorize(values):
+    """Integer codes for ``values`` and the distinct values in code order"""
+    names, codes = np.unique(np.asarray(values), return_inverse=True)
+    return codes.astype(np.int64), names.tolist()
+
+
+def epoch_seconds(timestamps):
+    """Seconds since the epoch of raw timestamp column values, as a float array"""
+    if isinstance(timestamps[0], str):
+        # SQLite keeps UTC times as ISO text, which NumPy parses in bulk
+        return np.asarray(timestamps, dtype='datetime64[us]').astype(np.int64) / 1e6
+    # Subtracting datetimes gives plain timedeltas, which NumPy converts natively
+    epoch = EPOCH if timezone.is_aware(timestamps[0]) else EPOCH.replace(tzinfo=None)
+    offsets = (np.asarray(timestamps, dtype=object) - epoch).astype('timedelta64[us]')
+    return offsets.astype(np.int64) / 1e6
+
+
+def first_per_bag(order, bags, mask):
+    """Rows of the first update matching ``mask`` of every bag; ``order`` sorts rows by bag and time"""
+    rows = order[mask[order]]
+    row_bags = bags[rows]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = row_bags[1:] != row_bags[:-1]
+    return rows[first]
+
+
+def grouped_stats(groups, values, percentiles):
+    """
+    Count, mean and linearly interpolated percentiles of ``values`` per
+    distinct value of ``groups``. Returns (group values, counts, means,
+    {percentile: values}).
+    """
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    boundaries = np.ones(len(groups), dtype=bool)
+    boundaries[1:] = groups[1:] != groups[:-1]
+    starts = np.flatnonzero(boundaries)
+    counts = np.diff(np.append(starts, len(groups)))
+    means = np.add.reduceat(values, starts) / counts
+
+    results = {}
+    for percentile in percentiles:
+        position = (counts - 1) * (percentile / 100)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        fraction = position - lower
+        results[percentile] = values[starts + lower] * (1 - fraction) + values[starts + upper] * fraction
+    return groups[starts], counts, means, results
+
+
+def load_events(start, horizon, statuses, flight_number=None):
+    """Status updates between ``start`` and ``horizon`` as column arrays"""
+    updates = StatusUpdate.objects.filter(
+        timestamp__gte=start, timestamp__lt=horizon, status__in=statuses
+    )
+    if flight_number is not None:
+        updates = updates.filter(baggage__flight_number=flight_number)
+    # Blank rather than NULL text columns, so each column sorts as one type
+    columns = updates.order_by().values_list(
+        'baggage_id', 'status', 'timestamp',
+        Coalesce('location', Value('')), Coalesce('baggage__flight_number', Value(''))
+    )
+    sql, params = columns.query.sql_with_params()
+    with connections[columns.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    if not rows:
+        return None
+
+    bag_ids, status_values, timestamps, locations, flights = zip(*rows)
+    bags, _ = factorize(bag_ids)
+    status_codes, status_names = factorize(status_values)
+    location_codes, location_names = factorize(locations)
+    flight_codes, flight_names = factorize(flights)
+    return {
+        'count': len(rows),
+        'bags': bags,
+        'statuses': status_codes,
+        'status_names': status_names,
+        'timestamps': epoch_seconds(timestamps),
+        'location': location_codes,
+        'location_names': [name or None for name in location_names],
+        'flight': flight_codes,
+        'flight_names': [name or None for name in flight_names],
+    }
+
+
+def stage_stats(index, counts, means, values, percentiles):
+    stats = {'count': int(counts[index]), 'mean_seconds': round(float(means[index]), 1)}
+    for percentile in percentiles:
+        stats[f'p{percentile}_seconds'] = round(float(values[percentile][index]), 1)
+    return stats
+
+
+def compute_dwell_times(day, flight_number=None, group_by=()):
+    """Build the dwell-time report of ``day`` straight from the database"""
+    config = dwell_time_settings()
+    stages = [tuple(stage) for stage in config['STAGES']]
+    percentiles = config['PERCENTILES']
+    start, end = day_bounds(day)
+    horizon = end + timedelta(hours=config['MAX_DWELL_HOURS'])
+    # Hours are counted in absolute time, which matters on DST days
+    utc_start = start.astimezone(dt_timezone.utc)
+    statuses = sorted({status for stage in stages for status in stage})
+
+    report = {
+        'date': day.isoformat(),
+        'flight_number': flight_number,
+        'group_by': list(group_by),
+        'percentiles': percentiles,
+        'computed_at': timezone.now(),
+        'status_updates': 0,
+        'stages': [],
+    }
+    events = load_events(start, horizon, statuses, flight_number)
+    if events is not None:
+        report['status_updates'] = events['count']
+        bags, timestamps = events['bags'], events['timestamps']
+        order = np.lexsort((timestamps, bags))
+
+    for first_status, second_status in stages:
+        stage = {'from': first_status, 'to': second_status, 'overall': None, 'groups': []}
+        report['stages'].append(stage)
+        if events is None:
+            continue
+        names = events['status_names']
+        if first_status not in names or second_status not in names:
+            continue
+
+        entered = first_per_bag(order, bags, events['statuses'] == names.index(first_status))
+        left = first_per_bag(order, bags, events['statuses'] == names.index(second_status))
+        _, entered_at, left_at = np.intersect1d(
+            bags[entered], bags[left], assume_unique=True, return_indices=True
+        )
+        entered, left = entered[entered_at], left[left_at]
+
+        dwell = timestamps[left] - timestamps[entered]
+        started = timestamps[entered] - start.timestamp()
+        keep = (dwell >= 0) & (started >= 0) & (started < end.timestamp() - start.timestamp())
+        entered, dwell, started = entered[keep], dwell[keep], started[keep]
+        if not len(dwell):
+            continue
+
+        _, counts, means, values = grouped_stats(np.zeros(len(dwell), dtype=np.int64), dwell, percentiles)
+        stage['overall'] = stage_stats(0, counts, means, values, percentiles)
+        if not group_by:
+            continue
+
+        # One integer key per combination of the grouped columns
+        columns = {
+            'flight': (events['flight'][entered], len(events['flight_names'])),
+            'location': (events['location'][entered], len(events['location_names'])),
+            'hour': ((started // 3600).astype(np.int64), 25),
+        }
+        keys = np.zeros(len(dwell), dtype=np.int64)
+        for name in group_by:
+            codes, size = columns[name]
+            keys = keys * size + codes
+        group_keys, counts, means, values = grouped_stats(keys, dwell, percentiles)
+
+        for index, key in enumerate(group_keys.tolist()):
+            codes = {}
+            for name in reversed(group_by):
+                key, codes[name] = divmod(key, columns[name][1])
+            group = {}
+            for name in group_by:
+                if name == 'flight':
+                    group['flight_number'] = events['flight_names'][codes[name]]
+                elif name == 'location':
+                    group['location'] = events['location_names'][codes[name]]
+                else:
+                    group['hour'] = timezone.localtime(utc_start + timedelta(hours=codes[name]))
+            group.update(stage_stats(index, counts, means, values, percentiles))
+            stage['groups'].append(group)
+    return report
+
+
+def dwell_time_report(day, flight_number=None, group_by=()):
+    """
+    Cached dwell-time report of ``day``. While updates can still arrive for
+    the day the report is recomputed once per time bucket.
+    """
+    config = dwell_time_settings()
+    _, end = day_bounds(day)
+    now = timezone.now()
+    if now >= end + timedelta(hours=config['MAX_DWELL_HOURS']):
+        bucket, timeout = 'final', config['FINAL_CACHE_TIMEOUT']
+    else:
+        bucket, timeout = int(now.timestamp() // config['BUCKET_SECONDS']), config['BUCKET_SECONDS']
+
+    cache = caches[config['CACHE_ALIAS']]
+    key = f'{KEY_PREFIX}:{day.isoformat()}:{flight_number or ""}:{",".join(group_by)}:{bucket}'
+    report = cache.get(key)
+    if report is None:
+        report = compute_dwell_times(day, flight_number, group_by)
+        cache.set(key, report, timeout)
+    return report
@@ -0,0 +1,174 @@
+"""
+Hot/cold archival of completed bags
+
+Bags that have been in a terminal status for ``AFTER_DAYS`` days are moved,
+together with their status updates, out of ``tracking_baggage`` and
+``tracking_statusupdate`` into ``ArchivedBaggage``: one row per bag with the
+timeline compressed alongside it. Lists, searches, counters and delta sync
+only see the current operating window; the QR and detail lookups fall back
+to the archive when a bag is not in the hot tables.
+
+Bags are moved in batches, each in its own transaction: the archive rows
+are inserted, the hot rows deleted and the status counters moved in one go.
+A bag that changed after it was read fails its batch, which is rolled back
+and picked up again on the next run. Stored QR images of moved bags are
+deleted once the batch commits; archived tags are rendered on demand.
+Delta sync reports moved bags as tombstones.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from .cache import status_lookup_cache
+from .counters import apply_counter_deltas, counter_rows
+from .models import ArchivedBaggage, Baggage, StatusUpdate
+from .pagination import keyset_after
+from .serializers import StatusUpdateSerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_SETTINGS = {
+    'AFTER_DAYS': 30,
+    'TERMINAL_STATUSES': ['ARRIVED'],
+    'BATCH_SIZE': 500,
+}
+
+
+def archive_settings():
+    return {**DEFAULT_ARCHIVE_SETTINGS, **getattr(settings, 'BAGGAGE_ARCHIVE', {})}
+
+
+def archivable_baggage(after_days=None):
+    """Bags that have been in a terminal status for more than ``after_days`` days"""
+    config = archive_settings()
+    if after_days is None:
+        after_days = config['AFTER_DAYS']
+    cutoff = timezone.now() - timedelta(days=after_days)
+    return Baggage.objects.filter(
+        current_status__in=config['TERMINAL_STATUSES'],
+        updated_at__lt=cutoff
+    )
+
+
+def archived_copy(baggage):
+    """Build the archive row of a bag loaded ``with_timeline()``"""
+    timeline = StatusUpdateSerializer(baggage.get_status_timeline(), many=True).data
+    return ArchivedBaggage(
+        id=baggage.id,
+        passenger_name=baggage.passenger_name,
+        passenger_email=baggage.passenger_email,
+        flight_number=baggage.flight_number,
+        destination=baggage.destination,
+        qr_code=baggage.qr_code,
+        tag_number=baggage.tag_number,
+        current_status=baggage.current_status,
+        created_at=baggage.created_at,
+        updated_at=baggage.updated_at,
+        archive_day=timezone.localdate(baggage.updated_at),
+        timeline=ArchivedBaggage.pack_timeline(timeline),
+    )
+
+
+def delete_rows(queryset):
+    """
+    Delete the rows of ``queryset`` with one plain DELETE and return how many
+    went. Unlike ``QuerySet.delete()`` nothing is collected: no cascade and no
+    signals, so callers maintain counters and caches themselves.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    select, params = queryset.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN ({select})',
+            params
+        )
+        return cursor.rowcount
+
+
+def delete_stored_images(names):
+    """Delete QR image files from storage, logging the ones that can't be removed"""
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception:
+            logger.exception('Could not delete QR image %s', name)
+
+
+class ArchiveConflict(Exception):
+    """A bag in the batch changed while it was being archived"""
+
+
+def archive_batch(baggage_ids, after_days=None):
+    """
+    Move the given bags to the archive if they are still archivable.
+    Returns {archive_day: bags moved}.
+    """
+    candidates = archivable_baggage(after_days).filter(id__in=baggage_ids)
+    bags = list(candidates.with_timeline())
+    if not bags:
+        return Counter()
+
+    deltas = Counter()
+    moved = Counter()
+    for baggage in bags:
+        for row in counter_rows(baggage.current_status, baggage.flight_number, baggage.created_at):
+            deltas[row] -= 1
+    copies = [archived_copy(baggage) for baggage in bags]
+    for copy in copies:
+        moved[copy.archive_day] += 1
+
+    with transaction.atomic():
+        ArchivedBaggage.objects.bulk_create(copies)
+        # Plain DELETEs: the cascade and the per-instance signal handlers
+        # would cost queries per bag and per update. The counters and the
+        # status cache are maintained below instead.
+        ids = [baggage.id for baggage in bags]
+        delete_rows(StatusUpdate.objects.filter(baggage_id__in=ids))
+        # Any write since the bags were read moved updated_at past the cutoff
+        deleted = delete_rows(candidates)
+        if deleted != len(bags):
+            raise ArchiveConflict(f'{len(bags) - deleted} of {len(bags)} bags changed while being archived')
+        apply_counter_deltas(deltas)
+        status_lookup_cache.invalidate([baggage.qr_code for baggage in bags])
+        images = [baggage.qr_code_image.name for baggage in bags if baggage.qr_code_image]
+        if images:
+            transaction.on_commit(lambda: delete_stored_images(images))
+    return moved
+
+
+def archive_baggage(after_days=None, batch_size=None, limit=None):
+    """
+    Move every archivable bag to the archive, ``batch_size`` bags per
+    transaction. Returns {archive_day: bags moved}.
+    """
+    config = archive_settings()
+    batch_size = batch_size or config['BATCH_SIZE']
+    moved = Counter()
+    total = 0
+    # Walk the candidates in (updated_at, id) order, so that a batch skipped
+    # after a conflict does not stall the run
+    ordering = ('updated_at', 'id')
+    position = None
+    while limit is None or total < limit:
+        candidates = archivable_baggage(after_days).order_by(*ordering)
+        if position is not None:
+            candidates = candidates.filter(keyset_after(ordering, position))
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        batch = list(candidates.values_list(*ordering)[:size])
+        if not batch:
+            break
+        position = batch[-1]
+        try:
+            batch_moved = archive_batch([baggage_id for _, baggage_id in batch], after_days)
+        except ArchiveConflict as error:
+            logger.warning('Skipped a batch of %d bags: %s', len(batch), error)
+            continue
+        moved.update(batch_moved)
+        total += len(batch)
+    return moved
@@ -0,0 +1,183 @@
+"""
+WebSocket fan-out of baggage status changes
+
+Status changes are handed to the publisher once their transaction commits,
+so a scan request never waits on the channel layer. The publisher holds
+events for a short window and sends only the latest one per bag, which
+turns a burst of scans of the same bag into a single broadcast. Each event
+is JSON-encoded once before it goes to the channel layer, and consumers
+forward the encoded text to their sockets as is. Events also carry their
+group and the id of the status update, which SSE streams use as event id.
+
+Sends run on the event loop of the ASGI server when this process serves
+WebSockets, which the in-memory channel layer requires, and on a small
+background loop otherwise (e.g. under WSGI with a Redis channel layer).
+"""
+import asyncio
+import json
+import logging
+import re
+import threading
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROADCAST_SETTINGS = {
+    'ENABLED': True,
+    'COALESCE_WINDOW': 0.1,
+}
+
+
+def broadcast_settings():
+    return {**DEFAULT_BROADCAST_SETTINGS, **getattr(settings, 'WEBSOCKET_BROADCAST', {})}
+
+
+def baggage_group_name(baggage_id):
+    return f'baggage_{baggage_id}'
+
+
+def flight_group_name(flight_number):
+    """Group of every bag on a flight; characters groups can't hold become ``-``"""
+    return 'flight_' + re.sub(r'[^A-Za-z0-9_.-]', '-', flight_number.upper())[:80]
+
+
+def baggage_update_message(baggage, status_update):
+    """The ``data`` payload clients receive for a status change"""
+    return {
+        'baggage_id': str(baggage.id),
+        'update_id': status_update.id,
+        'qr_code': baggage.qr_code,
+        'status': status_update.status,
+        'status_display': status_update.get_status_display(),
+        'timestamp': status_update.timestamp.isoformat(),
+        'updated_by': status_update.updated_by.username if status_update.updated_by else 'System',
+        'notes': status_update.notes,
+        'location': status_update.location,
+    }
+
+
+class BroadcastPublisher:
+    """
+    Coalesces status events per bag and sends them to the channel layer
+    """
+
+    def __init__(self, window=0.1):
+        self.window = window
+        self._pending = {}  # (group, baggage id) -> [latest message, number of events]
+        self._lock = threading.Lock()
+        self._flush_loop = None
+        self._loop = None
+        self._own_loop = None
+        self._published = 0
+        self._sent = 0
+        self._failed = 0
+
+    def attach(self, loop):
+        """Send from ``loop``, the event loop serving this process's WebSockets"""
+        with self._lock:
+            self._loop = loop
+
+    def _target_loop(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            return loop
+        if self._own_loop is None:
+            self._own_loop = asyncio.new_event_loop()
+            threading.Thread(target=self._own_loop.run_forever, name='ws-publish', daemon=True).start()
+        return self._own_loop
+
+    def publish(self, group, message):
+        """Queue ``message`` for ``group``, replacing any not yet sent for the same bag"""
+        key = (group, message['baggage_id'])
+        with self._lock:
+            count = self._pending[key][1] + 1 if key in self._pending else 1
+            self._pending[key] = [message, count]
+            self._published += 1
+            if self._flush_loop is not None and not self._flush_loop.is_closed():
+                return
+            loop = self._flush_loop = self._target_loop()
+        loop.call_soon_threadsafe(loop.call_later, self.window, self._start_flush)
+
+    def _start_flush(self):
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Send everything pending, one encoded event per bag and group"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flush_loop = None
+
+        channel_layer = get_channel_layer()
+        encoded = {}
+        for (group, baggage_id), (message, count) in pending.items():
+            # A bag's event is usually sent to its own group and its flight's.
+            # The groups may hold different messages of the bag if a flush ran
+            # between publishing to them, so the memo is keyed by message;
+            # ``pending`` keeps them alive, so their ids are unique.
+            memo_key = (id(message), count)
+            if memo_key not in encoded:
+                encoded[memo_key] = json.dumps({
+                    'type': 'baggage_update',
+                    'data': message,
+                    'coalesced': count,
+                })
+            text = encoded[memo_key]
+            try:
+                await channel_layer.group_send(group, {
+                    'type': 'baggage_update',
+                    'text': text,
+                    'group': group,
+                    'id': message['update_id'],
+                })
+                sent, failed = 1, 0
+            except Exception:
+                logger.exception('Failed to broadcast to %s', group)
+                sent, failed = 0, 1
+            with self._lock:
+                self._sent += sent
+                self._failed += failed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'published': self._published,
+                'sent': self._sent,
+                'failed': self._failed,
+                'pending': len(self._pending),
+            }
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """Process-wide publisher, created on first use"""
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = BroadcastPublisher(window=broadcast_settings()['COALESCE_WINDOW'])
+        return _publisher
+
+
+def publish_baggage_update(baggage, status_update):
+    """
+    Broadcast a status change to subscribers of the bag and of its flight
+    once the current transaction commits
+    """
+    if not broadcast_settings()['ENABLED'] or get_channel_layer() is None:
+        return
+    groups = [baggage_group_name(baggage.id)]
+    if baggage.flight_number:
+        groups.append(flight_group_name(baggage.flight_number))
+    message = baggage_update_message(baggage, status_update)
+
+    def publish():
+        publisher = get_publisher()
+        for group in groups:
+            publisher.publish(group, message)
+
+    transaction.on_commit(publish)
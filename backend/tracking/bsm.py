@@ -0,0 +1,215 @@
+"""
+Streaming ingest of IATA Baggage Source Messages (BSM)
+
+Departure control systems send one telegram per passenger, for example::
+
+    BSM
+    .V/1LEBB
+    .F/KL566/15OCT/AMS/Y
+    .N/0074123456002
+    .P/1JOHNSON/ALICE MRS
+    ENDBSM
+
+Messages are parsed lazily line by line, so a file or request body of any
+size is processed with memory bounded by the chunk size.
+
+``CHG`` telegrams update the passenger, flight and destination of bags that
+already exist and create the ones that don't. ``DEL`` telegrams are counted
+as skipped: bags keep their scan history and are archived as usual.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+from .cache import status_lookup_cache
+from .counters import apply_counter_deltas, counter_rows
+from .models import Baggage
+
+
+DEFAULT_CHUNK_SIZE = 1000
+NAME_TITLES = {'MR', 'MRS', 'MS', 'MISS', 'MSTR', 'DR', 'PROF'}
+TAG_NUMBER_DIGITS = 10
+# Fields a CHG telegram can change
+CHANGED_FIELDS = ('passenger_name', 'flight_number', 'destination')
+
+
+class BSMMessage:
+    """
+    One parsed BSM telegram
+    """
+
+    def __init__(self):
+        self.action = 'ADD'  # ADD, CHG or DEL
+        self.flight_number = None
+        self.destination = None
+        self.tag_numbers = []
+        self.passenger_name = None
+
+    @property
+    def is_valid(self):
+        return bool(self.tag_numbers and self.passenger_name)
+
+
+def _tag_numbers(element):
+    """
+    Expand ``.N/`` (10-digit tag number + 3-digit count of consecutive tags).
+    A range that runs past the largest 10-digit number is invalid.
+    """
+    value = element.split('/')[0].strip()
+    if len(value) < TAG_NUMBER_DIGITS or not value[:TAG_NUMBER_DIGITS].isdigit():
+        return []
+    first = int(value[:TAG_NUMBER_DIGITS])
+    count = value[TAG_NUMBER_DIGITS:TAG_NUMBER_DIGITS + 3]
+    count = max(int(count), 1) if count.isdigit() else 1
+    if first + count > 10 ** TAG_NUMBER_DIGITS:
+        return []
+    return [f'{first + offset:0{TAG_NUMBER_DIGITS}d}' for offset in range(count)]
+
+
+def _passenger_name(element):
+    """Turn ``.P/1JOHNSON/ALICE MRS`` into ``Alice Johnson``"""
+    parts = element.split('/')
+    surname = parts[0].lstrip('0123456789').strip()
+    given_names = []
+    for part in parts[1:]:
+        words = part.split()
+        if words and words[-1] in NAME_TITLES:
+            words = words[:-1]
+        given_names.extend(words)
+    name = ' '.join(given_names + [surname]).strip()
+    return name.title() or None
+
+
+def iter_bsm_messages(lines):
+    """
+    Yield a ``BSMMessage`` for every telegram in ``lines``.
+
+    ``lines`` can be any iterable of ``str`` or ``bytes`` lines, such as an
+    open file or a request stream.
+    """
+    message = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('ascii', errors='replace')
+        line = line.strip()
+        if not line:
+            continue
+
+        if line == 'BSM':
+            message = BSMMessage()
+        elif message is None:
+            continue
+        elif line == 'ENDBSM':
+            yield message
+            message = None
+        elif line in ('CHG', 'DEL'):
+            message.action = line
+        elif line.startswith('.F/'):
+            fields = line[3:].split('/')
+            message.flight_number = fields[0].strip() or None
+            if len(fields) > 2:
+                message.destination = fields[2].strip() or None
+        elif line.startswith('.N/'):
+            message.tag_numbers.extend(_tag_numbers(line[3:]))
+        elif line.startswith('.P/') and message.passenger_name is None:
+            message.passenger_name = _passenger_name(line[3:])
+
+
+def _apply_changes(bags, changes):
+    """
+    Write CHG fields to stored ``bags`` (tag number -> locked bag) and move
+    their status counters. Returns how many bags changed.
+    """
+    now = timezone.now()
+    changed = []
+    deltas = Counter()
+    for tag_number, fields in changes.items():
+        bag = bags[tag_number]
+        if all(getattr(bag, name) == value for name, value in fields.items()):
+            continue
+        for row in counter_rows(bag.current_status, bag.flight_number, bag.created_at):
+            deltas[row] -= 1
+        for name, value in fields.items():
+            setattr(bag, name, value)
+        for row in counter_rows(bag.current_status, bag.flight_number, bag.created_at):
+            deltas[row] += 1
+        bag.updated_at = now
+        changed.append(bag)
+    if changed:
+        Baggage.objects.bulk_update(changed, [*CHANGED_FIELDS, 'updated_at'])
+        apply_counter_deltas(deltas)
+        status_lookup_cache.invalidate(bag.qr_code for bag in changed)
+    return len(changed)
+
+
+def ingest_bsm(lines, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Create or change bags for every tag in a stream of BSM telegrams.
+
+    Bags are deduplicated by tag number, both within the stream and against
+    bags already in the database, and inserted in chunks with
+    ``bulk_create``; CHG telegrams for stored bags are applied with one
+    ``bulk_update`` per chunk. Returns counters describing what was done.
+    """
+    stats = {
+        'messages': 0,
+        'created': 0,
+        'updated': 0,
+        'duplicates': 0,
+        'skipped': 0,
+    }
+    chunk = {}  # tag number -> new Baggage
+    changes = {}  # tag number -> fields of its latest CHG telegram
+
+    def flush():
+        with transaction.atomic():
+            stored = {
+                bag.tag_number: bag
+                for bag in Baggage.objects.select_for_update().filter(tag_number__in=chunk).only(
+                    'id', 'qr_code', 'tag_number', 'current_status', 'created_at', *CHANGED_FIELDS
+                )
+            }
+            new_bags = [bag for tag_number, bag in chunk.items() if tag_number not in stored]
+            Baggage.objects.create_in_bulk(new_bags, batch_size=chunk_size)
+            stats['updated'] += _apply_changes(
+                stored, {tag_number: fields for tag_number, fields in changes.items() if tag_number in stored}
+            )
+        stats['created'] += len(new_bags)
+        stats['duplicates'] += len(set(stored) - set(changes))
+        chunk.clear()
+        changes.clear()
+
+    for message in iter_bsm_messages(lines):
+        stats['messages'] += 1
+        if message.action == 'DEL' or not message.is_valid:
+            stats['skipped'] += 1
+            continue
+
+        fields = {
+            'passenger_name': message.passenger_name[:200],
+            'flight_number': message.flight_number and message.flight_number[:20],
+            'destination': message.destination and message.destination[:100],
+        }
+        if message.action == 'CHG':
+            fields = {name: value for name, value in fields.items() if value is not None}
+
+        now = timezone.now()
+        for tag_number in message.tag_numbers:
+            if tag_number in chunk:
+                if message.action == 'CHG':
+                    # Changed before it was stored: store it changed
+                    for name, value in fields.items():
+                        setattr(chunk[tag_number], name, value)
+                    changes[tag_number] = {**changes.get(tag_number, {}), **fields}
+                else:
+                    stats['duplicates'] += 1
+                continue
+            chunk[tag_number] = Baggage(tag_number=tag_number, created_at=now, **fields)
+            if message.action == 'CHG':
+                changes[tag_number] = fields
+            if len(chunk) >= chunk_size:
+                flush()
+
+    if chunk:
+        flush()
+    return stats
@@ -0,0 +1,157 @@
+"""
+Read-through cache for the public baggage status lookup
+
+Serialized responses of ``baggage_status_by_qr`` are kept in a Django cache
+keyed by QR code. Every bag has a generation token stored next to its
+entries; writes to the bag or its timeline delete the token once their
+transaction commits, which orphans every cached variant of the response at
+once. A rebuild that raced with the write stores its result under the old
+token, so stale data is never served after the commit. That only holds if
+rebuilds read from the primary; entries must not be built from a replica.
+
+Concurrent misses for the same entry are coalesced: one thread rebuilds the
+response while the others in the process wait for its result.
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+DEFAULT_STATUS_CACHE_SETTINGS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'WAIT_TIMEOUT': 5,
+}
+
+KEY_PREFIX = 'baggage-status'
+
+
+def status_cache_settings():
+    return {**DEFAULT_STATUS_CACHE_SETTINGS, **getattr(settings, 'BAGGAGE_STATUS_CACHE', {})}
+
+
+def _generation_key(qr_code):
+    return f'{KEY_PREFIX}:gen:{qr_code}'
+
+
+class _Flight:
+    """
+    One in-progress rebuild that other lookups can wait on
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.failed = False
+
+
+class StatusLookupCache:
+    """
+    Generation-keyed read-through cache with single-flight rebuilds
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._invalidations = 0
+
+    @property
+    def cache(self):
+        return caches[status_cache_settings()['ALIAS']]
+
+    def _generation(self, qr_code):
+        key = _generation_key(qr_code)
+        generation = self.cache.get(key)
+        if generation is None:
+            self.cache.add(key, uuid.uuid4().hex, status_cache_settings()['TIMEOUT'])
+            generation = self.cache.get(key)
+        return generation
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_or_build(self, qr_code, variant, build):
+        """
+        Return the cached response for ``qr_code`` and ``variant``, calling
+        ``build()`` on a miss. ``None`` results (unknown bags) are shared
+        with waiting lookups but never stored.
+        """
+        config = status_cache_settings()
+        if not config['ENABLED']:
+            return build()
+
+        key = f'{KEY_PREFIX}:{qr_code}:{self._generation(qr_code)}:{variant}'
+        value = self.cache.get(key)
+        if value is not None:
+            self._count('_hits')
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self._count('_coalesced')
+            if flight.done.wait(config['WAIT_TIMEOUT']) and not flight.failed:
+                return flight.value
+            return build()
+
+        self._count('_misses')
+        try:
+            # The entry may have been stored just before this flight started
+            value = self.cache.get(key)
+            if value is None:
+                value = build()
+                if value is not None:
+                    self.cache.set(key, value, config['TIMEOUT'])
+            flight.value = value
+            return value
+        except Exception:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def invalidate(self, qr_codes):
+        """Drop every cached response for ``qr_codes`` once the current transaction commits"""
+        keys = [_generation_key(qr_code) for qr_code in set(qr_codes) if qr_code]
+        if not keys:
+            return
+
+        def drop():
+            self.cache.delete_many(keys)
+            with self._lock:
+                self._invalidations += len(keys)
+
+        transaction.on_commit(drop)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                'enabled': status_cache_settings()['ENABLED'],
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'invalidations': self._invalidations,
+                'hit_ratio': round(self._hits / lookups, 3) if lookups else None,
+                'in_flight': len(self._flights),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = self._misses = self._coalesced = self._invalidations = 0
+
+
+status_lookup_cache = StatusLookupCache()
@@ -0,0 +1,70 @@
+"""
+Conditional GET for baggage read endpoints
+
+Validators are derived from ``Baggage.updated_at`` and the id of the bag's
+latest status update. Both come from one small indexed query, so a poll for
+an unchanged bag is answered with ``304 Not Modified`` without loading the
+timeline or serializing anything.
+"""
+import hashlib
+from calendar import timegm
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from .models import Baggage
+
+# Bump when the JSON representation changes so clients drop cached bodies
+REPRESENTATION_VERSION = 1
+
+
+def with_latest_update(queryset):
+    """Annotate bags with ``latest_update_id``, the id of their newest status update"""
+    return queryset.order_by().annotate(latest_update_id=Max('status_updates__id'))
+
+
+def validators_for(baggage_id, updated_at, latest_update_id):
+    """Return ``(etag, last_modified)`` for a bag; ``last_modified`` is a Unix timestamp"""
+    key = f'{REPRESENTATION_VERSION}:{baggage_id}:{updated_at.isoformat()}:{latest_update_id}'
+    etag = f'W/"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+    return etag, timegm(updated_at.utctimetuple())
+
+
+def baggage_validators(**lookup):
+    """
+    Return ``(etag, last_modified)`` for the bag matching ``lookup``, or
+    ``None`` if there is no such bag.
+    """
+    row = (
+        with_latest_update(Baggage.objects.filter(**lookup))
+        .values_list('id', 'updated_at', 'latest_update_id')
+        .first()
+    )
+    if row is None:
+        return None
+    return validators_for(*row)
+
+
+def archived_baggage_validators(archived):
+    """Return ``(etag, last_modified)`` for an ``ArchivedBaggage``, which never changes"""
+    key = f'{REPRESENTATION_VERSION}:{archived.id}:archived:{archived.archived_at.isoformat()}'
+    etag = f'W/"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+    return etag, timegm(archived.updated_at.utctimetuple())
+
+
+def not_modified_response(request, validators):
+    """Return a 304 response if the client's copy matches ``validators``, else ``None``"""
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, validators)
+    return response
+
+
+def set_validators(response, validators):
+    """Add the validator headers and ask clients to revalidate before reuse"""
+    etag, last_modified = validators
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    return response
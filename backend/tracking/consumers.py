@@ -1,14 +1,61 @@
+import asyncio
 import json
+import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django.contrib.auth import get_user_model
-from tracking.models import Baggage
+from urllib.parse import parse_qs
+from django.db.models import Q
+from tracking.admission import CLOSE_TRY_AGAIN_LATER, get_gate
+from tracking.broadcast import baggage_group_name, flight_group_name, get_publisher
+from tracking.models import Baggage, on_flights
+from tracking.tokens import is_staff_member, user_for_token
 
 User = get_user_model()
 
+# Most flights plus bags one socket may follow at once
+MAX_SUBSCRIPTIONS = 50
+
+
+def baggage_snapshot(baggage):
+    """
+    Current state of a bag as sent to WebSocket clients
+    """
+    return {
+        'id': str(baggage.id),
+        'qr_code': baggage.qr_code,
+        'passenger_name': baggage.passenger_name,
+        'flight_number': baggage.flight_number,
+        'destination': baggage.destination,
+        'current_status': baggage.current_status,
+        'current_status_display': baggage.get_current_status_display(),
+        'created_at': baggage.created_at.isoformat(),
+        'updated_at': baggage.updated_at.isoformat(),
+    }
+
+
+def _bag_ids(values):
+    """Canonical bag ids in ``values`` and the values that are not ids"""
+    bag_ids, invalid = set(), []
+    for value in values:
+        try:
+            bag_ids.add(str(uuid.UUID(value)))
+        except ValueError:
+            invalid.append(value)
+    return bag_ids, invalid
+
+
+def _split_values(values):
+    """Accept a list or a comma-separated string of values"""
+    if isinstance(values, str):
+        values = values.split(',')
+    if not isinstance(values, list):
+        return []
+    return [str(value).strip() for value in values if str(value).strip()]
+
 
 class BaggageUpdateConsumer(AsyncWebsocketConsumer):
     """
@@ -17,28 +64,51 @@ class BaggageUpdateConsumer(AsyncWebsocketConsumer):
     
     async def connect(self):
         self.baggage_id = self.scope['url_route']['kwargs']['baggage_id']
-        self.room_group_name = f'baggage_{self.baggage_id}'
+        self.room_group_name = baggage_group_name(self.baggage_id)
         
-        # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        # Status broadcasts are sent from the loop serving this socket
+        get_publisher().attach(asyncio.get_running_loop())
         
-        await self.accept()
+        # When a flight lands, wait for a setup slot or turn the client away
+        gate = get_gate()
+        if not await gate.admit():
+            await self.reject_overloaded(gate.config['RETRY_AFTER'])
+            return
         
-        # Send current baggage status on connection
-        baggage_data = await self.get_baggage_data()
-        if baggage_data:
-            await self.send(text_data=json.dumps({
-                'type': 'connection_established',
-                'baggage': baggage_data
-            }))
-        else:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': 'Baggage not found'
-            }))
+        try:
+            # Join room group
+            await self.channel_layer.group_add(
+                self.room_group_name,
+                self.channel_name
+            )
+            
+            await self.accept()
+            
+            # Send current baggage status on connection
+            baggage_data = await gate.snapshot(self.baggage_id, self.get_baggage_data)
+            if baggage_data:
+                await self.send(text_data=json.dumps({
+                    'type': 'connection_established',
+                    'baggage': baggage_data
+                }))
+            else:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'Baggage not found'
+                }))
+        finally:
+            gate.release()
+    
+    async def reject_overloaded(self, retry_after):
+        """
+        Close with 1013 (try again later) and tell the client when to retry
+        """
+        await self.accept()
+        await self.send(text_data=json.dumps({
+            'type': 'overloaded',
+            'retry_after': retry_after
+        }))
+        await self.close(code=CLOSE_TRY_AGAIN_LATER)
     
     async def disconnect(self, close_code):
         # Leave room group
@@ -57,7 +127,7 @@ class BaggageUpdateConsumer(AsyncWebsocketConsumer):
             
             if message_type == 'get_status':
                 # Send current baggage status
-                baggage_data = await self.get_baggage_data()
+                baggage_data = await get_gate().snapshot(self.baggage_id, self.get_baggage_data)
                 await self.send(text_data=json.dumps({
                     'type': 'status_update',
                     'baggage': baggage_data
@@ -87,14 +157,12 @@ class BaggageUpdateConsumer(AsyncWebsocketConsumer):
     async def baggage_update(self, event):
         """
         Handle baggage update messages from group
-        """
-        message = event['message']
         
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'baggage_update',
-            'data': message
-        }))
+        Events arrive already encoded by the publisher and are forwarded as is.
+        """
+        # The shared snapshot of this bag is stale now
+        get_gate().forget(self.baggage_id)
+        await self.send(text_data=event['text'])
     
     @database_sync_to_async
     def get_baggage_data(self):
@@ -102,18 +170,7 @@ class BaggageUpdateConsumer(AsyncWebsocketConsumer):
         Get current baggage data from database
         """
         try:
-            baggage = Baggage.objects.get(id=self.baggage_id)
-            return {
-                'id': str(baggage.id),
-                'qr_code': baggage.qr_code,
-                'passenger_name': baggage.passenger_name,
-                'flight_number': baggage.flight_number,
-                'destination': baggage.destination,
-                'current_status': baggage.current_status,
-                'current_status_display': baggage.get_current_status_display(),
-                'created_at': baggage.created_at.isoformat(),
-                'updated_at': baggage.updated_at.isoformat(),
-            }
+            return baggage_snapshot(Baggage.objects.get(id=self.baggage_id))
         except Baggage.DoesNotExist:
             return None
     
@@ -190,4 +247,155 @@ class GeneralNotificationConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'type': 'notification',
             'data': message
-        }))
\ No newline at end of file
+        }))
+
+
+class BaggageSubscriptionConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer that follows whole flights and any number of bags
+    over one connection
+    
+    Initial subscriptions come from the query string
+    (``?flights=KL566,ET302&bags=<id>,<id>``) and can be changed with
+    ``subscribe`` and ``unsubscribe`` messages carrying ``flights`` and
+    ``bags`` lists. Every subscription change is answered with one
+    snapshot of the newly followed bags.
+    
+    A flight snapshot lists every passenger on it, so following flights
+    takes a staff user: a JWT access token in ``?token=`` or an
+    ``authenticate`` message, or a staff session. Bags can be followed by
+    anyone who knows their id.
+    """
+    
+    async def connect(self):
+        self.flights = set()
+        self.bags = set()
+        
+        # Status broadcasts are sent from the loop serving this socket
+        get_publisher().attach(asyncio.get_running_loop())
+        
+        await self.accept()
+        
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        token = params.get('token', [None])[0]
+        user = await database_sync_to_async(user_for_token)(token) if token else self.scope.get('user')
+        self.is_staff = await database_sync_to_async(is_staff_member)(user)
+        await self.subscribe(
+            _split_values(','.join(params.get('flights', []))),
+            _split_values(','.join(params.get('bags', [])))
+        )
+    
+    async def disconnect(self, close_code):
+        for group in self.groups_for(self.flights, self.bags):
+            await self.channel_layer.group_discard(group, self.channel_name)
+    
+    async def receive(self, text_data):
+        """
+        Handle subscription changes
+        """
+        try:
+            text_data_json = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_error('Invalid JSON format')
+            return
+        
+        message_type = text_data_json.get('type')
+        flights = _split_values(text_data_json.get('flights', []))
+        bags = _split_values(text_data_json.get('bags', []))
+        
+        if message_type == 'authenticate':
+            await self.authenticate(text_data_json.get('token'))
+        elif message_type == 'subscribe':
+            await self.subscribe(flights, bags)
+        elif message_type == 'unsubscribe':
+            await self.unsubscribe(flights, bags)
+        elif message_type == 'ping':
+            await self.send(text_data=json.dumps({
+                'type': 'pong',
+                'timestamp': text_data_json.get('timestamp')
+            }))
+        else:
+            await self.send_error('Unknown message type')
+    
+    def groups_for(self, flights, bags):
+        return [flight_group_name(flight) for flight in flights] + [baggage_group_name(bag) for bag in bags]
+    
+    async def authenticate(self, token):
+        user = await database_sync_to_async(user_for_token)(token)
+        if user is None:
+            await self.send(text_data=json.dumps({
+                'type': 'authentication_failed',
+                'message': 'Invalid token'
+            }))
+            return
+        self.is_staff = await database_sync_to_async(is_staff_member)(user)
+        await self.send(text_data=json.dumps({
+            'type': 'authenticated',
+            'user': user.username,
+            'is_staff': self.is_staff
+        }))
+    
+    async def subscribe(self, flights, bags):
+        flights = {flight.upper() for flight in flights} - self.flights
+        if flights and not self.is_staff:
+            await self.send_error('Following flights requires a staff access token')
+            flights = set()
+        bags, invalid = _bag_ids(bags)
+        for bag in invalid:
+            await self.send_error(f'Invalid baggage id: {bag}')
+        bags -= self.bags
+        
+        if len(self.flights) + len(self.bags) + len(flights) + len(bags) > MAX_SUBSCRIPTIONS:
+            await self.send_error(f'At most {MAX_SUBSCRIPTIONS} subscriptions per connection')
+            return
+        
+        # Join before reading so no update between the two is missed
+        for group in self.groups_for(flights, bags):
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.flights |= flights
+        self.bags |= bags
+        
+        await self.send(text_data=json.dumps({
+            'type': 'snapshot',
+            'flights': sorted(self.flights),
+            'bags': sorted(self.bags),
+            'baggage': await self.get_snapshot(flights, bags),
+        }))
+    
+    async def unsubscribe(self, flights, bags):
+        flights = {flight.upper() for flight in flights} & self.flights
+        bags = _bag_ids(bags)[0] & self.bags
+        for group in self.groups_for(flights, bags):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.flights -= flights
+        self.bags -= bags
+        
+        await self.send(text_data=json.dumps({
+            'type': 'subscriptions',
+            'flights': sorted(self.flights),
+            'bags': sorted(self.bags),
+        }))
+    
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message
+        }))
+    
+    async def baggage_update(self, event):
+        """
+        Forward an encoded status event from a followed flight or bag
+        """
+        await self.send(text_data=event['text'])
+    
+    @database_sync_to_async
+    def get_snapshot(self, flights, bags):
+        """
+        Current state of every bag on ``flights`` and in ``bags``, in one query
+        """
+        if not flights and not bags:
+            return []
+        queryset = Baggage.objects.filter(
+            Q(on_flights(flights)) | Q(id__in=bags)
+        ).order_by('flight_number', 'created_at')
+        return [baggage_snapshot(baggage) for baggage in queryset]
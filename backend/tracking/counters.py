@@ -0,0 +1,180 @@
+"""
+Incrementally maintained status counters for the staff dashboard
+"""
+from collections import Counter
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Baggage, StatusCounter
+
+
+def counter_rows(status, flight_number, created_at):
+    """Counter rows (status, flight_number, day) a bag is counted under"""
+    return [
+        (status, '', None),
+        (status, flight_number or '', timezone.localdate(created_at)),
+    ]
+
+
+def move_baggage_counters(old_key, new_key):
+    """
+    Move one bag between counters.
+
+    Keys are ``(current_status, flight_number, created_at)`` tuples; pass
+    ``None`` as ``old_key`` for a new bag and as ``new_key`` for a deleted one.
+    """
+    deltas = Counter()
+    if old_key is not None:
+        for row in counter_rows(*old_key):
+            deltas[row] -= 1
+    if new_key is not None:
+        for row in counter_rows(*new_key):
+            deltas[row] += 1
+    apply_counter_deltas(deltas)
+
+
+def apply_counter_deltas(deltas):
+    """
+    Add ``deltas`` (a mapping of counter row -> change) to the counter table.
+
+    Must run inside the transaction that made the matching bag changes. The
+    airport-wide rows are moved with a single UPDATE and the per-flight rows
+    with a single upsert, however many rows change.
+    """
+    deltas = {row: delta for row, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    connection = connections[router.db_for_write(StatusCounter)]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        _apply_counter_deltas_one_by_one(deltas)
+        return
+
+    totals = {status: delta for (status, _, day), delta in deltas.items() if day is None}
+    if totals:
+        # The unique constraint treats NULL days as distinct, so the
+        # airport-wide rows can't take part in the upsert below
+        updated = StatusCounter.objects.filter(
+            flight_number='', day__isnull=True, status__in=totals
+        ).update(count=F('count') + Case(
+            *[When(status=status, then=Value(delta)) for status, delta in totals.items()],
+            default=Value(0)
+        ))
+        if updated < len(totals):
+            existing = set(
+                StatusCounter.objects.filter(flight_number='', day__isnull=True)
+                .values_list('status', flat=True)
+            )
+            _apply_counter_deltas_one_by_one({
+                (status, '', None): delta for status, delta in totals.items() if status not in existing
+            })
+
+    breakdowns = [(row, delta) for row, delta in deltas.items() if row[2] is not None]
+    if breakdowns:
+        _upsert_counter_deltas(connection, breakdowns)
+
+
+def _upsert_counter_deltas(connection, breakdowns):
+    quote = connection.ops.quote_name
+    table = quote(StatusCounter._meta.db_table)
+    count = quote('count')
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(breakdowns))
+    params = []
+    for (status, flight_number, day), delta in breakdowns:
+        params.extend([status, flight_number, connection.ops.adapt_datefield_value(day), delta])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({quote("status")}, {quote("flight_number")}, {quote("day")}, {count}) '
+            f'VALUES {values} '
+            f'ON CONFLICT ({quote("status")}, {quote("flight_number")}, {quote("day")}) '
+            f'DO UPDATE SET {count} = {table}.{count} + excluded.{count}',
+            params
+        )
+
+
+def _apply_counter_deltas_one_by_one(deltas):
+    for (status, flight_number, day), delta in deltas.items():
+        counter = StatusCounter.objects.filter(status=status, flight_number=flight_number, day=day)
+        if counter.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                StatusCounter.objects.create(
+                    status=status,
+                    flight_number=flight_number,
+                    day=day,
+                    count=delta
+                )
+        except IntegrityError:
+            # Another writer created the row first
+            counter.update(count=F('count') + delta)
+
+
+def status_counts(flight_number=None, day=None):
+    """
+    Return a {status: count} mapping read from the counter table.
+
+    Without filters this reads the airport-wide rows only.
+    """
+    if flight_number is None and day is None:
+        rows = StatusCounter.objects.filter(flight_number='', day__isnull=True).values_list('status', 'count')
+    else:
+        counters = StatusCounter.objects.filter(day__isnull=False)
+        if flight_number is not None:
+            counters = counters.filter(flight_number=flight_number)
+        if day is not None:
+            counters = counters.filter(day=day)
+        rows = counters.values('status').annotate(total=Sum('count')).values_list('status', 'total')
+
+    counts = {status_code: 0 for status_code, _ in Baggage.STATUS_CHOICES}
+    counts.update(rows)
+    return counts
+
+
+def computed_counters():
+    """Count bags straight from the bag table, keyed like the counter table"""
+    expected = Counter()
+    rows = Baggage.objects.order_by().values(
+        'current_status', 'flight_number', day=TruncDate('created_at')
+    ).annotate(total=Count('id'))
+    for row in rows:
+        expected[(row['current_status'], '', None)] += row['total']
+        expected[(row['current_status'], row['flight_number'] or '', row['day'])] += row['total']
+    return expected
+
+
+def stored_counters():
+    """Read every row of the counter table"""
+    return Counter({
+        (status, flight_number, day): count
+        for status, flight_number, day, count in StatusCounter.objects.values_list(
+            'status', 'flight_number', 'day', 'count'
+        )
+    })
+
+
+def counter_mismatches():
+    """Return {row: (stored, expected)} for every counter that disagrees with the bag table"""
+    expected = computed_counters()
+    stored = stored_counters()
+    mismatches = {}
+    for row in set(expected) | set(stored):
+        if stored[row] != expected[row]:
+            mismatches[row] = (stored[row], expected[row])
+    return mismatches
+
+
+def rebuild_counters():
+    """Recompute the whole counter table from the bag table"""
+    with transaction.atomic():
+        expected = computed_counters()
+        for status_code, _ in Baggage.STATUS_CHOICES:
+            expected.setdefault((status_code, '', None), 0)
+        StatusCounter.objects.all().delete()
+        StatusCounter.objects.bulk_create([
+            StatusCounter(status=status, flight_number=flight_number, day=day, count=count)
+            for (status, flight_number, day), count in expected.items()
+        ])
+    return len(expected)
@@ -0,0 +1,207 @@
+"""
+Server-Sent Events streams of baggage status changes
+
+Each event loop runs one ``EventHub``. The hub owns a single channel on the
+channel layer, joins the bag and flight groups its streams follow, and fans
+the events published by ``broadcast.publish_baggage_update`` out to them, so
+changes made in any worker process reach every stream. An idle stream is an
+async generator waiting on a small queue: it holds no thread and no timer of
+its own, and heartbeats are queued for all streams at once by the hub.
+
+Event ids are ``StatusUpdate`` ids. A client reconnecting with
+``Last-Event-ID`` first receives the updates it missed, read from the
+database in batches, and then the live stream. Replayed and live events may
+overlap; they describe the same status changes, so clients can apply them
+twice. A stream whose client falls more than ``QUEUE_SIZE`` events behind is
+ended, and the client resumes from the last event it received.
+
+The streams need an ASGI server; under WSGI Django would buffer them.
+"""
+import asyncio
+import json
+import weakref
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from .broadcast import baggage_update_message, get_publisher
+
+DEFAULT_EVENT_STREAM_SETTINGS = {
+    'HEARTBEAT': 15,
+    'QUEUE_SIZE': 64,
+    'REPLAY_BATCH': 200,
+    'RETRY': 3000,
+}
+
+HEARTBEAT_FRAME = b': heartbeat\n\n'
+
+
+def event_stream_settings():
+    return {**DEFAULT_EVENT_STREAM_SETTINGS, **getattr(settings, 'EVENT_STREAMS', {})}
+
+
+def format_event(data, event='baggage_update', event_id=None):
+    """Encode one SSE frame; ``data`` is JSON text"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.extend(f'data: {line}' for line in data.splitlines())
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def parse_last_event_id(request):
+    try:
+        return int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        return None
+
+
+class EventHub:
+    """
+    Fans channel layer events for followed groups out to SSE streams
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.channel_layer = get_channel_layer()
+        self._subscribers = {}  # group -> set of queues
+        self._lock = asyncio.Lock()
+        self._channel = None
+        self._tasks = []
+
+    async def subscribe(self, group):
+        """Return a queue receiving the encoded events of ``group``"""
+        queue = asyncio.Queue(self.config['QUEUE_SIZE'])
+        async with self._lock:
+            if self._channel is None:
+                self._channel = await self.channel_layer.new_channel('sse.')
+                self._tasks = [
+                    asyncio.ensure_future(self._receive()),
+                    asyncio.ensure_future(self._heartbeat()),
+                ]
+            queues = self._subscribers.get(group)
+            if queues is None:
+                # Join before the stream reads anything, so nothing is missed
+                await self.channel_layer.group_add(group, self._channel)
+                queues = self._subscribers[group] = set()
+            queues.add(queue)
+        return queue
+
+    async def unsubscribe(self, group, queue):
+        async with self._lock:
+            queues = self._subscribers.get(group)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[group]
+                await self.channel_layer.group_discard(group, self._channel)
+            if not self._subscribers:
+                # The last stream has closed; stop receiving until the next
+                for task in self._tasks:
+                    task.cancel()
+                self._tasks = []
+                self._channel = None
+
+    def _offer(self, queue, frame):
+        """Queue a frame, ending the stream of a client that has fallen behind"""
+        try:
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def _receive(self):
+        while True:
+            message = await self.channel_layer.receive(self._channel)
+            queues = self._subscribers.get(message.get('group'))
+            if not queues or message.get('type') != 'baggage_update':
+                continue
+            frame = format_event(message['text'], event_id=message.get('id'))
+            for queue in list(queues):
+                self._offer(queue, frame)
+
+    async def _heartbeat(self):
+        # Memberships expire on the channel layer unless they are renewed
+        renew_every = getattr(self.channel_layer, 'group_expiry', 86400) / 2
+        since_renewal = 0
+        while True:
+            await asyncio.sleep(self.config['HEARTBEAT'])
+            for queues in list(self._subscribers.values()):
+                for queue in list(queues):
+                    if not queue.full():
+                        queue.put_nowait(HEARTBEAT_FRAME)
+            since_renewal += self.config['HEARTBEAT']
+            if since_renewal >= renew_every:
+                since_renewal = 0
+                for group in list(self._subscribers):
+                    await self.channel_layer.group_add(group, self._channel)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """The hub of the running event loop"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = EventHub(event_stream_settings())
+    return hub
+
+
+async def _replay(updates, last_event_id, batch_size):
+    """Frames for the updates in ``updates`` after ``last_event_id``, in id order"""
+    updates = updates.select_related('baggage', 'updated_by').order_by('id')
+    while True:
+        batch = [update async for update in updates.filter(id__gt=last_event_id)[:batch_size]]
+        for update in batch:
+            text = json.dumps({
+                'type': 'baggage_update',
+                'data': baggage_update_message(update.baggage, update),
+                'coalesced': 1,
+            })
+            yield format_event(text, event_id=update.id)
+        if len(batch) < batch_size:
+            return
+        last_event_id = batch[-1].id
+
+
+async def event_stream(group, updates, last_event_id=None, snapshot=None):
+    """
+    SSE stream of ``group``: missed ``updates`` after ``last_event_id``, or
+    else the ``snapshot`` coroutine's result, then live events and heartbeats
+    """
+    hub = get_hub()
+    queue = await hub.subscribe(group)
+    try:
+        yield f'retry: {hub.config["RETRY"]}\n\n'.encode()
+        if last_event_id is not None:
+            async for frame in _replay(updates, last_event_id, hub.config['REPLAY_BATCH']):
+                yield frame
+        elif snapshot is not None:
+            yield format_event(json.dumps(await snapshot()), event='snapshot')
+
+        while True:
+            frame = await queue.get()
+            if frame is None:
+                return
+            yield frame
+    finally:
+        await hub.unsubscribe(group, queue)
+
+
+def event_stream_response(request, group, updates, snapshot=None):
+    """Streaming response for ``event_stream``, resuming from the request's ``Last-Event-ID``"""
+    # Status broadcasts are sent from the loop serving this stream
+    get_publisher().attach(asyncio.get_running_loop())
+    response = StreamingHttpResponse(
+        event_stream(group, updates, parse_last_event_id(request), snapshot),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,179 @@
+"""
+Streaming export of baggage with full status histories
+
+Bags created in a time range are read with ``aiterator()`` in chunks of
+``CHUNK_SIZE``, each chunk together with the status updates of its bags, and
+written out as they arrive: CSV with one row per status update, or NDJSON
+with one bag and its timeline per line. Output is flushed every
+``BUFFER_SIZE`` characters, so memory use depends on the chunk size and not
+on the size of the export. Archived bags in the range follow the hot ones.
+
+The export is an async generator and needs an ASGI server; under WSGI
+Django would buffer it.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from .models import ArchivedBaggage, Baggage
+
+DEFAULT_EXPORT_SETTINGS = {
+    'CHUNK_SIZE': 2000,
+    'BUFFER_SIZE': 65536,
+}
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+BAGGAGE_COLUMNS = [
+    'id', 'qr_code', 'tag_number', 'passenger_name', 'passenger_email', 'flight_number',
+    'destination', 'current_status', 'created_at', 'updated_at',
+]
+UPDATE_COLUMNS = ['id', 'status', 'timestamp', 'updated_by', 'location', 'notes']
+CSV_HEADER = (
+    BAGGAGE_COLUMNS + ['archived'] + [f'update_{column}' for column in UPDATE_COLUMNS]
+)
+
+# Cells starting with these are run as formulas by spreadsheet applications
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_settings():
+    return {**DEFAULT_EXPORT_SETTINGS, **getattr(settings, 'BAGGAGE_EXPORT', {})}
+
+
+class CSVExportRenderer(JSONRenderer):
+    """
+    Lets ``?format=csv`` through content negotiation; the export itself is
+    streamed, so only error bodies are rendered, as JSON
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONExportRenderer(JSONRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def _value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _cell(value):
+    text = _value(value)
+    return "'" + text if text.startswith(FORMULA_PREFIXES) else text
+
+
+def baggage_record(baggage):
+    return {column: getattr(baggage, column) for column in BAGGAGE_COLUMNS}
+
+
+def live_timeline(baggage):
+    """Status updates of a bag loaded ``with_timeline()`` as export records"""
+    return [
+        {
+            'id': update.id,
+            'status': update.status,
+            'timestamp': update.timestamp,
+            'updated_by': update.updated_by.username if update.updated_by else None,
+            'location': update.location,
+            'notes': update.notes,
+        }
+        for update in baggage.get_status_timeline()
+    ]
+
+
+def archived_timeline(archived):
+    return [
+        {
+            'id': update['id'],
+            'status': update['status'],
+            'timestamp': update['timestamp'],
+            'updated_by': update.get('updated_by_name'),
+            'location': update.get('location'),
+            'notes': update.get('notes'),
+        }
+        for update in archived.get_status_timeline()
+    ]
+
+
+async def export_records(start=None, end=None, using=None):
+    """
+    Yield ``(bag record, archived, timeline)`` for every bag created in the
+    range, read from the ``using`` database
+    """
+    chunk_size = export_settings()['CHUNK_SIZE']
+    bounds = {}
+    if start is not None:
+        bounds['created_at__gte'] = start
+    if end is not None:
+        bounds['created_at__lt'] = end
+
+    bags = Baggage.objects.using(using).filter(**bounds).order_by('created_at', 'id').with_timeline()
+    async for baggage in bags.aiterator(chunk_size=chunk_size):
+        yield baggage_record(baggage), False, live_timeline(baggage)
+
+    archived = ArchivedBaggage.objects.using(using).filter(**bounds).order_by('created_at', 'id')
+    async for baggage in archived.aiterator(chunk_size=chunk_size):
+        yield baggage_record(baggage), True, archived_timeline(baggage)
+
+
+def write_csv(writer, record, archived, timeline):
+    row = [_cell(record[column]) for column in BAGGAGE_COLUMNS] + [str(archived).lower()]
+    if not timeline:
+        writer.writerow(row)
+    for update in timeline:
+        writer.writerow(row + [_cell(update[column]) for column in UPDATE_COLUMNS])
+
+
+def write_ndjson(buffer, record, archived, timeline):
+    line = {**record, 'archived': archived, 'status_timeline': timeline}
+    buffer.write(json.dumps(line, cls=DjangoJSONEncoder, separators=(',', ':')))
+    buffer.write('\n')
+
+
+async def export_stream(export_format, start=None, end=None, using=None):
+    """Encoded export, in pieces of about ``BUFFER_SIZE`` characters"""
+    buffer_size = export_settings()['BUFFER_SIZE']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == 'csv':
+        writer.writerow(CSV_HEADER)
+
+    async for record, archived, timeline in export_records(start, end, using):
+        if export_format == 'csv':
+            write_csv(writer, record, archived, timeline)
+        else:
+            write_ndjson(buffer, record, archived, timeline)
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_response(export_format, start=None, end=None, using=None):
+    """
+    Streaming response for ``export_stream``. Pass the database to read from
+    explicitly: the export runs after the view has returned, outside any
+    routing context the view set up.
+    """
+    content_type = 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(export_stream(export_format, start, end, using), content_type=content_type)
+    span = '-'.join(timezone.localdate(bound).isoformat() for bound in (start, end) if bound is not None) or 'all'
+    response['Content-Disposition'] = f'attachment; filename="baggage-{span}.{export_format}"'
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
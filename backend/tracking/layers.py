@@ -0,0 +1,400 @@
+"""
+Broker-free channel layer for several worker processes on one host
+
+Every process binds a Unix datagram socket in a shared directory and keeps
+its own group membership. ``group_send`` delivers to the local members and
+sends one datagram to every other process, which delivers to its own
+members; ``send`` to a process-specific channel goes straight to the socket
+of the process named in the channel. No process holds global state, so
+workers can come and go without coordination.
+
+Backpressure follows the channel layer spec: a full channel raises
+``ChannelFull`` on ``send`` and is skipped by ``group_send``. When the
+socket buffers towards another process are full the sender waits for them
+to drain, up to ``send_timeout`` seconds, and then treats that process like
+a full channel, so a stalled worker cannot hold up the others for long.
+
+Channels without a process-specific part (no ``!``) are local to the
+process that receives from them. Messages are encoded with msgpack, as in
+channels_redis, and must fit in one datagram (``buffer_size``).
+
+Any process that can write to the socket directory can inject messages, so
+the layer refuses a directory that is not owned by its own user with mode
+0700.
+"""
+import asyncio
+import atexit
+import errno
+import os
+import random
+import socket
+import stat
+import string
+import tempfile
+import threading
+import time
+from collections import deque
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+
+# Datagram kinds
+_CHANNEL = 0
+_GROUP = 1
+
+
+def default_socket_path():
+    return os.path.join(tempfile.gettempdir(), f'baggage-tracker-channels-{os.getuid()}')
+
+
+def ensure_private_directory(path):
+    """Create ``path`` for this user alone, refusing one someone else could write to"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # lstat, so a symlink planted in place of the directory is refused too
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise ImproperlyConfigured(f'Channel layer path {path} is not a directory')
+    if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) != 0o700:
+        raise ImproperlyConfigured(
+            f'Channel layer directory {path} must be owned by uid {os.getuid()} with mode 0700'
+        )
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class _Mailbox:
+    """
+    Messages waiting on one local channel, and the receivers waiting for them
+    """
+
+    def __init__(self):
+        self.messages = deque()  # (expires, message)
+        self.waiters = deque()
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    """
+    Channel layer that fans out between processes over Unix domain sockets
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        path=None,
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        buffer_size=4 * 1024 * 1024,
+        peer_refresh=1.0,
+        send_timeout=1.0,
+        **kwargs
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = path or default_socket_path()
+        self.group_expiry = group_expiry
+        self.buffer_size = buffer_size
+        self.peer_refresh = peer_refresh
+        self.send_timeout = send_timeout
+        self.dropped = 0
+        self._lock = threading.RLock()
+        self._mailboxes = {}
+        self._groups = {}  # group -> {channel: time joined}
+        self._pid = None
+        self._socket = None
+        self._sender = None
+        self._peers = []
+        self._peers_read_at = 0
+
+    # Process setup
+
+    def _ensure_socket(self):
+        """Bind this process's socket and start reading from it (again after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._mailboxes = {}
+            self._groups = {}
+            ensure_private_directory(self.path)
+            self._pid = os.getpid()
+            self.process_token = f'{self._pid}-' + ''.join(random.choices(string.ascii_lowercase, k=8))
+            self._socket_path = self._peer_path(self.process_token)
+
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+            receiver.bind(self._socket_path)
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_size)
+            sender.setblocking(False)
+            self._socket, self._sender = receiver, sender
+            self._peers_read_at = 0
+
+            threading.Thread(
+                target=self._read, args=(receiver,), name='channel-layer', daemon=True
+            ).start()
+            atexit.register(self._unlink, self._socket_path, self._pid)
+
+    @staticmethod
+    def _unlink(path, pid):
+        if os.getpid() == pid:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _peer_path(self, token):
+        return os.path.join(self.path, f'{token}.sock')
+
+    def _peer_paths(self):
+        """Sockets of the other processes, re-read from the directory at most every ``peer_refresh`` seconds"""
+        now = time.monotonic()
+        if now - self._peers_read_at >= self.peer_refresh:
+            with os.scandir(self.path) as entries:
+                self._peers = [
+                    entry.path for entry in entries
+                    if entry.name.endswith('.sock') and entry.path != self._socket_path
+                ]
+            self._peers_read_at = now
+        return self._peers
+
+    def _read(self, receiver):
+        while True:
+            try:
+                data = receiver.recv(self.buffer_size)
+            except OSError:
+                return
+            if not data:
+                # close() wakes the reader with an empty datagram
+                receiver.close()
+                return
+            try:
+                kind, target, expires, message = msgpack.unpackb(data, raw=False)
+            except Exception:
+                continue
+            if kind == _GROUP:
+                self._deliver_to_group(target, message, expires)
+            else:
+                try:
+                    self._deliver(target, message, expires)
+                except ChannelFull:
+                    self.dropped += 1
+
+    async def _send_to_peer(self, path, data):
+        """
+        Send one datagram, waiting up to ``send_timeout`` while the socket
+        buffers are full; returns False if the peer stayed full or is gone
+        """
+        deadline = None
+        delay = 0.0005
+        try:
+            while True:
+                try:
+                    self._sender.sendto(data, path)
+                    return True
+                except BlockingIOError:
+                    now = time.monotonic()
+                    deadline = deadline or now + self.send_timeout
+                    if now >= deadline:
+                        return False
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.02)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # The process behind this socket has exited
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self._peers_read_at = 0
+            return False
+        except OSError as error:
+            if error.errno == errno.EMSGSIZE:
+                raise ValueError(f'Message too large for the channel layer ({len(data)} bytes)')
+            raise
+
+    # Local delivery
+
+    def _deliver(self, channel, message, expires):
+        with self._lock:
+            mailbox = self._mailboxes.setdefault(channel, _Mailbox())
+            if len(mailbox.messages) >= self.get_capacity(channel):
+                raise ChannelFull(channel)
+            mailbox.messages.append((expires, message))
+            self._wake_next(mailbox)
+
+    def _wake_next(self, mailbox):
+        while mailbox.waiters:
+            waiter = mailbox.waiters.popleft()
+            if waiter.done():
+                continue
+            try:
+                # Receivers may be waiting on another thread's event loop
+                waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+                return
+            except RuntimeError:
+                continue  # its loop has been closed
+
+    def _deliver_to_group(self, group, message, expires):
+        with self._lock:
+            channels = list(self._groups.get(group, {}))
+        for channel in channels:
+            try:
+                self._deliver(channel, message, expires)
+            except ChannelFull:
+                self.dropped += 1
+
+    def _clean_expired(self):
+        now = time.time()
+        with self._lock:
+            for channel, mailbox in list(self._mailboxes.items()):
+                expired = False
+                while mailbox.messages and mailbox.messages[0][0] < now:
+                    mailbox.messages.popleft()
+                    expired = True
+                if expired:
+                    self._remove_from_groups(channel)
+                if not mailbox.messages and not mailbox.waiters:
+                    del self._mailboxes[channel]
+
+            joined_before = now - self.group_expiry
+            for group, channels in list(self._groups.items()):
+                for channel, joined in list(channels.items()):
+                    if joined < joined_before:
+                        del channels[channel]
+                if not channels:
+                    del self._groups[group]
+
+    def _remove_from_groups(self, channel):
+        for channels in self._groups.values():
+            channels.pop(channel, None)
+
+    def _owner(self, channel):
+        """Process token of a process-specific channel, or ``None`` for a local one"""
+        if '!' not in channel:
+            return None
+        return self.non_local_name(channel)[:-1].rsplit('.', 1)[-1]
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        """
+        Send a message onto a (general or specific) channel.
+        """
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+        self._ensure_socket()
+
+        expires = time.time() + self.expiry
+        owner = self._owner(channel)
+        if owner is None or owner == self.process_token:
+            self._deliver(channel, msgpack.unpackb(msgpack.packb(message, use_bin_type=True), raw=False), expires)
+            return
+
+        data = msgpack.packb([_CHANNEL, channel, expires, message], use_bin_type=True)
+        if not await self._send_to_peer(self._peer_path(owner), data):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        """
+        Receive the first message that arrives on the channel.
+        """
+        assert self.valid_channel_name(channel)
+        self._ensure_socket()
+        loop = asyncio.get_running_loop()
+
+        while True:
+            self._clean_expired()
+            with self._lock:
+                mailbox = self._mailboxes.setdefault(channel, _Mailbox())
+                if mailbox.messages:
+                    _, message = mailbox.messages.popleft()
+                    if not mailbox.messages and not mailbox.waiters:
+                        del self._mailboxes[channel]
+                    return message
+                waiter = loop.create_future()
+                mailbox.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in mailbox.waiters:
+                        mailbox.waiters.remove(waiter)
+                    elif mailbox.messages:
+                        # Pass on a wake-up this receiver can no longer use
+                        self._wake_next(mailbox)
+                raise
+
+    async def new_channel(self, prefix='specific.'):
+        """
+        Returns a new channel name that routes to this process.
+        """
+        self._ensure_socket()
+        separator = '' if prefix.endswith('.') else '.'
+        suffix = ''.join(random.choices(string.ascii_letters, k=12))
+        return f'{prefix}{separator}{self.process_token}!{suffix}'
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        """
+        Adds the channel name to a group (membership is kept by this process).
+        """
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        self._ensure_socket()
+        with self._lock:
+            self._groups.setdefault(group, {})[channel] = time.time()
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), 'Invalid channel name'
+        assert self.valid_group_name(group), 'Invalid group name'
+        with self._lock:
+            channels = self._groups.get(group)
+            if channels is not None:
+                channels.pop(channel, None)
+                if not channels:
+                    del self._groups[group]
+
+    async def group_send(self, group, message):
+        """
+        Send a message to the group's members in this and every other process.
+        """
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Invalid group name'
+        self._ensure_socket()
+        self._clean_expired()
+
+        expires = time.time() + self.expiry
+        data = msgpack.packb([_GROUP, group, expires, message], use_bin_type=True)
+        self._deliver_to_group(group, msgpack.unpackb(data, raw=False)[3], expires)
+        for path in self._peer_paths():
+            if not await self._send_to_peer(path, data):
+                self.dropped += 1
+
+    # Flush extension
+
+    async def flush(self):
+        with self._lock:
+            self._mailboxes = {}
+            self._groups = {}
+
+    async def close(self):
+        """Stop receiving and remove this process's socket"""
+        with self._lock:
+            if self._socket is None or self._pid != os.getpid():
+                return
+            try:
+                self._sender.sendto(b'', self._socket_path)
+            except OSError:
+                self._socket.close()
+            self._unlink(self._socket_path, self._pid)
+            self._sender.close()
+            self._socket = self._sender = None
+            self._pid = None
@@ -0,0 +1,62 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from tracking.archive import archivable_baggage, archive_baggage, archive_settings
+
+
+class Command(BaseCommand):
+    help = (
+        'Move bags that have been in a terminal status for a while, with their status '
+        'updates, from the hot tables to the archive'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Archive bags in a terminal status for more than this many days (default: BAGGAGE_ARCHIVE["AFTER_DAYS"])'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Bags moved per transaction (default: BAGGAGE_ARCHIVE["BATCH_SIZE"])'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Move at most this many bags per run'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the bags that would be archived'
+        )
+        parser.add_argument(
+            '--every',
+            type=float,
+            help='Keep running and archive again every this many seconds'
+        )
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else archive_settings()['AFTER_DAYS']
+
+        if options['dry_run']:
+            count = archivable_baggage(days).count()
+            self.stdout.write(f'{count} bags in a terminal status for more than {days} days would be archived')
+            return
+
+        while True:
+            self.run_once(days, options['batch_size'], options['limit'])
+            if not options['every']:
+                break
+            close_old_connections()
+            time.sleep(options['every'])
+
+    def run_once(self, days, batch_size, limit):
+        started = time.perf_counter()
+        moved = archive_baggage(after_days=days, batch_size=batch_size, limit=limit)
+        for day, count in sorted(moved.items()):
+            self.stdout.write(f'  {day}: {count} bags')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {sum(moved.values())} bags in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,149 @@
+import asyncio
+import multiprocessing
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from channels.layers import InMemoryChannelLayer
+from tracking.layers import UnixSocketChannelLayer
+
+MESSAGE = {'type': 'baggage_update', 'text': '{"type": "baggage_update", "data": {"status": "LOADED"}}'}
+
+
+async def _receive_all(layer, channels, count, timeout):
+    """Receive ``count`` messages on each channel; returns how many arrived before ``timeout``"""
+    received = 0
+
+    async def drain(channel):
+        nonlocal received
+        for _ in range(count):
+            await layer.receive(channel)
+            received += 1
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*(drain(channel) for channel in channels)), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return received
+
+
+def _fan_out_worker(path, members, count, ready, results):
+    """A worker process with ``members`` sockets in the benchmark group"""
+    async def run():
+        layer = UnixSocketChannelLayer(path=path, capacity=count + 1)
+        channels = [await layer.new_channel() for _ in range(members)]
+        for channel in channels:
+            await layer.group_add('benchmark', channel)
+        ready.release()
+        received = await _receive_all(layer, channels, count, 30)
+        results.put((received, time.perf_counter()))
+        await layer.close()
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = 'Compare the Unix socket channel layer with InMemoryChannelLayer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=20000,
+            help='Messages sent per scenario (default: 20000)'
+        )
+        parser.add_argument(
+            '--members',
+            type=int,
+            default=20,
+            help='Group members per process in the fan-out scenarios (default: 20)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Receiving processes in the cross-process scenario (default: 2)'
+        )
+
+    def handle(self, *args, **options):
+        self.path = tempfile.mkdtemp(prefix='channel-layer-benchmark-')
+        try:
+            asyncio.run(self.run(options['messages'], options['members'], options['workers']))
+        finally:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def layers(self, capacity):
+        return [
+            ('in-memory', InMemoryChannelLayer(capacity=capacity)),
+            ('unix-socket', UnixSocketChannelLayer(path=self.path, capacity=capacity)),
+        ]
+
+    def report(self, scenario, layer_name, delivered, expected, elapsed):
+        rate = delivered / elapsed if elapsed else float('inf')
+        self.stdout.write(
+            f'{scenario:<34}{layer_name:<14}{delivered:>10}/{expected:<10}{elapsed * 1000:>10.1f}{rate:>14,.0f}'
+        )
+
+    async def run(self, messages, members, workers):
+        self.stdout.write(f'{"scenario":<34}{"layer":<14}{"delivered":>21}{"ms":>10}{"deliveries/s":>14}')
+
+        for name, layer in self.layers(messages + 1):
+            channel = await layer.new_channel()
+            started = time.perf_counter()
+            receiving = asyncio.ensure_future(_receive_all(layer, [channel], messages, 30))
+            for _ in range(messages):
+                await layer.send(channel, MESSAGE)
+            delivered = await receiving
+            self.report('send/receive, 1 channel', name, delivered, messages, time.perf_counter() - started)
+            await layer.close()
+
+        group_messages = max(messages // members, 1)
+        for name, layer in self.layers(group_messages + 1):
+            channels = [await layer.new_channel() for _ in range(members)]
+            for channel in channels:
+                await layer.group_add('benchmark', channel)
+            started = time.perf_counter()
+            receiving = asyncio.ensure_future(_receive_all(layer, channels, group_messages, 30))
+            for _ in range(group_messages):
+                await layer.group_send('benchmark', MESSAGE)
+                await asyncio.sleep(0)
+            delivered = await receiving
+            expected = group_messages * members
+            self.report(f'group_send, {members} members', name, delivered, expected, time.perf_counter() - started)
+            await layer.close()
+
+        await self.run_cross_process(group_messages, members, workers)
+
+    async def run_cross_process(self, count, members, workers):
+        """group_send from this process to members in ``workers`` other processes"""
+        context = multiprocessing.get_context('fork')
+        ready = context.Semaphore(0)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_fan_out_worker, args=(self.path, members, count, ready, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.acquire()
+
+        layer = UnixSocketChannelLayer(path=self.path, peer_refresh=0)
+        started = time.perf_counter()
+        for _ in range(count):
+            await layer.group_send('benchmark', MESSAGE)
+
+        outcomes = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join()
+        await layer.close()
+
+        # perf_counter is system-wide, so worker finish times are comparable
+        delivered = sum(received for received, _ in outcomes)
+        elapsed = max(finished for _, finished in outcomes) - started
+        expected = count * members * workers
+        scenario = f'group_send, {workers} procs x {members}'
+        self.stdout.write(f'{scenario:<34}{"in-memory":<14}{"not supported across processes":>45}')
+        self.report(scenario, 'unix-socket', delivered, expected, elapsed)
+        if delivered < expected:
+            self.stdout.write(f'  {expected - delivered} deliveries dropped by backpressure')
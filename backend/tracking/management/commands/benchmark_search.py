@@ -0,0 +1,77 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from tracking.models import Baggage
+from tracking.search import legacy_search, search_baggage
+
+
+class Command(BaseCommand):
+    help = 'Compare indexed baggage search with the legacy icontains filter on the current data'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'terms',
+            nargs='*',
+            help='Search terms to time (default: a sample taken from existing bags)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Runs per term and strategy (default: 5)'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=20,
+            help='Rows fetched per search, like one page of the list view (default: 20)'
+        )
+    
+    def handle(self, *args, **options):
+        total = Baggage.objects.count()
+        if not total:
+            raise CommandError('No baggage to search. Seed some data first.')
+        
+        terms = options['terms'] or self.sample_terms()
+        self.stdout.write(f'Searching {total} bags, {options["repeat"]} runs per term\n')
+        self.stdout.write(f'{"term":<24}{"matches":>10}{"icontains ms":>16}{"indexed ms":>14}{"speedup":>10}')
+        
+        for term in terms:
+            legacy_times, matches = self.time_search(
+                lambda: legacy_search(Baggage.objects.all(), term).order_by('-created_at'),
+                options['repeat'], options['page_size']
+            )
+            indexed_times, _ = self.time_search(
+                lambda: search_baggage(Baggage.objects.all(), term),
+                options['repeat'], options['page_size']
+            )
+            legacy_ms = statistics.median(legacy_times) * 1000
+            indexed_ms = statistics.median(indexed_times) * 1000
+            speedup = legacy_ms / indexed_ms if indexed_ms else float('inf')
+            self.stdout.write(f'{term:<24}{matches:>10}{legacy_ms:>16.2f}{indexed_ms:>14.2f}{speedup:>9.1f}x')
+    
+    def time_search(self, build_queryset, repeat, page_size):
+        """Time a count plus the first page, the work the list view does per search"""
+        timings = []
+        matches = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = build_queryset()
+            matches = queryset.count()
+            list(queryset[:page_size])
+            timings.append(time.perf_counter() - started)
+        return timings, matches
+    
+    def sample_terms(self):
+        bag = Baggage.objects.order_by('?').only(
+            'passenger_name', 'qr_code', 'flight_number', 'passenger_email'
+        ).first()
+        terms = [bag.qr_code, bag.passenger_name.split()[0]]
+        if bag.flight_number:
+            terms.append(bag.flight_number)
+        if bag.passenger_email:
+            local_part, domain = bag.passenger_email.split('@', 1)
+            # The domain is a common term that matches most bags
+            terms += [local_part, domain]
+        terms.append('zzzz-no-match')
+        return terms
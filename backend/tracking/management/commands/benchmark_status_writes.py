@@ -0,0 +1,123 @@
+import statistics
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from tracking.models import Baggage, StatusUpdate
+from tracking.writer import GroupCommitWriter
+
+STATUSES = [code for code, _ in Baggage.STATUS_CHOICES]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-request status writes with group commit under concurrent clients. '
+        'Adds real status updates to existing bags, so run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=32,
+            help='Concurrent clients (default: 32)'
+        )
+        parser.add_argument(
+            '--updates',
+            type=int,
+            default=50,
+            help='Status updates per client and scenario (default: 50)'
+        )
+        parser.add_argument(
+            '--max-batch',
+            type=int,
+            default=200,
+            help='Largest group the writer commits at once (default: 200)'
+        )
+        parser.add_argument(
+            '--max-delay',
+            type=float,
+            default=0.005,
+            help='Seconds the writer waits for a group to fill (default: 0.005)'
+        )
+
+    def handle(self, *args, **options):
+        baggage_ids = list(Baggage.objects.values_list('id', flat=True)[:1000])
+        if not baggage_ids:
+            raise CommandError('No baggage to update. Seed some data first.')
+
+        clients, updates = options['clients'], options['updates']
+        self.stdout.write(f'{clients} clients x {updates} status updates over {len(baggage_ids)} bags, {connection.vendor}\n')
+        self.stdout.write(f'{"scenario":<16}{"updates/s":>12}{"failed":>8}{"p50 ms":>10}{"p99 ms":>10}{"groups":>8}')
+
+        self.report('per request', *self.run(baggage_ids, clients, updates, self.write_directly))
+
+        writer = GroupCommitWriter(max_batch=options['max_batch'], max_delay=options['max_delay'])
+        elapsed, latencies, failed = self.run(
+            baggage_ids, clients, updates,
+            lambda baggage_id, new_status: self.write_through(writer, baggage_id, new_status)
+        )
+        stats = writer.stats()
+        self.report('group commit', elapsed, latencies, failed, stats['groups'])
+        if stats['groups']:
+            self.stdout.write(
+                f'  average group {stats["committed"] / stats["groups"]:.1f}, largest {stats["largest_group"]}'
+            )
+
+    def write_directly(self, baggage_id, new_status):
+        """What update_baggage_status does without group commit"""
+        baggage = Baggage.objects.get(id=baggage_id)
+        StatusUpdate.objects.create(baggage=baggage, status=new_status, location='benchmark')
+
+    def write_through(self, writer, baggage_id, new_status):
+        """What update_baggage_status does with group commit"""
+        baggage = Baggage.objects.get(id=baggage_id)
+        scan = {'baggage_id': baggage.id, 'status': new_status, 'location': 'benchmark'}
+        result = writer.submit(scan).result(timeout=60)
+        if result['result'] != 'updated':
+            raise RuntimeError(result)
+
+    def run(self, baggage_ids, clients, updates, write):
+        """Run ``updates`` writes on each of ``clients`` threads; returns (elapsed, latencies, failed)"""
+        latencies = []
+        failed = 0
+        lock = threading.Lock()
+        start = threading.Barrier(clients + 1)
+
+        def client(number):
+            nonlocal failed
+            own_latencies, own_failed = [], 0
+            start.wait()
+            for index in range(updates):
+                baggage_id = baggage_ids[(number * updates + index) % len(baggage_ids)]
+                started = time.perf_counter()
+                try:
+                    write(baggage_id, STATUSES[(number + index) % len(STATUSES)])
+                except (OperationalError, RuntimeError):
+                    # "database is locked" once the busy timeout runs out
+                    own_failed += 1
+                    continue
+                own_latencies.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(own_latencies)
+                failed += own_failed
+
+        threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, latencies, failed
+
+    def report(self, scenario, elapsed, latencies, failed, groups='-'):
+        rate = len(latencies) / elapsed if elapsed else float('inf')
+        if latencies:
+            ordered = sorted(latencies)
+            p50 = statistics.median(ordered) * 1000
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+        else:
+            p50 = p99 = 0
+        self.stdout.write(f'{scenario:<16}{rate:>12,.0f}{failed:>8}{p50:>10.1f}{p99:>10.1f}{groups:>8}')
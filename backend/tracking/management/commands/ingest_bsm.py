@@ -0,0 +1,41 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from tracking.bsm import DEFAULT_CHUNK_SIZE, ingest_bsm
+
+
+class Command(BaseCommand):
+    help = 'Create baggage from a file of IATA Baggage Source Messages (BSM)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="BSM file to ingest, or '-' to read from standard input"
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Bags inserted per bulk insert (default: {DEFAULT_CHUNK_SIZE})'
+        )
+    
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        
+        if options['path'] == '-':
+            stats = ingest_bsm(sys.stdin, chunk_size=options['chunk_size'])
+        else:
+            try:
+                with open(options['path'], encoding='ascii', errors='replace') as bsm_file:
+                    stats = ingest_bsm(bsm_file, chunk_size=options['chunk_size'])
+            except OSError as exc:
+                raise CommandError(f'Cannot read {options["path"]}: {exc}')
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Read {stats["messages"]} messages in {elapsed:.1f}s: '
+                f'{stats["created"]} bags created, {stats["duplicates"]} duplicate tags, '
+                f'{stats["skipped"]} messages skipped'
+            )
+        )
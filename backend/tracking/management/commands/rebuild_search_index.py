@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from tracking.search import rebuild_search_index, search_index_problems
+
+
+class Command(BaseCommand):
+    help = 'Reinstall the baggage search index triggers, re-index every bag and verify the index'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to rebuild (default: "default")'
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Only check the index against the baggage table, without rebuilding'
+        )
+    
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not options['verify_only']:
+            self.stdout.write(f'Rebuilding baggage search index on {connection.vendor}...')
+            rebuild_search_index(connection)
+            self.stdout.write('Search index rebuilt')
+        
+        self.stdout.write('Verifying baggage search index...')
+        problems = search_index_problems(connection)
+        for problem in problems:
+            self.stdout.write(f'  {problem}')
+        
+        if problems:
+            raise CommandError('The search index is out of sync; run rebuild_search_index to repair it')
+        
+        self.stdout.write(self.style.SUCCESS('Search index matches the baggage table'))
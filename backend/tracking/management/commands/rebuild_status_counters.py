@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from tracking.counters import counter_mismatches, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard status counters from the baggage table and verify them'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Only compare the counters with the baggage table, without rebuilding'
+        )
+    
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            self.stdout.write('Rebuilding status counters...')
+            row_count = rebuild_counters()
+            self.stdout.write(f'Wrote {row_count} counter rows')
+        
+        self.stdout.write('Verifying status counters...')
+        mismatches = counter_mismatches()
+        for (status, flight_number, day), (stored, expected) in sorted(
+            mismatches.items(), key=lambda item: tuple(str(part) for part in item[0])
+        ):
+            self.stdout.write(
+                f'  {status} / {flight_number or "all flights"} / {day or "all days"}: '
+                f'stored {stored}, expected {expected}'
+            )
+        
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} status counters do not match the baggage table')
+        
+        self.stdout.write(self.style.SUCCESS('Status counters match the baggage table'))
@@ -0,0 +1,64 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from tracking.models import ThroughputRollup
+from tracking.rollups import advance_rollups, rebuild_rollups, watermark
+
+
+class Command(BaseCommand):
+    help = (
+        'Backfill the hourly throughput rollups from the status update table. A full rebuild '
+        'drops the counts of archived status updates; use --since to recount a recent window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Only recount hours from this day (YYYY-MM-DD) on'
+        )
+        parser.add_argument(
+            '--catch-up',
+            action='store_true',
+            help='Only fold in status updates recorded since the watermark'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='With --catch-up, keep running and catch up every this many seconds'
+        )
+
+    def handle(self, *args, **options):
+        if options['interval'] is not None and (not options['catch_up'] or options['interval'] <= 0):
+            raise CommandError('--interval needs --catch-up and a positive number of seconds.')
+
+        if options['catch_up']:
+            while True:
+                folded = advance_rollups()
+                self.stdout.write(self.style.SUCCESS(
+                    f'Folded {folded} status updates into the rollups, watermark at {watermark()}'
+                ))
+                if options['interval'] is None:
+                    return
+                close_old_connections()
+                time.sleep(options['interval'])
+
+        since = None
+        if options['since']:
+            try:
+                day = parse_date(options['since'])
+            except ValueError:
+                # Well formed but impossible, like 2024-02-30
+                day = None
+            if day is None:
+                raise CommandError('Invalid --since. Use YYYY-MM-DD.')
+            since = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+        self.stdout.write('Rebuilding throughput rollups...')
+        row_count = rebuild_rollups(since)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {row_count} rollup rows ({ThroughputRollup.objects.count()} in total), '
+            f'watermark at {watermark()}'
+        ))
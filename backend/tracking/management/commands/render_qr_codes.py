@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand
+from tracking.qr import QRRenderQueue, qr_render_settings
+
+
+class Command(BaseCommand):
+    help = 'Render QR code images for every bag that is still missing one'
+    
+    def add_arguments(self, parser):
+        config = qr_render_settings()
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=config['WORKERS'],
+            help=f'Number of render workers (default: {config["WORKERS"]})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=config['BATCH_SIZE'],
+            help=f'Bags rendered per batch (default: {config["BATCH_SIZE"]})'
+        )
+        parser.add_argument(
+            '--processes',
+            action='store_true',
+            help='Render in a process pool instead of threads'
+        )
+    
+    def handle(self, *args, **options):
+        render_queue = QRRenderQueue(
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            use_processes=options['processes'],
+        )
+        
+        started = time.monotonic()
+        queued = render_queue.backfill()
+        self.stdout.write(f'Queued {queued} bags without a QR image...')
+        
+        while not render_queue.drain(timeout=5):
+            stats = render_queue.stats()
+            self.stdout.write(f'Rendered {stats["rendered"]}, {stats["queue_depth"]} waiting...')
+        
+        stats = render_queue.stats()
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rendered {stats["rendered"]} QR images in {elapsed:.1f}s ({stats["failed"]} failed)'
+            )
+        )
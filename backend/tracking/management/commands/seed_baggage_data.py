@@ -1,9 +1,73 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from tracking.archive import delete_rows
+from tracking.cache import status_lookup_cache
+from tracking.counters import rebuild_counters
 from tracking.models import Baggage, StatusUpdate, UserProfile
+from tracking.qr import QRRenderQueue, get_render_queue, qr_render_settings
 from django.utils import timezone
+import itertools
 import random
-from datetime import timedelta
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+STATUS_NOTES = {
+    'CHECKED_IN': 'Initial check-in',
+    'SECURITY_CLEARED': 'Passed security screening',
+    'LOADED': 'Loaded onto aircraft',
+    'IN_FLIGHT': 'Aircraft departed',
+    'ARRIVED': 'Arrived at destination'
+}
+
+STATUS_LOCATIONS = {
+    'CHECKED_IN': 'Check-in Counter',
+    'SECURITY_CLEARED': 'Security Checkpoint',
+    'LOADED': 'Aircraft Loading Bay',
+    'IN_FLIGHT': 'In Transit',
+    'ARRIVED': '{destination} Airport'
+}
+
+# Daily departures used by --bulk: flight number, destination, local
+# departure time, block time in hours and relative load
+BULK_FLIGHTS = [
+    ('KL566', 'Amsterdam', '23:15', 8.5, 1.4),
+    ('QR434', 'Doha', '02:40', 5.5, 1.6),
+    ('ET302', 'Addis Ababa', '07:05', 2.0, 1.2),
+    ('KE924', 'Seoul', '14:30', 14.0, 0.8),
+    ('SN401', 'Brussels', '22:50', 8.5, 1.0),
+    ('TK742', 'Istanbul', '03:25', 7.0, 1.3),
+    ('EK729', 'Dubai', '15:35', 5.0, 1.8),
+    ('RW501', 'Kigali', '06:10', 1.0, 0.5),
+    ('SA234', 'Johannesburg', '12:20', 4.0, 0.9),
+    ('MS843', 'Cairo', '04:15', 4.0, 0.7),
+    ('AF814', 'Paris', '22:05', 8.5, 1.1),
+    ('LH567', 'Frankfurt', '21:40', 8.5, 1.0),
+    ('BA728', 'London', '09:30', 9.0, 1.2),
+    ('VS201', 'London', '18:45', 9.0, 0.9),
+    ('DL439', 'Atlanta', '10:55', 17.0, 0.8),
+]
+
+# Weekend departures carry more bags
+WEEKDAY_LOAD = [0.9, 0.85, 0.9, 1.0, 1.2, 1.1, 1.25]
+
+# Bags are checked in between these many minutes before departure
+CHECK_IN_OPENS = 240
+CHECK_IN_CLOSES = 40
+
+FIRST_NAMES = [
+    'Alice', 'Bob', 'Carol', 'David', 'Emma', 'Frank', 'Grace', 'Henry', 'Ivy', 'Jack',
+    'Kate', 'Liam', 'Maya', 'Noah', 'Olivia', 'Paul', 'Quinn', 'Ruby', 'Sam', 'Tina',
+    'Amani', 'Brian', 'Esther', 'Isaac', 'Joan', 'Moses', 'Nakato', 'Okello', 'Sarah', 'Tendo',
+]
+
+LAST_NAMES = [
+    'Johnson', 'Smith', 'Williams', 'Brown', 'Davis', 'Miller', 'Wilson', 'Moore', 'Taylor',
+    'Anderson', 'Thomas', 'Jackson', 'White', 'Harris', 'Martin', 'Thompson', 'Garcia',
+    'Mugisha', 'Namukasa', 'Ochieng', 'Kato', 'Nansubuga', 'Ssempala', 'Atim', 'Byaruhanga',
+]
 
 
 class Command(BaseCommand):
@@ -21,12 +85,45 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing data before seeding'
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Insert bags and status updates in bulk, a chunk per transaction, for load-test datasets'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed of --bulk; the same seed builds the same bags (default: 0)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Days of departures --bulk spreads the bags over (default: 30)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=20000,
+            help='Bags inserted per transaction with --bulk; larger chunks load faster (default: 20000)'
+        )
+        parser.add_argument(
+            '--qr-workers',
+            type=int,
+            default=0,
+            help='Render the QR images of --bulk bags in this many processes; '
+                 'by default they are left for render_qr_codes or on-demand rendering'
+        )
     
     def handle(self, *args, **options):
         if options['clear']:
             self.stdout.write('Clearing existing data...')
-            StatusUpdate.objects.all().delete()
-            Baggage.objects.all().delete()
+            if options['bulk']:
+                self.clear_in_bulk()
+            else:
+                StatusUpdate.objects.all().delete()
+                Baggage.objects.all().delete()
             User.objects.filter(is_superuser=False).delete()
             self.stdout.write(self.style.SUCCESS('Data cleared successfully'))
         
@@ -34,10 +131,18 @@ class Command(BaseCommand):
         self.stdout.write('Creating sample users...')
         self.create_sample_users()
         
+        if options['bulk']:
+            self.seed_in_bulk(options)
+            return
+        
         # Create sample baggage
         self.stdout.write(f'Creating {options["baggage_count"]} sample baggage entries...')
         self.create_sample_baggage(options['baggage_count'])
         
+        # QR images are rendered in the background; wait for them before exiting
+        self.stdout.write('Rendering QR code images...')
+        get_render_queue().drain()
+        
         self.stdout.write(
             self.style.SUCCESS(
                 f'Successfully seeded database with {options["baggage_count"]} baggage entries'
@@ -195,7 +300,6 @@ class Command(BaseCommand):
             
             # Create status updates
             current_time = creation_time
-            current_status = 'CHECKED_IN'
             
             # Always create initial check-in
             StatusUpdate.objects.create(
@@ -216,37 +320,252 @@ class Command(BaseCommand):
                     current_time += timedelta(
                         minutes=random.randint(15, 120)
                     )
+                    if current_time > timezone.now():
+                        # Recently checked-in bags haven't got this far yet
+                        break
                     
-                    status_notes = {
-                        'SECURITY_CLEARED': 'Passed security screening',
-                        'LOADED': 'Loaded onto aircraft',
-                        'IN_FLIGHT': 'Aircraft departed',
-                        'ARRIVED': 'Arrived at destination'
-                    }
-                    
-                    status_locations = {
-                        'SECURITY_CLEARED': 'Security Checkpoint',
-                        'LOADED': 'Aircraft Loading Bay',
-                        'IN_FLIGHT': 'In Transit',
-                        'ARRIVED': f'{destination} Airport'
-                    }
-                    
+                    # Saving the update moves the bag to its status
                     StatusUpdate.objects.create(
                         baggage=baggage,
                         status=status,
                         timestamp=current_time,
                         updated_by=random.choice(staff_users) if staff_users else None,
-                        notes=status_notes[status],
-                        location=status_locations[status]
+                        notes=STATUS_NOTES[status],
+                        location=STATUS_LOCATIONS[status].format(destination=destination)
                     )
-                    current_status = status
                 else:
                     # Stop progressing for this baggage
                     break
             
-            # Update baggage current status
-            baggage.current_status = current_status
-            baggage.save()
-            
             if (i + 1) % 5 == 0:
-                self.stdout.write(f'Created {i + 1} baggage entries...')
\ No newline at end of file
+                self.stdout.write(f'Created {i + 1} baggage entries...')
+    
+    def clear_in_bulk(self):
+        """
+        Delete every bag and status update with one statement each. Signals
+        don't run, so the status counters are rebuilt afterwards.
+        """
+        with transaction.atomic():
+            delete_rows(StatusUpdate.objects.all())
+            delete_rows(Baggage.objects.all())
+            rebuild_counters()
+        status_lookup_cache.cache.clear()
+    
+    def seed_in_bulk(self, options):
+        """
+        Create a load-test dataset: bags booked on a daily flight schedule,
+        each with the status updates it has reached by now
+        """
+        count, chunk_size = options['baggage_count'], options['chunk_size']
+        if count < 1 or chunk_size < 1 or options['days'] < 1:
+            raise CommandError('--baggage-count, --chunk-size and --days must be positive.')
+        
+        rng = random.Random(options['seed'])
+        # Times are laid out back from the start of the hour, so a seed builds the same bags all hour
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        departures = self.bulk_departures(rng, now, options['days'])
+        cum_weights = list(itertools.accumulate(weight for _, weight in departures))
+        departures = [departure for departure, _ in departures]
+        staff_ids = list(
+            User.objects.filter(profile__role='STAFF').order_by('id').values_list('id', flat=True)
+        ) or [None]
+        
+        self.stdout.write(
+            f'Creating {count} bags on {len(departures)} departures, {chunk_size} per transaction...'
+        )
+        started = time.monotonic()
+        prefixes = set()
+        created = update_count = 0
+        with self.fast_sqlite_writes():
+            while created < count:
+                size = min(chunk_size, count - created)
+                bags, timelines = [], []
+                for departure in rng.choices(departures, cum_weights=cum_weights, k=size):
+                    bag, steps = self.bulk_bag(rng, departure, now, prefixes)
+                    bags.append(bag)
+                    timelines.append(steps)
+                # Inserting in id order touches fewer pages of the id-keyed indexes
+                bags, timelines = zip(*sorted(zip(bags, timelines), key=lambda pair: pair[0].id))
+                update_count += self.insert_bulk_chunk(rng, list(bags), timelines, staff_ids)
+                created += size
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Created {created} bags and {update_count} status updates ({created / elapsed:.0f} bags/s)'
+                )
+        
+        if options['qr_workers']:
+            self.render_in_bulk(options['qr_workers'])
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Seeded {created} bags and {update_count} status updates in {time.monotonic() - started:.1f}s. '
+                f'Run rebuild_throughput_rollups to count them into the throughput charts.'
+            )
+        )
+    
+    @contextmanager
+    def fast_sqlite_writes(self):
+        """
+        On SQLite, commit without fsync and keep more of the indexes in
+        memory while seeding. An OS crash or power loss meanwhile can corrupt
+        the database file, which is acceptable for a load-test dataset.
+        SQLite refuses the change inside a transaction, so it is skipped there.
+        """
+        connection = connections[router.db_for_write(Baggage)]
+        if connection.vendor != 'sqlite' or connection.in_atomic_block:
+            yield
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+            cursor.execute('PRAGMA cache_size')
+            cache_size = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous = OFF')
+            cursor.execute('PRAGMA cache_size = -262144')
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+                cursor.execute(f'PRAGMA cache_size = {int(cache_size)}')
+    
+    def bulk_departures(self, rng, now, days):
+        """
+        ``((flight_number, destination, departed, block_hours), weight)`` for
+        every departure of the last ``days`` days, and the coming ones that
+        bags have already checked in for. Weights follow the flight's load,
+        the day of the week and some day-to-day noise.
+        """
+        departures = []
+        today = timezone.localdate(now)
+        for offset in range(days, -1, -1):
+            day = today - timedelta(days=offset)
+            for flight_number, destination, departs, block_hours, load in BULK_FLIGHTS:
+                scheduled = timezone.make_aware(
+                    datetime.combine(day, datetime.strptime(departs, '%H:%M').time())
+                )
+                # Most flights leave within minutes, a few are hours late
+                departed = scheduled + timedelta(minutes=rng.expovariate(1 / 12))
+                opens = departed - timedelta(minutes=CHECK_IN_OPENS)
+                if opens >= now:
+                    continue
+                # Only part of a coming flight's bags are checked in yet
+                checked_in = min(1, (now - opens) / timedelta(minutes=CHECK_IN_OPENS - CHECK_IN_CLOSES))
+                weight = load * WEEKDAY_LOAD[day.weekday()] * rng.uniform(0.8, 1.2) * checked_in
+                departures.append(((flight_number, destination, departed, block_hours), weight))
+        return departures
+    
+    def bulk_bag(self, rng, departure, now, prefixes):
+        """An unsaved bag booked on ``departure`` and the (status, time) steps it has reached by ``now``"""
+        flight_number, destination, departed, block_hours = departure
+        
+        # The QR code is the first 8 hex digits of the id; keep them unique
+        # so create_in_bulk never has to replace an id with a random one
+        while True:
+            bag_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            prefix = bag_id.int >> 96
+            if prefix not in prefixes:
+                prefixes.add(prefix)
+                break
+        
+        # Check-in peaks about 100 minutes before departure
+        latest = max(CHECK_IN_CLOSES, (departed - now) / timedelta(minutes=1))
+        lead = rng.triangular(latest, CHECK_IN_OPENS, max(latest, 100))
+        checked_in = departed - timedelta(minutes=lead)
+        cleared = checked_in + timedelta(minutes=rng.lognormvariate(3.0, 0.5))
+        loaded = max(cleared + timedelta(minutes=5), departed - timedelta(minutes=rng.uniform(10, 45)))
+        steps = [('CHECKED_IN', checked_in), ('SECURITY_CLEARED', cleared)]
+        # Bags cleared too late for their flight stay behind
+        if loaded < departed:
+            arrived = departed + timedelta(hours=block_hours, minutes=rng.uniform(15, 45))
+            steps += [('LOADED', loaded), ('IN_FLIGHT', departed), ('ARRIVED', arrived)]
+        steps = [(status, timestamp) for status, timestamp in steps if timestamp <= now]
+        
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        bag = Baggage(
+            id=bag_id,
+            passenger_name=f'{first_name} {last_name}',
+            passenger_email=f'{first_name}.{last_name}@email.com'.lower(),
+            flight_number=flight_number,
+            destination=destination,
+            current_status=steps[-1][0],
+            created_at=checked_in
+        )
+        return bag, steps
+    
+    def insert_bulk_chunk(self, rng, bags, timelines, staff_ids):
+        """Insert one chunk of bags with their status updates; returns the number of updates"""
+        with transaction.atomic():
+            Baggage.objects.create_in_bulk(bags, batch_size=len(bags), render_qr=False)
+            # Built after the insert: create_in_bulk replaces the id of a bag whose QR code is taken
+            updates = [
+                {
+                    'baggage': bag.id,
+                    'status': status,
+                    'timestamp': timestamp,
+                    'updated_by': rng.choice(staff_ids),
+                    'notes': STATUS_NOTES[status],
+                    'location': STATUS_LOCATIONS[status].format(destination=bag.destination),
+                }
+                for bag, steps in zip(bags, timelines)
+                for status, timestamp in steps
+            ]
+            self.insert_status_updates(updates)
+            # bulk_create stamps updated_at with the current time; use the time of the last update
+            self.set_updated_at([(bag.id, steps[-1][1]) for bag, steps in zip(bags, timelines)])
+        return len(updates)
+    
+    def insert_status_updates(self, updates):
+        """
+        Insert status updates given as {field name: value} with a single
+        executemany. bulk_create compiles every value through the ORM, which
+        costs more than the insert itself at millions of rows; the save()
+        side effects it skips are done by insert_bulk_chunk.
+        """
+        connection = connections[router.db_for_write(StatusUpdate)]
+        fields = [field for field in StatusUpdate._meta.concrete_fields if not field.primary_key]
+        quote = connection.ops.quote_name
+        sql = (
+            f'INSERT INTO {quote(StatusUpdate._meta.db_table)} '
+            f'({", ".join(quote(field.column) for field in fields)}) '
+            f'VALUES ({", ".join(["%s"] * len(fields))})'
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(update[field.name], connection) for field in fields]
+                for update in updates
+            ])
+    
+    def set_updated_at(self, changes):
+        """Set ``updated_at`` of bags from (id, time) pairs without touching anything else"""
+        connection = connections[router.db_for_write(Baggage)]
+        id_field, updated_at_field = Baggage._meta.pk, Baggage._meta.get_field('updated_at')
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {quote(Baggage._meta.db_table)} SET {quote(updated_at_field.column)} = %s '
+                f'WHERE {quote(id_field.column)} = %s',
+                [
+                    [updated_at_field.get_db_prep_value(updated_at, connection),
+                     id_field.get_db_prep_value(baggage_id, connection)]
+                    for baggage_id, updated_at in changes
+                ]
+            )
+    
+    def render_in_bulk(self, workers):
+        """Render the QR images of every bag missing one in a process pool"""
+        render_queue = QRRenderQueue(
+            workers=workers,
+            batch_size=qr_render_settings()['BATCH_SIZE'] * workers,
+            use_processes=True,
+        )
+        started = time.monotonic()
+        queued = render_queue.backfill()
+        self.stdout.write(f'Rendering {queued} QR code images in {workers} processes...')
+        while not render_queue.drain(timeout=5):
+            stats = render_queue.stats()
+            self.stdout.write(f'Rendered {stats["rendered"]}, {stats["queue_depth"]} waiting...')
+        stats = render_queue.stats()
+        self.stdout.write(
+            f'Rendered {stats["rendered"]} QR images in {time.monotonic() - started:.1f}s ({stats["failed"]} failed)'
+        )
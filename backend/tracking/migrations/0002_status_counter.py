@@ -0,0 +1,60 @@
+# Generated by Django 5.0 on 2026-10-17 18:35
+
+from django.db import migrations, models
+from django.db.models import Count, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def populate_status_counters(apps, schema_editor):
+    Baggage = apps.get_model('tracking', 'Baggage')
+    StatusCounter = apps.get_model('tracking', 'StatusCounter')
+    
+    statuses = [choice[0] for choice in Baggage._meta.get_field('current_status').choices]
+    totals = {status: 0 for status in statuses}
+    counters = []
+    # NULL and blank flight numbers share the '' counter row
+    rows = Baggage.objects.order_by().values(
+        'current_status', flight=Coalesce('flight_number', Value('')), day=TruncDate('created_at')
+    ).annotate(total=Count('id'))
+    for row in rows:
+        totals[row['current_status']] = totals.get(row['current_status'], 0) + row['total']
+        counters.append(StatusCounter(
+            status=row['current_status'],
+            flight_number=row['flight'],
+            day=row['day'],
+            count=row['total']
+        ))
+    counters.extend(
+        StatusCounter(status=status, flight_number='', day=None, count=count)
+        for status, count in totals.items()
+    )
+    StatusCounter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('CHECKED_IN', 'Checked In'), ('SECURITY_CLEARED', 'Security Cleared'), ('LOADED', 'Loaded'), ('IN_FLIGHT', 'In-Flight'), ('ARRIVED', 'Arrived')], max_length=20)),
+                ('flight_number', models.CharField(blank=True, default='', max_length=20)),
+                ('day', models.DateField(blank=True, null=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Status Counter',
+                'verbose_name_plural': 'Status Counters',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statuscounter',
+            constraint=models.UniqueConstraint(fields=('status', 'flight_number', 'day'), name='unique_status_counter'),
+        ),
+        migrations.RunPython(populate_status_counters, migrations.RunPython.noop),
+    ]
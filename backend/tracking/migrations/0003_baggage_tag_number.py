@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-17 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0002_status_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baggage',
+            name='tag_number',
+            field=models.CharField(blank=True, max_length=10, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-17 18:52
+
+from django.db import migrations
+from tracking.search import rebuild_search_index, uninstall_search_index
+
+
+def install_index(apps, schema_editor):
+    rebuild_search_index(schema_editor.connection)
+
+
+def remove_index(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0003_baggage_tag_number'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, remove_index),
+    ]
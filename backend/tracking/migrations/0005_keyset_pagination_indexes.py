@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-17 18:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0004_baggage_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='baggage',
+            index=models.Index(fields=['created_at', 'id'], name='baggage_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statusupdate',
+            index=models.Index(fields=['baggage', 'timestamp', 'id'], name='update_bag_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0 on 2026-10-17 18:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0005_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='baggage',
+            index=models.Index(fields=['current_status', 'created_at'], name='baggage_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='baggage',
+            index=models.Index(fields=['flight_number'], name='baggage_flight_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statuscounter',
+            index=models.Index(fields=['flight_number', 'day'], name='counter_flight_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statuscounter',
+            index=models.Index(fields=['day'], name='counter_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statusupdate',
+            index=models.Index(fields=['timestamp'], name='update_time_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-17 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_query_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='baggage',
+            index=models.Index(fields=['updated_at', 'id'], name='baggage_updated_id_idx'),
+        ),
+    ]
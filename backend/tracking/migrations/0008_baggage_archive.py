@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-17 19:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0007_delta_sync_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBaggage',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('passenger_name', models.CharField(max_length=200)),
+                ('passenger_email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('flight_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('destination', models.CharField(blank=True, max_length=100, null=True)),
+                ('qr_code', models.CharField(db_index=True, max_length=100)),
+                ('tag_number', models.CharField(blank=True, db_index=True, max_length=10, null=True)),
+                ('current_status', models.CharField(choices=[('CHECKED_IN', 'Checked In'), ('SECURITY_CLEARED', 'Security Cleared'), ('LOADED', 'Loaded'), ('IN_FLIGHT', 'In-Flight'), ('ARRIVED', 'Arrived')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archive_day', models.DateField(db_index=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('timeline', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Archived Baggage',
+                'verbose_name_plural': 'Archived Baggage',
+                'ordering': ['-archived_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0 on 2026-10-17 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0008_baggage_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ThroughputRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('location', models.CharField(blank=True, default='', max_length=100)),
+                ('status', models.CharField(choices=[('CHECKED_IN', 'Checked In'), ('SECURITY_CLEARED', 'Security Cleared'), ('LOADED', 'Loaded'), ('IN_FLIGHT', 'In-Flight'), ('ARRIVED', 'Arrived')], max_length=20)),
+                ('flight_number', models.CharField(blank=True, default='', max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Throughput Rollup',
+                'verbose_name_plural': 'Throughput Rollups',
+                'indexes': [models.Index(fields=['location', 'hour'], name='rollup_location_hour_idx'), models.Index(fields=['flight_number', 'hour'], name='rollup_flight_hour_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='throughputrollup',
+            constraint=models.UniqueConstraint(fields=('hour', 'location', 'status', 'flight_number'), name='unique_throughput_rollup'),
+        ),
+    ]
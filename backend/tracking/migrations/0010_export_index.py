@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-17 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0009_throughput_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedbaggage',
+            index=models.Index(fields=['created_at', 'id'], name='archived_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-17 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0010_export_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedbaggage',
+            index=models.Index(fields=['archived_at', 'id'], name='archived_at_id_idx'),
+        ),
+    ]
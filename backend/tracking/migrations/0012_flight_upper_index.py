@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-17 20:52
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0011_archive_sync_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='baggage',
+            index=models.Index(django.db.models.functions.text.Upper('flight_number'), name='baggage_flight_upper_idx'),
+        ),
+    ]
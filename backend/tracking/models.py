@@ -1,11 +1,92 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Upper
+from django.db.models.lookups import In
 from django.contrib.auth.models import User
 from django.utils import timezone
-import qrcode
-from io import BytesIO
-from django.core.files import File
-from PIL import Image
+from django.core.files.base import ContentFile
+from collections import Counter
+import json
 import uuid
+import zlib
+from .qr import qr_image_filename, qr_render_settings, render_qr_image, schedule_qr_render
+
+# Fields of a bag that decide which status counters it is counted under
+COUNTER_FIELDS = ('current_status', 'flight_number', 'created_at')
+
+
+def timeline_prefetch():
+    """Prefetch of a bag's ordered timeline, for ``prefetch_related_objects`` too"""
+    return models.Prefetch(
+        'status_updates',
+        queryset=StatusUpdate.objects.select_related('updated_by').order_by('timestamp'),
+        to_attr='prefetched_timeline'
+    )
+
+
+def on_flights(flight_numbers, field='flight_number'):
+    """
+    Filter for bags on any of ``flight_numbers`` whatever the case they were
+    stored in, matching how flight groups are named. ``field`` reaches the
+    bag's flight number from related models, e.g. ``baggage__flight_number``.
+    """
+    return In(
+        Upper(field, output_field=models.CharField()),
+        [flight_number.upper() for flight_number in flight_numbers]
+    )
+
+
+class BaggageQuerySet(models.QuerySet):
+    """
+    QuerySet helpers for loading baggage together with related data
+    """
+    
+    def with_timeline(self):
+        """Prefetch ordered status timelines (and who made each update) in one query"""
+        return self.prefetch_related(timeline_prefetch())
+    
+    def create_in_bulk(self, bags, batch_size=1000, render_qr=True):
+        """
+        Insert new bags with ``bulk_create`` and do the bookkeeping that
+        ``Baggage.save()`` would otherwise do per bag: unique QR codes,
+        status counters and QR image rendering. With ``render_qr=False`` the
+        images are left for ``render_qr_codes`` or on-demand rendering.
+        """
+        from .counters import apply_counter_deltas, counter_rows
+        
+        bags = list(bags)
+        if not bags:
+            return bags
+        
+        # Short QR codes can collide; re-roll ids until every code is free
+        pending = bags
+        while pending:
+            for bag in pending:
+                bag.assign_qr_code()
+            by_code = {}
+            for bag in pending:
+                by_code.setdefault(bag.qr_code, []).append(bag)
+            taken = set(self.model.objects.filter(qr_code__in=by_code).values_list('qr_code', flat=True))
+            retry = []
+            for code, same_code in by_code.items():
+                clashes = same_code if code in taken else same_code[1:]
+                retry.extend(clashes)
+            for bag in retry:
+                bag.id = uuid.uuid4()
+                bag.qr_code = ''
+            pending = retry
+        
+        deltas = Counter()
+        for bag in bags:
+            for row in counter_rows(bag.current_status, bag.flight_number, bag.created_at):
+                deltas[row] += 1
+        
+        with transaction.atomic():
+            self.bulk_create(bags, batch_size=batch_size)
+            apply_counter_deltas(deltas)
+            if render_qr and qr_render_settings()['MODE'] in ('background', 'inline'):
+                schedule_qr_render([bag.pk for bag in bags])
+        
+        return bags
 
 
 class Baggage(models.Model):
@@ -26,6 +107,7 @@ class Baggage(models.Model):
     flight_number = models.CharField(max_length=20, blank=True, null=True)
     destination = models.CharField(max_length=100, blank=True, null=True)
     qr_code = models.CharField(max_length=100, unique=True, blank=True)
+    tag_number = models.CharField(max_length=10, unique=True, blank=True, null=True)
     qr_code_image = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
     current_status = models.CharField(
         max_length=20, 
@@ -35,63 +117,98 @@ class Baggage(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BaggageQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Baggage'
         verbose_name_plural = 'Baggage'
+        indexes = [
+            # Keyset pagination of the baggage list
+            models.Index(fields=['created_at', 'id'], name='baggage_created_id_idx'),
+            # Status-filtered list pages, newest first
+            models.Index(fields=['current_status', 'created_at'], name='baggage_status_created_idx'),
+            models.Index(fields=['flight_number'], name='baggage_flight_idx'),
+            # Flight subscriptions match flight numbers in any case
+            models.Index(Upper('flight_number'), name='baggage_flight_upper_idx'),
+            # Delta sync from a change cursor
+            models.Index(fields=['updated_at', 'id'], name='baggage_updated_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.passenger_name} - {self.qr_code} ({self.current_status})"
     
-    def save(self, *args, **kwargs):
-        # Generate QR code if not exists
+    def assign_qr_code(self):
+        """Derive the QR code from the bag id unless one is already set"""
         if not self.qr_code:
             self.qr_code = f"BAG-{str(self.id)[:8].upper()}"
+    
+    def counter_key(self, lock=False):
+        """
+        The stored ``(current_status, flight_number, created_at)`` this bag is
+        counted under, or None if it isn't stored. With ``lock`` the row is
+        locked until the current transaction ends.
+        """
+        rows = Baggage.objects.filter(pk=self.pk)
+        if lock:
+            rows = rows.select_for_update()
+        return rows.values_list(*COUNTER_FIELDS).first()
+    
+    def save(self, *args, **kwargs):
+        from .counters import move_baggage_counters
         
-        super().save(*args, **kwargs)
+        # Generate QR code if not exists
+        self.assign_qr_code()
+        
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        counted = update_fields is None or not set(COUNTER_FIELDS).isdisjoint(update_fields)
+        
+        # Keep the status counters in the same transaction as the bag itself.
+        # The old key is read from the locked row, not from when this
+        # instance was loaded, so concurrent saves of one bag each move it out
+        # of the counter it is really in.
+        with transaction.atomic():
+            old_key = self.counter_key(lock=True) if counted and not adding else None
+            super().save(*args, **kwargs)
+            if counted:
+                new_key = (self.current_status, self.flight_number, self.created_at)
+                if old_key != new_key:
+                    move_baggage_counters(old_key, new_key)
         
-        # Generate QR code image
-        if not self.qr_code_image:
-            self.generate_qr_code()
+        # Render the QR code image, in the background unless configured inline.
+        # In on-demand mode images are never stored.
+        if not self.qr_code_image and (adding or kwargs.get('update_fields') is None):
+            mode = qr_render_settings()['MODE']
+            if mode == 'inline':
+                self.generate_qr_code()
+            elif mode == 'background':
+                schedule_qr_render([self.pk])
+    
+    @property
+    def qr_code_status(self):
+        """'ready' once the QR image can be served, 'pending' before that"""
+        if self.qr_code_image or qr_render_settings()['MODE'] == 'on_demand':
+            return 'ready'
+        return 'pending'
     
     def generate_qr_code(self):
         """Generate QR code image for the baggage"""
-        qr_data = {
-            'baggage_id': str(self.id),
-            'qr_code': self.qr_code,
-            'passenger_name': self.passenger_name
-        }
-        
-        # Create QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(str(qr_data))
-        qr.make(fit=True)
-        
-        # Create QR code image
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to BytesIO
-        buffer = BytesIO()
-        qr_image.save(buffer, format='PNG')
-        buffer.seek(0)
+        png = render_qr_image(self.qr_code, 'png')
         
         # Save to model
-        filename = f'qr_{self.qr_code}.png'
         self.qr_code_image.save(
-            filename,
-            File(buffer),
+            qr_image_filename(self),
+            ContentFile(png),
             save=False
         )
         self.save(update_fields=['qr_code_image'])
     
     def get_status_timeline(self):
         """Get complete status timeline for this baggage"""
-        return self.status_updates.all().order_by('timestamp')
+        if hasattr(self, 'prefetched_timeline'):
+            return self.prefetched_timeline
+        return self.status_updates.select_related('updated_by').order_by('timestamp')
     
     def get_current_status_display_with_time(self):
         """Get current status with latest update time"""
@@ -136,6 +253,12 @@ class StatusUpdate(models.Model):
         ordering = ['-timestamp']
         verbose_name = 'Status Update'
         verbose_name_plural = 'Status Updates'
+        indexes = [
+            # Ordered timelines and their keyset pagination
+            models.Index(fields=['baggage', 'timestamp', 'id'], name='update_bag_time_id_idx'),
+            # Most recent updates on the staff dashboard
+            models.Index(fields=['timestamp'], name='update_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.baggage.qr_code} - {self.get_status_display()} at {self.timestamp}"
@@ -149,6 +272,57 @@ class StatusUpdate(models.Model):
         super().save(*args, **kwargs)
 
 
+class ArchivedBaggage(models.Model):
+    """
+    A bag moved out of the hot tables after a while in a terminal status.
+    
+    The bag's columns are kept as they were; its status timeline is stored
+    with it as zlib-compressed JSON, in the shape StatusUpdateSerializer
+    returns. ``archive_day`` is the day the bag reached its terminal status,
+    so the archive can be exported or pruned a day at a time.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    passenger_name = models.CharField(max_length=200)
+    passenger_email = models.EmailField(blank=True, null=True)
+    flight_number = models.CharField(max_length=20, blank=True, null=True)
+    destination = models.CharField(max_length=100, blank=True, null=True)
+    qr_code = models.CharField(max_length=100, db_index=True)
+    tag_number = models.CharField(max_length=10, blank=True, null=True, db_index=True)
+    current_status = models.CharField(max_length=20, choices=Baggage.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archive_day = models.DateField(db_index=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+    timeline = models.BinaryField()
+    
+    class Meta:
+        ordering = ['-archived_at']
+        indexes = [
+            # Exports read the archive in creation order
+            models.Index(fields=['created_at', 'id'], name='archived_created_id_idx'),
+            # Delta sync reads tombstones in archive order
+            models.Index(fields=['archived_at', 'id'], name='archived_at_id_idx'),
+        ]
+        verbose_name = 'Archived Baggage'
+        verbose_name_plural = 'Archived Baggage'
+    
+    def __str__(self):
+        return f"{self.passenger_name} - {self.qr_code} (archived {self.archive_day})"
+    
+    @property
+    def qr_code_status(self):
+        # QR images of archived bags are always rendered on demand
+        return 'ready'
+    
+    @staticmethod
+    def pack_timeline(entries):
+        return zlib.compress(json.dumps(entries, separators=(',', ':')).encode())
+    
+    def get_status_timeline(self):
+        """The archived timeline, as serialized when the bag was archived"""
+        return json.loads(zlib.decompress(self.timeline))
+
+
 class UserProfile(models.Model):
     """
     Extended user profile to track user roles and permissions
@@ -179,3 +353,82 @@ class UserProfile(models.Model):
     @property
     def can_update_baggage_status(self):
         return self.role in ['STAFF', 'ADMIN']
+
+
+class StatusCounter(models.Model):
+    """
+    Running count of bags per status, kept in step with every bag creation
+    and status transition so the dashboard never has to scan the bag table.
+    
+    Rows with an empty flight number and no day hold the airport-wide totals;
+    the other rows break the same counts down by flight and check-in day.
+    """
+    status = models.CharField(max_length=20, choices=Baggage.STATUS_CHOICES)
+    flight_number = models.CharField(max_length=20, blank=True, default='')
+    day = models.DateField(blank=True, null=True)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Status Counter'
+        verbose_name_plural = 'Status Counters'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['status', 'flight_number', 'day'],
+                name='unique_status_counter'
+            ),
+        ]
+        indexes = [
+            # Per-flight and per-day dashboard breakdowns
+            models.Index(fields=['flight_number', 'day'], name='counter_flight_day_idx'),
+            models.Index(fields=['day'], name='counter_day_idx'),
+        ]
+    
+    def __str__(self):
+        scope = f"{self.flight_number or 'all flights'} on {self.day or 'all days'}"
+        return f"{self.get_status_display()} ({scope}): {self.count}"
+
+
+class ThroughputRollup(models.Model):
+    """
+    Number of status updates recorded per hour, location, status and flight.
+    
+    Rows are added to incrementally from the status updates after the
+    ``RollupWatermark`` and are never recomputed on read. Hours are UTC hour
+    starts; a missing location or flight is stored as an empty string.
+    """
+    hour = models.DateTimeField()
+    location = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=20, choices=Baggage.STATUS_CHOICES)
+    flight_number = models.CharField(max_length=20, blank=True, default='')
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Throughput Rollup'
+        verbose_name_plural = 'Throughput Rollups'
+        constraints = [
+            # Also serves reads of an hour range
+            models.UniqueConstraint(
+                fields=['hour', 'location', 'status', 'flight_number'],
+                name='unique_throughput_rollup'
+            ),
+        ]
+        indexes = [
+            # Charts of one checkpoint or one flight
+            models.Index(fields=['location', 'hour'], name='rollup_location_hour_idx'),
+            models.Index(fields=['flight_number', 'hour'], name='rollup_flight_hour_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.location or 'unknown location'} {self.status}: {self.count}"
+
+
+class RollupWatermark(models.Model):
+    """
+    Id of the last status update folded into a rollup table
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
@@ -0,0 +1,300 @@
+"""
+QR code rendering for baggage tags
+
+Images are rendered off the request path by a small in-process worker pool.
+``Baggage.save()`` schedules new bags once their transaction commits and the
+pool renders them in batches, writes the PNGs to storage and records the file
+names with a single bulk update per batch.
+
+In ``'on_demand'`` mode nothing is written to disk: tag images are rendered
+when requested and kept in a bounded LRU cache.
+
+Both modes encode just the bag's ``qr_code`` with ``render_qr_image``, so a
+tag scans the same whichever way its image was produced.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from itertools import repeat
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .cache import status_lookup_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QR_RENDER_SETTINGS = {
+    'MODE': 'background',
+    'WORKERS': 2,
+    'BATCH_SIZE': 50,
+    'USE_PROCESSES': False,
+    'BACKFILL_ON_START': False,
+    'CACHE_SIZE': 1024,
+}
+
+# Bump when the on-demand rendering changes so clients drop cached images
+ON_DEMAND_RENDER_VERSION = 1
+
+IMAGE_CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def qr_render_settings():
+    return {**DEFAULT_QR_RENDER_SETTINGS, **getattr(settings, 'QR_RENDER', {})}
+
+
+def render_qr_png(data):
+    """Render ``data`` as a PNG QR code and return the image bytes"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    qr_image = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    qr_image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_qr_image(qr_code, image_format):
+    """Render the tag image for ``qr_code``; stored and on-demand images both come from here"""
+    if image_format == 'svg':
+        qr = qrcode.QRCode(
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            border=4,
+            image_factory=qrcode.image.svg.SvgPathImage,
+        )
+        qr.add_data(qr_code)
+        qr.make(fit=True)
+        buffer = BytesIO()
+        qr.make_image().save(buffer)
+        return buffer.getvalue()
+    return render_qr_png(qr_code)
+
+
+def qr_image_etag(qr_code, image_format):
+    """Strong ETag for an on-demand tag image, computed without rendering it"""
+    key = f'{ON_DEMAND_RENDER_VERSION}:{image_format}:{qr_code}'.encode()
+    return f'"{hashlib.sha256(key).hexdigest()[:32]}"'
+
+
+class LRUCache:
+    """
+    Small thread-safe least-recently-used cache
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+qr_image_cache = LRUCache(maxsize=qr_render_settings()['CACHE_SIZE'])
+
+
+def qr_image_filename(baggage):
+    return f'qr_{baggage.qr_code}.png'
+
+
+def missing_qr_images(queryset):
+    """Restrict ``queryset`` to bags that have no rendered QR image yet"""
+    return queryset.filter(Q(qr_code_image='') | Q(qr_code_image__isnull=True))
+
+
+class QRRenderQueue:
+    """
+    Background pool that renders pending QR images in batches
+    """
+
+    def __init__(self, workers=2, batch_size=50, use_processes=False, backfill_on_start=False):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.use_processes = use_processes
+        self.backfill_on_start = backfill_on_start
+        self._pending = OrderedDict()  # baggage id -> time it was queued
+        self._in_progress = 0
+        self._rendered = 0
+        self._failed = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+            self._thread = threading.Thread(target=self._run, name='qr-render', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, baggage_ids):
+        """Queue bags for rendering; bags already queued keep their place"""
+        now = time.monotonic()
+        with self._condition:
+            for baggage_id in baggage_ids:
+                self._pending.setdefault(baggage_id, now)
+            self._condition.notify()
+        self.start()
+
+    def backfill(self, chunk_size=1000):
+        """Queue every bag that is still missing its QR image"""
+        from .models import Baggage
+
+        queued = 0
+        baggage_ids = missing_qr_images(Baggage.objects.order_by()).values_list('id', flat=True)
+        chunk = []
+        for baggage_id in baggage_ids.iterator(chunk_size=chunk_size):
+            chunk.append(baggage_id)
+            if len(chunk) >= chunk_size:
+                self.enqueue(chunk)
+                queued += len(chunk)
+                chunk = []
+        if chunk:
+            self.enqueue(chunk)
+            queued += len(chunk)
+        return queued
+
+    def stats(self):
+        """Queue depth and render lag for monitoring"""
+        with self._condition:
+            oldest = next(iter(self._pending.values()), None)
+            return {
+                'queue_depth': len(self._pending),
+                'in_progress': self._in_progress,
+                'rendered': self._rendered,
+                'failed': self._failed,
+                'oldest_pending_seconds': round(time.monotonic() - oldest, 3) if oldest is not None else 0,
+                'running': self._thread is not None and self._thread.is_alive(),
+            }
+
+    def drain(self, timeout=None):
+        """Block until everything queued so far has been rendered"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._in_progress:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                baggage_id, _ = self._pending.popitem(last=False)
+                batch.append(baggage_id)
+            self._in_progress = len(batch)
+            return batch
+
+    def _run(self):
+        if self.backfill_on_start:
+            try:
+                self.backfill()
+            except Exception:
+                logger.exception('QR image backfill failed')
+            finally:
+                close_old_connections()
+
+        while True:
+            batch = self._next_batch()
+            try:
+                rendered, failed = self.render_batch(batch), 0
+            except Exception:
+                logger.exception('Failed to render QR images for %d bags', len(batch))
+                rendered, failed = 0, len(batch)
+            finally:
+                close_old_connections()
+            with self._condition:
+                self._rendered += rendered
+                self._failed += failed
+                self._in_progress = 0
+                self._condition.notify_all()
+
+    def render_batch(self, baggage_ids):
+        """Render, store and record QR images for ``baggage_ids``; returns how many were rendered"""
+        from .models import Baggage
+
+        bags = list(
+            missing_qr_images(Baggage.objects.filter(id__in=baggage_ids))
+            .only('id', 'qr_code', 'qr_code_image')
+        )
+        if not bags:
+            return 0
+
+        images = self._executor.map(render_qr_image, [bag.qr_code for bag in bags], repeat('png'))
+        for bag, png in zip(bags, images):
+            name = default_storage.save(
+                bag.qr_code_image.field.generate_filename(bag, qr_image_filename(bag)),
+                ContentFile(png)
+            )
+            bag.qr_code_image.name = name
+            # bulk_update skips auto_now; the bag's representation changed, so
+            # bump it for conditional GETs and delta sync
+            bag.updated_at = timezone.now()
+
+        Baggage.objects.bulk_update(bags, ['qr_code_image', 'updated_at'])
+        status_lookup_cache.invalidate(bag.qr_code for bag in bags)
+        return len(bags)
+
+
+_render_queue = None
+_render_queue_lock = threading.Lock()
+
+
+def get_render_queue():
+    """Process-wide render queue, created on first use"""
+    global _render_queue
+    with _render_queue_lock:
+        if _render_queue is None:
+            config = qr_render_settings()
+            _render_queue = QRRenderQueue(
+                workers=config['WORKERS'],
+                batch_size=config['BATCH_SIZE'],
+                use_processes=config['USE_PROCESSES'],
+                backfill_on_start=config['BACKFILL_ON_START'],
+            )
+        return _render_queue
+
+
+def schedule_qr_render(baggage_ids):
+    """Queue bags for rendering once the current transaction commits"""
+    baggage_ids = list(baggage_ids)
+    if baggage_ids:
+        transaction.on_commit(lambda: get_render_queue().enqueue(baggage_ids))
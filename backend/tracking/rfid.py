@@ -0,0 +1,154 @@
+"""
+Aggregation of raw RFID portal reads into status updates
+
+A portal on a belt reads the same tag dozens of times a second while the bag
+passes. Reads are debounced per (tag, reader location): a read within
+``WINDOW`` seconds of the latest read of the same tag at the same location
+is a duplicate, and every read extends the window, so a bag standing under
+a portal stays quiet. Reads are compared by the time they were taken, the
+read's ``timestamp`` when the portal sends one and its arrival otherwise,
+and the reads of a request are taken in that order, so batched and delayed
+uploads debounce like live ones. Recent reads are kept in an LRU map bounded
+by ``MAX_TRACKED`` entries, each forgotten ``WINDOW`` seconds after the last
+read of it arrived.
+
+Surviving reads are mapped to a status through ``READERS`` (reader location
+-> status) and handed to ``ingest_scans`` in batches. Only reads that change
+a bag's status are recorded; a bag that is read again after the window, or
+by a second process with its own read map, is reported as unchanged.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from .scans import MAX_BATCH_SIZE, ingest_scans
+
+DEFAULT_RFID_SETTINGS = {
+    'WINDOW': 30.0,
+    'MAX_TRACKED': 100000,
+    'READERS': {},
+}
+
+# Raw reads accepted in one request
+MAX_READS = 5000
+
+
+def rfid_settings():
+    return {**DEFAULT_RFID_SETTINGS, **getattr(settings, 'RFID_AGGREGATION', {})}
+
+
+class ReadAggregator:
+    """
+    Debounces raw reads per (tag, location) and emits status transitions
+    """
+
+    def __init__(self, window=30.0, max_tracked=100000, readers=None):
+        self.window = window
+        self.max_tracked = max_tracked
+        self.readers = dict(readers or {})
+        # (tag, location) -> (epoch seconds of the latest read, monotonic time it arrived)
+        self._last_read = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'reads_in': 0,
+            'duplicates_dropped': 0,
+            'unmapped_dropped': 0,
+            'transitions_out': 0,
+            'unchanged': 0,
+            'unknown_tags': 0,
+            'evicted': 0,
+        }
+
+    def debounce(self, reads):
+        """
+        Return the reads that are not duplicates, as scans for ``ingest_scans``,
+        and the per-call counters
+        """
+        counts = {'reads_in': len(reads), 'duplicates_dropped': 0, 'unmapped_dropped': 0, 'evicted': 0}
+        scans = []
+        now = time.monotonic()
+        received = time.time()
+        timed = sorted(
+            (read['timestamp'].timestamp() if read.get('timestamp') else received, index, read)
+            for index, read in enumerate(reads)
+        )
+        with self._lock:
+            # Entries are in arrival order, so expired ones are at the front
+            while self._last_read:
+                key, (_, arrived) = next(iter(self._last_read.items()))
+                if now - arrived <= self.window:
+                    break
+                del self._last_read[key]
+
+            for read_at, _, read in timed:
+                location = read['location']
+                status = self.readers.get(location)
+                if status is None:
+                    counts['unmapped_dropped'] += 1
+                    continue
+
+                key = (read['tag'], location)
+                latest = self._last_read[key][0] if key in self._last_read else None
+                duplicate = latest is not None and abs(read_at - latest) <= self.window
+                self._last_read[key] = (read_at if latest is None else max(read_at, latest), now)
+                self._last_read.move_to_end(key)
+                if duplicate:
+                    counts['duplicates_dropped'] += 1
+                    continue
+
+                scans.append({
+                    'tag_number': read['tag'],
+                    'status': status,
+                    'location': location,
+                    'timestamp': read.get('timestamp'),
+                    'notes': 'RFID',
+                })
+
+            while len(self._last_read) > self.max_tracked:
+                self._last_read.popitem(last=False)
+                counts['evicted'] += 1
+            self._add(counts)
+        return scans, counts
+
+    def ingest(self, reads, user=None):
+        """Debounce ``reads`` and record the resulting transitions; returns counters"""
+        scans, counts = self.debounce(reads)
+        counts.update(transitions_out=0, unchanged=0, unknown_tags=0)
+        for start in range(0, len(scans), MAX_BATCH_SIZE):
+            for result in ingest_scans(scans[start:start + MAX_BATCH_SIZE], user=user, only_transitions=True):
+                if result['result'] == 'updated':
+                    counts['transitions_out'] += 1
+                elif result['result'] == 'unchanged':
+                    counts['unchanged'] += 1
+                else:
+                    counts['unknown_tags'] += 1
+        with self._lock:
+            self._add({key: counts[key] for key in ('transitions_out', 'unchanged', 'unknown_tags')})
+        return counts
+
+    def _add(self, counts):
+        for key, value in counts.items():
+            self._counters[key] += value
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'tracked': len(self._last_read)}
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_aggregator():
+    """Process-wide aggregator, created on first use"""
+    global _aggregator
+    with _aggregator_lock:
+        if _aggregator is None:
+            config = rfid_settings()
+            _aggregator = ReadAggregator(
+                window=config['WINDOW'],
+                max_tracked=config['MAX_TRACKED'],
+                readers=config['READERS'],
+            )
+        return _aggregator
@@ -0,0 +1,166 @@
+"""
+Hourly throughput rollups per checkpoint
+
+``ThroughputRollup`` counts status updates per (UTC hour, location, status,
+flight). The counts are advanced from a watermark: each step aggregates the
+status updates with ids after ``RollupWatermark.last_id`` in one grouped
+query, adds the result to the rollup rows with a single upsert and moves
+the watermark, all in one transaction. Moving the watermark is a
+compare-and-set, so two processes catching up at once cannot count the same
+updates twice.
+
+Status update ids are assigned in commit order on SQLite, whose writers are
+serialized. On databases with concurrent writers a slow transaction can
+commit an id behind the watermark; ``rebuild_throughput_rollups --since``
+recounts a recent window.
+
+Rollups record what was scanned: archiving or deleting status updates later
+does not change them.
+"""
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, TruncHour
+from .models import RollupWatermark, StatusUpdate, ThroughputRollup
+
+DEFAULT_THROUGHPUT_ROLLUP_SETTINGS = {
+    'BATCH_SIZE': 5000,
+    'MAX_RANGE_DAYS': 31,
+}
+
+WATERMARK_NAME = 'throughput'
+
+THROUGHPUT_GROUP_BY_CHOICES = ('location', 'status', 'flight_number')
+
+
+def throughput_rollup_settings():
+    return {**DEFAULT_THROUGHPUT_ROLLUP_SETTINGS, **getattr(settings, 'THROUGHPUT_ROLLUPS', {})}
+
+
+def hourly_counts(updates):
+    """Group ``updates`` into rollup rows: {(hour, location, status, flight): count}"""
+    rows = updates.order_by().values_list(
+        TruncHour('timestamp', tzinfo=dt_timezone.utc),
+        Coalesce('location', Value('')),
+        'status',
+        Coalesce('baggage__flight_number', Value('')),
+    ).annotate(total=Count('id'))
+    return {tuple(row[:4]): row[4] for row in rows}
+
+
+def add_to_rollups(counts):
+    """Add ``counts`` from ``hourly_counts`` to the rollup table"""
+    if not counts:
+        return
+    connection = connections[router.db_for_write(ThroughputRollup)]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        _add_to_rollups_one_by_one(counts)
+        return
+
+    quote = connection.ops.quote_name
+    table = quote(ThroughputRollup._meta.db_table)
+    count = quote('count')
+    keys = ', '.join(quote(name) for name in ('hour', 'location', 'status', 'flight_number'))
+    items = list(counts.items())
+    # Stay below the bound parameter limit of older SQLite builds
+    for start in range(0, len(items), 100):
+        chunk = items[start:start + 100]
+        params = []
+        for (hour, location, status, flight_number), total in chunk:
+            params.extend([connection.ops.adapt_datetimefield_value(hour), location, status, flight_number, total])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({keys}, {count}) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(chunk))} '
+                f'ON CONFLICT ({keys}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}',
+                params
+            )
+
+
+def _add_to_rollups_one_by_one(counts):
+    for (hour, location, status, flight_number), total in counts.items():
+        rollup = ThroughputRollup.objects.filter(
+            hour=hour, location=location, status=status, flight_number=flight_number
+        )
+        if rollup.update(count=F('count') + total):
+            continue
+        try:
+            with transaction.atomic():
+                ThroughputRollup.objects.create(
+                    hour=hour, location=location, status=status, flight_number=flight_number, count=total
+                )
+        except IntegrityError:
+            # Another writer created the row first
+            rollup.update(count=F('count') + total)
+
+
+def watermark():
+    return RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)[0].last_id
+
+
+def advance_rollups(batch_size=None):
+    """
+    Fold the status updates recorded since the watermark into the rollups,
+    ``batch_size`` updates per transaction. Returns the number folded in.
+    """
+    batch_size = batch_size or throughput_rollup_settings()['BATCH_SIZE']
+    folded = 0
+    while True:
+        last_id = watermark()
+        batch_ids = StatusUpdate.objects.filter(id__gt=last_id).order_by('id').values('id')[:batch_size]
+        upper = batch_ids.aggregate(upper=Max('id'))['upper']
+        if upper is None:
+            return folded
+
+        with transaction.atomic():
+            moved = RollupWatermark.objects.filter(name=WATERMARK_NAME, last_id=last_id).update(last_id=upper)
+            if not moved:
+                # Someone else advanced the watermark; start over from theirs
+                continue
+            batch = StatusUpdate.objects.filter(id__gt=last_id, id__lte=upper)
+            counts = hourly_counts(batch)
+            add_to_rollups(counts)
+        folded += sum(counts.values())
+
+
+def rebuild_rollups(since=None):
+    """
+    Recount the rollups from the status update table, from the hour of
+    ``since`` on or entirely. Returns the number of rollup rows written.
+    """
+    if since is not None:
+        # Hours before the window keep their counts, so they must be current
+        advance_rollups()
+
+    with transaction.atomic():
+        upper = StatusUpdate.objects.aggregate(upper=Max('id'))['upper'] or 0
+        rollups = ThroughputRollup.objects.all()
+        updates = StatusUpdate.objects.filter(id__lte=upper)
+        if since is not None:
+            hour = since.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+            rollups = rollups.filter(hour__gte=hour)
+            updates = updates.filter(timestamp__gte=hour)
+        rollups.delete()
+        counts = hourly_counts(updates)
+        ThroughputRollup.objects.bulk_create([
+            ThroughputRollup(hour=hour, location=location, status=status, flight_number=flight_number, count=total)
+            for (hour, location, status, flight_number), total in counts.items()
+        ], batch_size=1000)
+        RollupWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'last_id': upper})
+    return len(counts)
+
+
+def throughput(start, end, group_by=('status',), **filters):
+    """
+    Hourly counts between ``start`` and ``end`` read from the rollups,
+    summed over everything not in ``group_by``. ``filters`` narrow the
+    rollups by location, status or flight_number.
+    """
+    rollups = ThroughputRollup.objects.filter(hour__gte=start, hour__lt=end, **filters)
+    rows = rollups.values('hour', *group_by).annotate(total=Sum('count')).order_by('hour', *group_by)
+    return [
+        {**{name: row[name] for name in ('hour', *group_by)}, 'count': row['total']}
+        for row in rows
+    ]
@@ -0,0 +1,104 @@
+"""
+Routing of read-only views to database replicas
+
+Views decorated with ``replica_reads`` run their queries on one of the
+aliases in ``REPLICA_ROUTING['REPLICAS']``; everything else, including every
+write, uses ``default``. Replicas lag behind the primary, so a client that
+has just written is pinned to the primary for ``STICKY_SECONDS``: the
+middleware marks successful unsafe requests with a short-lived signed
+cookie, and requests carrying it read from the primary even in replica
+views.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+DEFAULT_REPLICA_ROUTING_SETTINGS = {
+    'REPLICAS': [],
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'primary_reads',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+COOKIE_SALT = 'tracking.routers.primary_reads'
+
+# Set while a replica view runs
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_routing_settings():
+    return {**DEFAULT_REPLICA_ROUTING_SETTINGS, **getattr(settings, 'REPLICA_ROUTING', {})}
+
+
+class ReplicaRouter:
+    """
+    Send reads of replica views to a random replica and all else to default
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return None
+        replicas = replica_routing_settings()['REPLICAS']
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_routing_settings()['REPLICAS']
+
+
+def reads_pinned_to_primary(request):
+    """Whether ``request`` comes from a client that wrote within the sticky window"""
+    config = replica_routing_settings()
+    return request.get_signed_cookie(
+        config['COOKIE_NAME'], default=None, salt=COOKIE_SALT, max_age=config['STICKY_SECONDS']
+    ) is not None
+
+
+def replica_reads(view):
+    """
+    Run the queries of ``view`` on a replica, unless the client has just
+    written and has to see its own writes
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if reads_pinned_to_primary(request):
+            return view(request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapped
+
+
+def _remember_write(request, response):
+    if request.method not in SAFE_METHODS and response.status_code < 400:
+        config = replica_routing_settings()
+        if config['REPLICAS']:
+            response.set_signed_cookie(
+                config['COOKIE_NAME'], '1', salt=COOKIE_SALT,
+                max_age=config['STICKY_SECONDS'], httponly=True, samesite='Lax'
+            )
+    return response
+
+
+@sync_and_async_middleware
+def read_your_writes_middleware(get_response):
+    """Pin a client's reads to the primary for a moment after it writes"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return _remember_write(request, await get_response(request))
+    else:
+        def middleware(request):
+            return _remember_write(request, get_response(request))
+    return middleware
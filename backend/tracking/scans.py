@@ -0,0 +1,159 @@
+"""
+Set-based status update path for batches of baggage scans
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from .broadcast import publish_baggage_update
+from .cache import status_lookup_cache
+from .counters import apply_counter_deltas, counter_rows
+from .models import Baggage, StatusUpdate
+
+
+MAX_BATCH_SIZE = 500
+
+
+@transaction.atomic
+def ingest_scans(scans, user=None, only_transitions=False):
+    """
+    Record a batch of validated scans and return one result per scan.
+
+    Each scan is a dict with ``status`` and either ``baggage_id``,
+    ``qr_code`` or ``tag_number``, plus optional ``notes``, ``location``,
+    ``timestamp`` and ``updated_by`` (defaulting to ``user``). All bags are
+    resolved with a single query, the status updates are inserted with
+    ``bulk_create`` and ``current_status`` is moved with one UPDATE per
+    distinct target status. The batch is one transaction and the bags are
+    locked as they are resolved, so the counters are moved from the status
+    each bag is really in even when scans of it race.
+
+    Scans can be backdated (delayed uploads, replayed RFID reads), so a bag
+    only moves to the status of its newest scan in the batch when that scan
+    is later than the newest update already stored; older scans are added to
+    its timeline without changing ``current_status`` or the counters.
+
+    With ``only_transitions`` a scan that would not change the bag's status
+    is reported as ``unchanged`` and not recorded.
+    """
+    ids = {scan['baggage_id'] for scan in scans if scan.get('baggage_id')}
+    codes = {scan['qr_code'] for scan in scans if not scan.get('baggage_id') and scan.get('qr_code')}
+    tags = {scan['tag_number'] for scan in scans if scan.get('tag_number')}
+
+    newest_stored = StatusUpdate.objects.filter(baggage=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    bags = Baggage.objects.select_for_update().filter(
+        Q(id__in=ids) | Q(qr_code__in=codes) | Q(tag_number__in=tags)
+    ).only(
+        'id', 'qr_code', 'tag_number', 'current_status', 'flight_number', 'created_at'
+    ).annotate(newest_stored=Subquery(newest_stored))
+    by_id = {}
+    by_code = {}
+    by_tag = {}
+    for bag in bags:
+        by_id[bag.id] = bag
+        by_code[bag.qr_code] = bag
+        if bag.tag_number:
+            by_tag[bag.tag_number] = bag
+
+    now = timezone.now()
+    results = []
+    updates = []
+    latest = {}  # baggage id -> (timestamp, status) of the newest scan in the batch
+
+    for index, scan in enumerate(scans):
+        if scan.get('baggage_id'):
+            bag = by_id.get(scan['baggage_id'])
+        elif scan.get('qr_code'):
+            bag = by_code.get(scan['qr_code'])
+        else:
+            bag = by_tag.get(scan.get('tag_number'))
+
+        if bag is None:
+            results.append({
+                'index': index,
+                'result': 'not_found',
+                'baggage_id': str(scan['baggage_id']) if scan.get('baggage_id') else None,
+                'qr_code': scan.get('qr_code'),
+                'tag_number': scan.get('tag_number'),
+            })
+            continue
+
+        if only_transitions:
+            status_now = latest[bag.id][1] if bag.id in latest else bag.current_status
+            if scan['status'] == status_now:
+                results.append({
+                    'index': index,
+                    'result': 'unchanged',
+                    'baggage_id': str(bag.id),
+                    'qr_code': bag.qr_code,
+                    'status': scan['status'],
+                })
+                continue
+
+        timestamp = scan.get('timestamp') or now
+        updates.append(StatusUpdate(
+            baggage=bag,
+            status=scan['status'],
+            timestamp=timestamp,
+            updated_by=scan.get('updated_by', user),
+            notes=scan.get('notes'),
+            location=scan.get('location'),
+        ))
+        if bag.id not in latest or timestamp >= latest[bag.id][0]:
+            latest[bag.id] = (timestamp, scan['status'])
+
+        results.append({
+            'index': index,
+            'result': 'updated',
+            'baggage_id': str(bag.id),
+            'qr_code': bag.qr_code,
+            'status': scan['status'],
+        })
+
+    if not updates:
+        return results
+
+    # Group bags by their final status so each target status is one UPDATE.
+    # Bags whose timeline only gained older scans keep their status (None).
+    targets = {}
+    counter_deltas = Counter()
+    advanced = set()
+    for baggage_id, (timestamp, new_status) in latest.items():
+        bag = by_id[baggage_id]
+        if bag.newest_stored is not None and timestamp <= bag.newest_stored:
+            targets.setdefault(None, []).append(baggage_id)
+            continue
+        advanced.add(baggage_id)
+        targets.setdefault(new_status, []).append(baggage_id)
+        if bag.current_status != new_status:
+            for row in counter_rows(bag.current_status, bag.flight_number, bag.created_at):
+                counter_deltas[row] -= 1
+            for row in counter_rows(new_status, bag.flight_number, bag.created_at):
+                counter_deltas[row] += 1
+
+    StatusUpdate.objects.bulk_create(updates)
+    for new_status, baggage_ids in targets.items():
+        # updated_at moves either way: the bag's timeline changed
+        changes = {'updated_at': now} if new_status is None else {'current_status': new_status, 'updated_at': now}
+        Baggage.objects.filter(id__in=baggage_ids).update(**changes)
+    apply_counter_deltas(counter_deltas)
+    status_lookup_cache.invalidate(by_id[baggage_id].qr_code for baggage_id in latest)
+
+    # Broadcast the newest scan of each bag that moved once the batch commits
+    newest = {}
+    for update in updates:
+        if update.baggage_id not in advanced:
+            continue
+        if update.baggage_id not in newest or update.timestamp >= newest[update.baggage_id].timestamp:
+            newest[update.baggage_id] = update
+    for update in newest.values():
+        publish_baggage_update(update.baggage, update)
+
+    # bulk_create fills in primary keys on backends that support RETURNING
+    updated = iter(updates)
+    for result in results:
+        if result['result'] == 'updated':
+            result['status_update_id'] = next(updated).pk
+
+    return results
@@ -0,0 +1,244 @@
+"""
+Indexed baggage search
+
+On SQLite the searchable columns are mirrored into an FTS5 table using the
+trigram tokenizer, which answers the same substring queries as ``icontains``
+from an index and ranks matches with bm25. Triggers on ``tracking_baggage``
+keep it in sync for every write path, including ``bulk_create`` and
+``QuerySet.update()``.
+
+The full-text query runs once per search: its matches and their bm25 rank
+are joined to the bag table as a derived table, so a common term costs one
+pass over its matches rather than a rank lookup per matching bag.
+
+FTS5 tables are keyed by an integer rowid, so the index follows the bag
+table's rowid rather than its UUID. A ``VACUUM`` or a migration that rebuilds
+``tracking_baggage`` can renumber rows or drop the triggers; ``manage.py
+rebuild_search_index --verify-only`` detects that and ``manage.py
+rebuild_search_index`` repairs it.
+
+On PostgreSQL the same columns get ``pg_trgm`` GIN indexes that serve the
+``icontains`` filter, and matches are ranked by trigram similarity.
+"""
+from django.db import DatabaseError, connections
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import Expression
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.sql.constants import INNER
+
+SEARCH_COLUMNS = ['passenger_name', 'qr_code', 'flight_number', 'passenger_email']
+SEARCH_TABLE = 'tracking_baggage_search'
+
+# The trigram tokenizer cannot match terms shorter than this
+MIN_INDEXED_TERM_LENGTH = 3
+
+_COLUMNS = ', '.join(SEARCH_COLUMNS)
+_NEW_VALUES = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+_OLD_VALUES = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+
+SQLITE_INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        {_COLUMNS},
+        content='tracking_baggage',
+        content_rowid='rowid',
+        tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON tracking_baggage BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, {_COLUMNS}) VALUES (new.rowid, {_NEW_VALUES});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON tracking_baggage BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_COLUMNS}) VALUES ('delete', old.rowid, {_OLD_VALUES});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+        AFTER UPDATE OF {_COLUMNS} ON tracking_baggage BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_COLUMNS}) VALUES ('delete', old.rowid, {_OLD_VALUES});
+        INSERT INTO {SEARCH_TABLE}(rowid, {_COLUMNS}) VALUES (new.rowid, {_NEW_VALUES});
+    END""",
+]
+
+SQLITE_UNINSTALL_SQL = [
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update',
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+]
+
+POSTGRESQL_INSTALL_SQL = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX IF NOT EXISTS tracking_baggage_{column}_trgm '
+    f'ON tracking_baggage USING gin (UPPER({column}::text) gin_trgm_ops)'
+    for column in SEARCH_COLUMNS
+]
+
+POSTGRESQL_UNINSTALL_SQL = [
+    f'DROP INDEX IF EXISTS tracking_baggage_{column}_trgm' for column in SEARCH_COLUMNS
+]
+
+
+def install_search_index(connection):
+    """Create the search index and sync triggers for ``connection`` if missing"""
+    if connection.vendor == 'sqlite':
+        statements = SQLITE_INSTALL_SQL
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRESQL_INSTALL_SQL
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall_search_index(connection):
+    if connection.vendor == 'sqlite':
+        statements = SQLITE_UNINSTALL_SQL
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRESQL_UNINSTALL_SQL
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def rebuild_search_index(connection):
+    """Reinstall the triggers and re-read every bag into the index"""
+    install_search_index(connection)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def search_index_problems(connection):
+    """
+    Describe what is wrong with the search index on ``connection``: missing
+    triggers or entries that no longer match the bag table. Empty if sound.
+    """
+    if connection.vendor != 'sqlite':
+        return []
+    problems = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'tracking_baggage'"
+        )
+        triggers = {name for name, in cursor.fetchall()}
+        for action in ('insert', 'delete', 'update'):
+            if f'{SEARCH_TABLE}_{action}' not in triggers:
+                problems.append(f'trigger {SEARCH_TABLE}_{action} is missing')
+        try:
+            # With rank 1 the index is compared with the content table itself
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('integrity-check', 1)")
+        except DatabaseError as error:
+            problems.append(f'index does not match the baggage table ({error})')
+    return problems
+
+
+def legacy_search(queryset, term):
+    """The original unindexed OR of ``icontains`` filters"""
+    return queryset.filter(
+        Q(passenger_name__icontains=term) |
+        Q(qr_code__icontains=term) |
+        Q(flight_number__icontains=term) |
+        Q(passenger_email__icontains=term)
+    )
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+class SearchMatches:
+    """
+    ``INNER JOIN`` of the index matches of one phrase, with their rank, to
+    the bag table. Implements the interface ``Query.alias_map`` entries need
+    (see ``django.db.models.sql.datastructures.Join``), so the search stays
+    an ordinary QuerySet that can be filtered, counted and sliced.
+    """
+    table_name = f'{SEARCH_TABLE}_matches'
+    nullable = False
+    filtered_relation = None
+
+    def __init__(self, phrase, parent_alias, table_alias=None, join_type=INNER):
+        self.phrase = phrase
+        self.parent_alias = parent_alias
+        self.table_alias = table_alias
+        self.join_type = join_type
+
+    def as_sql(self, compiler, connection):
+        qn = compiler.quote_name_unless_alias
+        alias = qn(self.table_alias)
+        sql = (
+            f'INNER JOIN (SELECT rowid, rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s) {alias} '
+            f'ON ({alias}.rowid = {qn(self.parent_alias)}.rowid)'
+        )
+        return sql, [self.phrase]
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(
+            self.phrase,
+            change_map.get(self.parent_alias, self.parent_alias),
+            change_map.get(self.table_alias, self.table_alias),
+            self.join_type,
+        )
+
+    # The join is the search filter, so it is never turned into an outer join
+    def promote(self):
+        return self.relabeled_clone({})
+
+    demote = promote
+
+    @property
+    def identity(self):
+        return self.__class__, self.phrase, self.parent_alias
+
+    def __eq__(self, other):
+        if not isinstance(other, SearchMatches):
+            return NotImplemented
+        return self.identity == other.identity
+
+    def __hash__(self):
+        return hash(self.identity)
+
+
+class SearchRank(Expression):
+    """The bm25 rank of the matches joined under ``alias``; lower is more relevant"""
+    output_field = FloatField()
+
+    def __init__(self, alias):
+        super().__init__()
+        self.alias = alias
+
+    def as_sql(self, compiler, connection):
+        return f'{compiler.quote_name_unless_alias(self.alias)}.rank', []
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(change_map.get(self.alias, self.alias))
+
+    def get_group_by_cols(self):
+        return [self]
+
+
+def search_baggage(queryset, term):
+    """
+    Filter ``queryset`` to bags matching ``term`` and order them by relevance,
+    newest first among equally relevant bags.
+    """
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'sqlite' and len(term) >= MIN_INDEXED_TERM_LENGTH:
+        queryset = queryset.all()
+        query = queryset.query
+        alias = query.join(SearchMatches(_fts_phrase(term), query.get_initial_alias()))
+        return queryset.annotate(search_rank=SearchRank(alias)).order_by('search_rank', '-created_at')
+
+    if vendor == 'postgresql':
+        similarities = [
+            Coalesce(
+                Func(F(column), Value(term), function='similarity', output_field=FloatField()),
+                Value(0.0)
+            )
+            for column in SEARCH_COLUMNS
+        ]
+        return legacy_search(queryset, term).annotate(
+            search_rank=Greatest(*similarities)
+        ).order_by('-search_rank', '-created_at')
+
+    return legacy_search(queryset, term).order_by('-created_at')
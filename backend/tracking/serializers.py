@@ -2,7 +2,11 @@ from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
-from .models import Baggage, StatusUpdate, UserProfile
+from django.urls import reverse
+from .models import ArchivedBaggage, Baggage, StatusUpdate, UserProfile
+from .qr import qr_render_settings
+from .rfid import MAX_READS
+from .scans import MAX_BATCH_SIZE
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -93,11 +97,21 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return f"{obj.user.first_name} {obj.user.last_name}".strip() or obj.user.username
 
 
+def _split_param(value):
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
 class BaggageSerializer(serializers.ModelSerializer):
     """
     Serializer for baggage information
+    
+    Supports sparse fieldsets through ``?fields=id,qr_code,...``. When a
+    field list is given the embedded timeline is only returned if it is
+    listed or requested with ``?include=timeline``. Unknown field names are
+    rejected with 400.
     """
     qr_code_image_url = serializers.SerializerMethodField()
+    qr_code_status = serializers.CharField(read_only=True)
     current_status_display = serializers.CharField(source='get_current_status_display', read_only=True)
     status_timeline = serializers.SerializerMethodField()
     
@@ -105,16 +119,54 @@ class BaggageSerializer(serializers.ModelSerializer):
         model = Baggage
         fields = [
             'id', 'passenger_name', 'passenger_email', 'flight_number', 
-            'destination', 'qr_code', 'qr_code_image_url', 'current_status', 
-            'current_status_display', 'created_at', 'updated_at', 'status_timeline'
+            'destination', 'qr_code', 'qr_code_image_url', 'qr_code_status', 'tag_number', 
+            'current_status', 'current_status_display', 'created_at', 'updated_at', 'status_timeline'
         ]
-        read_only_fields = ['id', 'qr_code', 'qr_code_image_url', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'qr_code', 'qr_code_image_url', 'qr_code_status', 'tag_number', 'created_at', 'updated_at']
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        requested = self.requested_fields(self.context.get('request'))
+        if requested is not None:
+            for field_name in set(self.fields) - requested:
+                self.fields.pop(field_name)
+    
+    @staticmethod
+    def requested_fields(request):
+        """Return the set of fields asked for in the query string, or None for all fields"""
+        if request is None or not hasattr(request, 'query_params'):
+            return None
+        fields = request.query_params.get('fields')
+        if not fields:
+            return None
+        requested = _split_param(fields)
+        # Archived bags have every live field plus archived_at
+        unknown = requested - set(ArchivedBaggageSerializer.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError({
+                'fields': [f'Unknown field: {name}' for name in sorted(unknown)]
+            })
+        if 'timeline' in _split_param(request.query_params.get('include', '')):
+            requested.add('status_timeline')
+        return requested
+    
+    @classmethod
+    def includes_timeline(cls, request):
+        """Whether the response for this request embeds the status timeline"""
+        requested = cls.requested_fields(request)
+        return requested is None or 'status_timeline' in requested
     
     def get_qr_code_image_url(self, obj):
+        request = self.context.get('request')
+        if not request:
+            return None
         if obj.qr_code_image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.qr_code_image.url)
+            return request.build_absolute_uri(obj.qr_code_image.url)
+        if qr_render_settings()['MODE'] == 'on_demand':
+            return request.build_absolute_uri(
+                reverse('baggage_qr_image', kwargs={'qr_code': obj.qr_code, 'image_format': 'png'})
+            )
         return None
     
     def get_status_timeline(self, obj):
@@ -122,6 +174,34 @@ class BaggageSerializer(serializers.ModelSerializer):
         return StatusUpdateSerializer(timeline, many=True, context=self.context).data
 
 
+class BaggageChangeSerializer(BaggageSerializer):
+    """
+    Baggage in delta sync responses, which carry status updates separately
+    """
+    class Meta(BaggageSerializer.Meta):
+        fields = [name for name in BaggageSerializer.Meta.fields if name != 'status_timeline']
+
+
+class ArchivedBaggageSerializer(BaggageSerializer):
+    """
+    Serializer for archived baggage, in the same shape as live baggage
+    """
+    class Meta(BaggageSerializer.Meta):
+        model = ArchivedBaggage
+        fields = BaggageSerializer.Meta.fields + ['archived_at']
+    
+    def get_qr_code_image_url(self, obj):
+        request = self.context.get('request')
+        if not request:
+            return None
+        return request.build_absolute_uri(
+            reverse('baggage_qr_image', kwargs={'qr_code': obj.qr_code, 'image_format': 'png'})
+        )
+    
+    def get_status_timeline(self, obj):
+        return obj.get_status_timeline()
+
+
 class BaggageCreateSerializer(serializers.ModelSerializer):
     """
     Serializer for creating new baggage entries
@@ -147,6 +227,14 @@ class StatusUpdateSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'timestamp']
 
 
+class StatusUpdateChangeSerializer(StatusUpdateSerializer):
+    """
+    Status updates in delta sync responses, with the bag they belong to
+    """
+    class Meta(StatusUpdateSerializer.Meta):
+        fields = ['baggage'] + StatusUpdateSerializer.Meta.fields
+
+
 class StatusUpdateCreateSerializer(serializers.ModelSerializer):
     """
     Serializer for creating status updates
@@ -164,4 +252,52 @@ class StatusUpdateCreateSerializer(serializers.ModelSerializer):
             baggage=baggage,
             updated_by=user,
             **validated_data
-        )
\ No newline at end of file
+        )
+
+
+class ScanSerializer(serializers.Serializer):
+    """
+    Serializer for a single scan inside a batch
+    """
+    baggage_id = serializers.UUIDField(required=False)
+    qr_code = serializers.CharField(required=False, max_length=100)
+    status = serializers.ChoiceField(choices=Baggage.STATUS_CHOICES)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    location = serializers.CharField(required=False, allow_blank=True, allow_null=True, max_length=100)
+    timestamp = serializers.DateTimeField(required=False)
+    
+    def validate(self, attrs):
+        if not attrs.get('baggage_id') and not attrs.get('qr_code'):
+            raise serializers.ValidationError("Either baggage_id or qr_code is required")
+        return attrs
+
+
+class BatchScanSerializer(serializers.Serializer):
+    """
+    Serializer for a batch of scans from handheld scanners and conveyor readers
+    """
+    scans = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE
+    )
+
+
+class RfidReadSerializer(serializers.Serializer):
+    """
+    Serializer for one raw read from an RFID portal
+    """
+    tag = serializers.CharField(max_length=10)
+    location = serializers.CharField(max_length=100)
+    timestamp = serializers.DateTimeField(required=False)
+
+
+class RfidReadBatchSerializer(serializers.Serializer):
+    """
+    Serializer for a batch of raw RFID reads
+    """
+    reads = serializers.ListField(
+        child=RfidReadSerializer(),
+        allow_empty=False,
+        max_length=MAX_READS
+    )
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .cache import status_lookup_cache
+from .counters import move_baggage_counters
+from .models import Baggage, StatusUpdate
+
+
+@receiver(pre_delete, sender=Baggage)
+def release_status_counters(sender, instance, **kwargs):
+    """
+    Take deleted bags out of the status counters they are stored under
+    """
+    # Deletes run in a transaction, so the locked row can't change before it goes
+    key = instance.counter_key(lock=True)
+    if key is not None:
+        move_baggage_counters(key, None)
+
+
+@receiver(post_save, sender=Baggage)
+@receiver(post_delete, sender=Baggage)
+def invalidate_baggage_status(sender, instance, **kwargs):
+    """
+    Drop cached status lookups of a changed bag
+    """
+    status_lookup_cache.invalidate([instance.qr_code])
+
+
+@receiver(post_save, sender=StatusUpdate)
+@receiver(post_delete, sender=StatusUpdate)
+def invalidate_timeline_status(sender, instance, **kwargs):
+    """
+    Drop cached status lookups of a bag whose timeline changed
+    """
+    if StatusUpdate.baggage.is_cached(instance):
+        qr_code = instance.baggage.qr_code
+    else:
+        qr_code = Baggage.objects.filter(pk=instance.baggage_id).values_list('qr_code', flat=True).first()
+    status_lookup_cache.invalidate([qr_code])
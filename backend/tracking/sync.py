@@ -0,0 +1,155 @@
+"""
+Delta sync for offline-capable scanners and apps
+
+A client keeps an opaque change cursor and asks for what changed after it.
+Bags are read in ``(updated_at, id)`` order and status updates in id order,
+each as an index range scan from the cursor, so a sync costs as much as the
+delta and not the table. Both lists are bounded by the batch size; clients
+repeat the request with the returned cursor while ``has_more`` is set.
+
+``updated_at`` is taken before a transaction commits, so a bag written by a
+slow transaction can commit with a time that is already behind a cursor
+handed out meanwhile. The bag position in the cursor therefore never moves
+past ``SETTLE_WINDOW`` seconds ago: bags changed within the window are sent
+again by the next sync, and clients apply changes idempotently. Every status
+update also touches its bag, so a bag with new updates is always resent.
+Status update ids are assigned in commit order on SQLite, whose writers are
+serialized; they are not on databases with concurrent writers, where the
+resent bag is the signal to refresh its timeline.
+
+Bags moved to the archive leave the hot tables, so they are reported as
+tombstones: the ids of bags archived after the cursor, read in
+``(archived_at, id)`` order and held back to the settle window like bags.
+Clients drop those bags from their copy. Bags deleted outright are not
+reported.
+"""
+import json
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ArchivedBaggage, Baggage, StatusUpdate
+from .pagination import keyset_after
+
+DEFAULT_CHANGE_SYNC_SETTINGS = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 500,
+    'SETTLE_WINDOW': 2.0,
+}
+
+BAGGAGE_ORDERING = ('updated_at', 'id')
+ARCHIVE_ORDERING = ('archived_at', 'id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def change_sync_settings():
+    return {**DEFAULT_CHANGE_SYNC_SETTINGS, **getattr(settings, 'CHANGE_SYNC', {})}
+
+
+def encode_cursor(baggage_position, update_id, archive_position=None):
+    payload = json.dumps(
+        {'b': baggage_position, 'u': update_id, 'a': archive_position},
+        default=str,
+        separators=(',', ':')
+    )
+    return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_position(position):
+    if position is None:
+        return None
+    timestamp, row_id = position
+    decoded = [parse_datetime(timestamp), str(uuid.UUID(row_id))]
+    if decoded[0] is None:
+        raise ValueError(timestamp)
+    return decoded
+
+
+def decode_cursor(encoded):
+    """Return ``(baggage position or None, last status update id, archive position or None)``"""
+    if not encoded:
+        return None, 0, None
+    try:
+        padded = encoded + '=' * (-len(encoded) % 4)
+        payload = json.loads(urlsafe_b64decode(padded.encode()))
+        position = _decode_position(payload['b'])
+        update_id = int(payload['u'])
+        # Cursors issued before tombstones were added have no archive position
+        archive_position = _decode_position(payload.get('a'))
+    except (TypeError, ValueError, KeyError, AttributeError, BinasciiError):
+        raise InvalidCursor(encoded)
+    return position, update_id, archive_position
+
+
+def _page(queryset, ordering, position, limit):
+    """Up to ``limit`` rows of ``queryset`` after ``position``, and whether there are more"""
+    queryset = queryset.order_by(*ordering)
+    if position is not None:
+        queryset = queryset.filter(keyset_after(ordering, position))
+    rows = list(queryset[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def _settled_position(rows, field, position, settled):
+    """
+    The position to continue from after ``rows``, held back to ``settled``.
+    Returns ``(position, whether the rows are all settled)``.
+    """
+    if not rows:
+        return position, True
+    last = rows[-1]
+    if getattr(last, field) <= settled:
+        return [getattr(last, field), str(last.id)], True
+    if position is None or position[0] < settled:
+        position = [settled, str(uuid.UUID(int=0))]
+    return position, False
+
+
+def changes_since(cursor, limit):
+    """
+    Bags and status updates changed after ``cursor``, at most ``limit`` of
+    each, with the cursor to continue from
+    """
+    baggage_position, update_id, archive_position = decode_cursor(cursor)
+
+    bags, more_bags = _page(Baggage.objects.all(), BAGGAGE_ORDERING, baggage_position, limit)
+    archived, more_archived = _page(
+        ArchivedBaggage.objects.only(*ARCHIVE_ORDERING),
+        ARCHIVE_ORDERING,
+        archive_position,
+        limit
+    )
+
+    updates = list(
+        StatusUpdate.objects.filter(id__gt=update_id)
+        .select_related('updated_by')
+        .order_by('id')[:limit + 1]
+    )
+    more_updates = len(updates) > limit
+    updates = updates[:limit]
+
+    # Hold the bag and archive positions back to the settle window, see
+    # above. More rows only count once they have settled, or clients would
+    # fetch the same unsettled batch in a loop.
+    settled = timezone.now() - timedelta(seconds=change_sync_settings()['SETTLE_WINDOW'])
+    baggage_position, bags_settled = _settled_position(bags, 'updated_at', baggage_position, settled)
+    more_bags = more_bags and bags_settled
+    archive_position, archived_settled = _settled_position(archived, 'archived_at', archive_position, settled)
+    more_archived = more_archived and archived_settled
+    if updates:
+        update_id = updates[-1].id
+
+    return {
+        'baggage': bags,
+        'status_updates': updates,
+        'archived': [str(bag.id) for bag in archived],
+        'cursor': encode_cursor(baggage_position, update_id, archive_position),
+        'has_more': more_bags or more_updates or more_archived,
+    }
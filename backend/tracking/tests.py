@@ -1,3 +1,2104 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from base64 import urlsafe_b64encode
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import archive, broadcast, export, rfid, rollups, writer
+from .admission import CLOSE_TRY_AGAIN_LATER, get_gate
+from .bsm import ingest_bsm, iter_bsm_messages
+from .cache import StatusLookupCache, status_lookup_cache
+from .counters import counter_mismatches
+from .layers import UnixSocketChannelLayer
+from .models import ArchivedBaggage, Baggage, StatusCounter, StatusUpdate, ThroughputRollup, UserProfile
+from .qr import QRRenderQueue
+from .routers import ReplicaRouter
+from .routing import websocket_urlpatterns
+from .scans import MAX_BATCH_SIZE, ingest_scans
+from .serializers import BaggageSerializer
+from .search import legacy_search, search_baggage
+
+
+FAST_PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Keep the QR render pool out of tests, whose database is not shared with it
+ON_DEMAND_QR_RENDER = {**settings.QR_RENDER, 'MODE': 'on_demand'}
+
+# A plan step that reads a whole table without an index
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS, QR_RENDER=ON_DEMAND_QR_RENDER)
+class SeededAPITestCase(APITestCase):
+    """
+    Base class that loads a realistic dataset with the seed_baggage_data command
+    """
+    baggage_count = 60
+
+    @classmethod
+    def setUpTestData(cls):
+        random.seed(2024)
+        call_command('seed_baggage_data', baggage_count=cls.baggage_count, stdout=StringIO())
+        cls.staff = User.objects.get(username='staff1')
+        cls.passenger = User.objects.get(username='passenger1')
+        cls.baggage = (
+            Baggage.objects.filter(status_updates__status='LOADED')
+            .order_by('created_at')
+            .first()
+        )
+
+    def setUp(self):
+        status_lookup_cache.cache.clear()
+    
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+
+class ScannerFixtureMixin:
+    """
+    A staff user 'scanner' signed in on ``self.client`` and one bag on KL566.
+    Module singletons listed in ``fresh_singletons`` are reset for each test.
+    """
+    fresh_singletons = ()
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('scanner', password='scanner123', is_staff=True)
+        UserProfile.objects.create(user=self.staff, role='STAFF')
+        self.baggage = Baggage.objects.create(passenger_name='Jane Doe', flight_number='KL566')
+        self.token = str(RefreshToken.for_user(self.staff).access_token)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {self.token}'
+        for module, name in self.fresh_singletons:
+            patcher = mock.patch.object(module, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post_status(self, new_status):
+        return self.client.post(
+            reverse('update_baggage_status', args=[self.baggage.id]), {'status': new_status}
+        )
+
+
+class QueryCountTests(SeededAPITestCase):
+    """
+    Pin the number of queries every API route runs, independent of data size
+    """
+
+    def assertQueryCount(self, expected, method, url, data=None, **kwargs):
+        with self.assertNumQueries(expected):
+            response = getattr(self.client, method)(url, data, **kwargs)
+        self.assertLess(response.status_code, 500, response.content)
+        return response
+
+    def test_health(self):
+        self.assertQueryCount(0, 'get', reverse('health_check'))
+
+    def test_auth_routes(self):
+        self.assertQueryCount(2, 'post', reverse('token_obtain_pair'), {
+            'username': 'staff1', 'password': 'staff123'
+        })
+        self.assertQueryCount(2, 'post', reverse('staff_login'), {
+            'username': 'staff1', 'password': 'staff123'
+        })
+        refresh = RefreshToken.for_user(self.passenger)
+        self.assertQueryCount(0, 'post', reverse('token_refresh'), {'refresh': str(refresh)})
+        self.assertQueryCount(3, 'post', reverse('user_register'), {
+            'username': 'new-passenger',
+            'email': 'new@example.com',
+            'password': 'a-long-Passw0rd!',
+            'password_confirm': 'a-long-Passw0rd!',
+        })
+
+        self.authenticate(self.passenger)
+        self.assertQueryCount(2, 'get', reverse('user_info'))
+        self.assertQueryCount(3, 'get', reverse('user_profile'))
+        self.assertQueryCount(1, 'post', reverse('logout'))
+
+    def test_baggage_list_is_constant_in_page_size(self):
+        self.authenticate(self.staff)
+        url = reverse('baggage_list_create')
+        for page_size in (5, 50):
+            self.assertQueryCount(4, 'get', url, {'page_size': page_size})
+            self.assertQueryCount(3, 'get', url, {'page_size': page_size, 'fields': 'id,qr_code'})
+            self.assertQueryCount(4, 'get', url, {'page_size': page_size, 'status': 'LOADED'})
+            self.assertQueryCount(4, 'get', url, {'page_size': page_size, 'search': 'son'})
+            self.assertQueryCount(3, 'get', url, {'page_size': page_size, 'pagination': 'cursor'})
+
+    def test_baggage_create(self):
+        self.authenticate(self.staff)
+        self.assertQueryCount(7, 'post', reverse('baggage_list_create'), {
+            'passenger_name': 'Test Passenger',
+            'flight_number': 'KL566',
+        })
+
+    def test_baggage_reads(self):
+        detail_url = reverse('baggage_detail', args=[self.baggage.id])
+        response = self.assertQueryCount(3, 'get', detail_url)
+        self.assertQueryCount(1, 'get', detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        qr_url = reverse('baggage_by_qr', args=[self.baggage.qr_code])
+        response = self.assertQueryCount(3, 'get', qr_url)
+        self.assertQueryCount(0, 'get', qr_url)
+        self.assertQueryCount(0, 'get', qr_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertQueryCount(2, 'get', qr_url, {'fields': 'qr_code,current_status'})
+        self.assertQueryCount(2, 'get', reverse('baggage_by_qr', args=['UNKNOWN']))
+
+        self.authenticate(self.staff)
+        timeline_url = reverse('baggage_timeline', args=[self.baggage.id])
+        response = self.assertQueryCount(3, 'get', timeline_url)
+        self.assertQueryCount(2, 'get', timeline_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertQueryCount(3, 'get', timeline_url, {'pagination': 'cursor', 'page_size': 2})
+
+    def test_qr_image(self):
+        url = reverse('baggage_qr_image', args=[self.baggage.qr_code, 'svg'])
+        response = self.assertQueryCount(1, 'get', url)
+        self.assertQueryCount(0, 'get', url)
+        self.assertQueryCount(0, 'get', url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_status_update(self):
+        self.authenticate(self.staff)
+        self.assertQueryCount(11, 'post', reverse('update_baggage_status', args=[self.baggage.id]), {
+            'status': 'IN_FLIGHT',
+            'location': 'Gate 3',
+        })
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_batch_scans_are_constant_in_batch_size(self):
+        self.authenticate(self.staff)
+        bags = list(Baggage.objects.order_by('created_at'))
+        for size in (5, len(bags)):
+            scans = [{'qr_code': bag.qr_code, 'status': 'ARRIVED'} for bag in bags[:size]]
+            self.assertQueryCount(9, 'post', reverse('batch_scan_ingest'), {'scans': scans}, format='json')
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_bsm_ingest(self):
+        self.authenticate(self.staff)
+        telegrams = ''.join(
+            f'BSM\n.F/KL566/15OCT/AMS/Y\n.N/{7400000000 + index * 10}003\n.P/1DOE/JANE MS\nENDBSM\n'
+            for index in range(20)
+        )
+        self.assertQueryCount(11, 'post', reverse('bsm_ingest'), telegrams, content_type='text/plain')
+
+    def test_delta_sync_is_constant_in_batch_size(self):
+        self.authenticate(self.staff)
+        url = reverse('baggage_changes')
+        for limit in (5, 50):
+            response = self.assertQueryCount(4, 'get', url, {'limit': limit})
+            self.assertQueryCount(4, 'get', url, {'limit': limit, 'since': response.data['cursor']})
+
+    def test_rfid_reads_are_constant_in_batch_size(self):
+        self.authenticate(self.staff)
+        bags = list(Baggage.objects.order_by('created_at')[:50])
+        for index, bag in enumerate(bags):
+            bag.tag_number = f'{7400000000 + index:010d}'
+        Baggage.objects.bulk_update(bags, ['tag_number'])
+        with mock.patch.object(rfid, '_aggregator', None):
+            for location, size in (('SECURITY-BELT-1', 5), ('MAKEUP-BELT-1', 50)):
+                reads = [{'tag': bag.tag_number, 'location': location} for bag in bags[:size] for _ in range(3)]
+                self.assertQueryCount(9, 'post', reverse('rfid_read_ingest'), {'reads': reads}, format='json')
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_staff_routes(self):
+        self.authenticate(self.staff)
+        self.assertQueryCount(4, 'get', reverse('staff_dashboard_stats'))
+        self.assertQueryCount(4, 'get', reverse('staff_dashboard_stats'), {'flight_number': 'KL566'})
+        self.assertQueryCount(2, 'get', reverse('qr_render_status'))
+        self.assertQueryCount(2, 'get', reverse('status_cache_status'))
+        self.assertQueryCount(2, 'get', reverse('rfid_status'))
+        url = reverse('dwell_time_analytics')
+        self.assertQueryCount(3, 'get', url, {'group_by': 'flight,location,hour'})
+        self.assertQueryCount(2, 'get', url, {'group_by': 'flight,location,hour'})
+        self.assertQueryCount(3, 'get', reverse('throughput_analytics'), {'group_by': 'location,status'})
+
+
+class StatusCounterTests(SeededAPITestCase):
+    """
+    The dashboard counters follow the bags' stored statuses
+    """
+
+    def test_stale_instances_move_the_stored_status(self):
+        first = Baggage.objects.get(pk=self.baggage.pk)
+        second = Baggage.objects.get(pk=self.baggage.pk)
+        first.current_status = 'IN_FLIGHT'
+        first.save()
+        second.current_status = 'ARRIVED'
+        second.save()
+        self.assertEqual(counter_mismatches(), {})
+
+        stale = Baggage.objects.get(pk=self.baggage.pk)
+        first.current_status = 'LOADED'
+        first.save()
+        stale.delete()
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_migration_merges_null_and_blank_flights(self):
+        populate = import_module('tracking.migrations.0002_status_counter').populate_status_counters
+        Baggage.objects.create(passenger_name='No Flight', flight_number=None)
+        Baggage.objects.create(passenger_name='Blank Flight', flight_number='')
+        StatusCounter.objects.all().delete()
+        populate(apps, None)
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_impossible_date_is_rejected(self):
+        self.authenticate(self.staff)
+        response = self.client.get(reverse('staff_dashboard_stats'), {'date': '2024-02-30'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchScanTests(SeededAPITestCase):
+    """
+    Batch scans report a result per item and record the valid ones
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.staff)
+        self.url = reverse('batch_scan_ingest')
+        self.bags = list(Baggage.objects.exclude(current_status='ARRIVED').order_by('created_at')[:2])
+
+    def test_results_per_item_with_partial_failure(self):
+        first, second = self.bags
+        response = self.client.post(self.url, {'scans': [
+            {'qr_code': first.qr_code, 'status': 'ARRIVED', 'location': 'Belt 4'},
+            {'qr_code': 'BAG-UNKNOWN', 'status': 'ARRIVED'},
+            {'baggage_id': str(second.id), 'status': 'SIDEWAYS'},
+            {'status': 'ARRIVED'},
+            {'baggage_id': str(second.id), 'status': 'ARRIVED'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(response.data['failed'], 3)
+
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual(
+            [result['result'] for result in results],
+            ['updated', 'not_found', 'invalid', 'invalid', 'updated']
+        )
+        self.assertIn('status', results[2]['errors'])
+        self.assertIn('non_field_errors', results[3]['errors'])
+        self.assertEqual(results[0]['baggage_id'], str(first.id))
+
+        update = StatusUpdate.objects.get(pk=results[0]['status_update_id'])
+        self.assertEqual((update.baggage_id, update.location, update.updated_by), (first.id, 'Belt 4', self.staff))
+        for bag in self.bags:
+            bag.refresh_from_db()
+            self.assertEqual(bag.current_status, 'ARRIVED')
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_backdated_scan_is_recorded_without_moving_the_bag_back(self):
+        bag = self.bags[0]
+        now = timezone.now()
+        later = now + timedelta(days=1)
+        response = self.client.post(self.url, {'scans': [
+            {'baggage_id': str(bag.id), 'status': 'IN_FLIGHT', 'timestamp': later.isoformat()},
+        ]}, format='json')
+        self.assertEqual(response.data['updated'], 1)
+
+        # A delayed upload of a scan taken before the stored one
+        response = self.client.post(self.url, {'scans': [
+            {'baggage_id': str(bag.id), 'status': 'LOADED', 'timestamp': now.isoformat()},
+        ]}, format='json')
+        self.assertEqual(response.data['results'][0]['result'], 'updated')
+        bag.refresh_from_db()
+        self.assertEqual(bag.current_status, 'IN_FLIGHT')
+        self.assertEqual(bag.status_updates.order_by('-timestamp').first().status, 'IN_FLIGHT')
+        self.assertTrue(bag.status_updates.filter(status='LOADED', timestamp=now).exists())
+        self.assertEqual(counter_mismatches(), {})
+
+        # A newer scan still moves it on
+        ingest_scans([{'baggage_id': bag.id, 'status': 'ARRIVED', 'timestamp': later + timedelta(hours=1)}])
+        bag.refresh_from_db()
+        self.assertEqual(bag.current_status, 'ARRIVED')
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_batch_size_limit(self):
+        scan = {'qr_code': self.bags[0].qr_code, 'status': 'ARRIVED'}
+        response = self.client.post(self.url, {'scans': [scan] * (MAX_BATCH_SIZE + 1)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('scans', response.data)
+        self.assertEqual(self.client.post(self.url, {'scans': []}, format='json').status_code, 400)
+
+        response = self.client.post(self.url, {'scans': [scan] * MAX_BATCH_SIZE}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], MAX_BATCH_SIZE)
+
+    def test_staff_only(self):
+        self.authenticate(self.passenger)
+        scans = [{'qr_code': self.bags[0].qr_code, 'status': 'ARRIVED'}]
+        self.assertEqual(self.client.post(self.url, {'scans': scans}, format='json').status_code, 403)
+        self.assertFalse(StatusUpdate.objects.filter(baggage=self.bags[0], status='ARRIVED').exists())
+
+
+def telegram(*lines):
+    return '\n'.join(['BSM', *lines, 'ENDBSM', ''])
+
+
+class BSMParserTests(SimpleTestCase):
+    """
+    BSM telegrams are parsed into messages with expanded tag ranges
+    """
+
+    def parse(self, text):
+        return list(iter_bsm_messages(text.splitlines()))
+
+    def test_add_message(self):
+        message, = self.parse(
+            telegram('.V/1LEBB', '.F/KL566/15OCT/AMS/Y', '.N/0074123456002', '.P/1JOHNSON/ALICE MRS')
+        )
+        self.assertEqual(message.action, 'ADD')
+        self.assertEqual((message.flight_number, message.destination), ('KL566', 'AMS'))
+        self.assertEqual(message.tag_numbers, ['0074123456', '0074123457'])
+        self.assertEqual(message.passenger_name, 'Alice Johnson')
+
+    def test_tag_ranges(self):
+        message, = self.parse(telegram('.N/9999999998002', '.P/1DOE/JANE'))
+        self.assertEqual(message.tag_numbers, ['9999999998', '9999999999'])
+
+        # Past the largest 10-digit tag number
+        message, = self.parse(telegram('.N/9999999999002', '.P/1DOE/JANE'))
+        self.assertEqual(message.tag_numbers, [])
+        self.assertFalse(message.is_valid)
+
+        message, = self.parse(telegram('.N/12345', '.P/1DOE/JANE'))
+        self.assertEqual(message.tag_numbers, [])
+
+    def test_change_and_delete_actions(self):
+        changed, deleted = self.parse(
+            telegram('CHG', '.N/0074123456001', '.P/1DOE/JANE') + telegram('DEL', '.N/0074123456001')
+        )
+        self.assertEqual((changed.action, changed.flight_number), ('CHG', None))
+        self.assertEqual(deleted.action, 'DEL')
+        self.assertEqual(deleted.tag_numbers, ['0074123456'])
+
+
+@override_settings(QR_RENDER=ON_DEMAND_QR_RENDER)
+class BSMIngestTests(TestCase):
+    """
+    Ingesting BSM telegrams creates, changes and skips bags by tag number
+    """
+
+    def setUp(self):
+        status_lookup_cache.cache.clear()
+        ingest_bsm(telegram('.F/KL566/15OCT/AMS/Y', '.N/0074123456002', '.P/1JOHNSON/ALICE MRS').splitlines())
+
+    def test_change_updates_stored_bags(self):
+        stats = ingest_bsm((
+            telegram('CHG', '.F/KL570/15OCT/JFK/Y', '.N/0074123456001', '.P/1JOHNSON/ALICE MRS')
+            + telegram('.F/KL566/15OCT/AMS/Y', '.N/0074123457001', '.P/1JOHNSON/ALICE MRS')
+        ).splitlines())
+        self.assertEqual(stats, {'messages': 2, 'created': 0, 'updated': 1, 'duplicates': 1, 'skipped': 0})
+        changed = Baggage.objects.get(tag_number='0074123456')
+        self.assertEqual((changed.flight_number, changed.destination), ('KL570', 'JFK'))
+        self.assertEqual(Baggage.objects.get(tag_number='0074123457').flight_number, 'KL566')
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_change_of_an_unknown_tag_creates_it(self):
+        stats = ingest_bsm(
+            telegram('CHG', '.F/KL570/15OCT/JFK/Y', '.N/0074123999001', '.P/1DOE/JANE MS').splitlines()
+        )
+        self.assertEqual((stats['created'], stats['updated']), (1, 0))
+        self.assertEqual(Baggage.objects.get(tag_number='0074123999').passenger_name, 'Jane Doe')
+
+    def test_change_within_one_chunk(self):
+        stats = ingest_bsm((
+            telegram('.F/KL566/15OCT/AMS/Y', '.N/0074124000001', '.P/1DOE/JANE MS')
+            + telegram('CHG', '.F/KL570/15OCT/JFK/Y', '.N/0074124000001', '.P/1DOE/JANE MS')
+        ).splitlines())
+        self.assertEqual((stats['created'], stats['updated'], stats['duplicates']), (1, 0, 0))
+        self.assertEqual(Baggage.objects.get(tag_number='0074124000').flight_number, 'KL570')
+
+    def test_delete_is_skipped(self):
+        stats = ingest_bsm(
+            telegram('DEL', '.F/KL566/15OCT/AMS/Y', '.N/0074123456002', '.P/1JOHNSON/ALICE MRS').splitlines()
+        )
+        self.assertEqual((stats['skipped'], stats['created']), (1, 0))
+        self.assertEqual(Baggage.objects.filter(tag_number__in=['0074123456', '0074123457']).count(), 2)
+
+
+class SearchTests(SeededAPITestCase):
+    """
+    Indexed search finds what the unindexed filters find, ranked by relevance
+    """
+
+    def search(self, term):
+        return list(search_baggage(Baggage.objects.all(), term))
+
+    def test_same_matches_as_unindexed_search(self):
+        bag = Baggage.objects.exclude(passenger_email=None).first()
+        terms = ['son', 'SON', bag.qr_code.lower(), bag.flight_number, bag.passenger_email.split('@')[0], 'zzzz', 'a']
+        for term in terms:
+            expected = set(legacy_search(Baggage.objects.all(), term))
+            self.assertEqual(set(self.search(term)), expected, term)
+
+    def test_ranked_by_relevance_then_newest(self):
+        now = timezone.now()
+        both = Baggage.objects.create(
+            passenger_name='Quixote Zed', passenger_email='quixote@example.com', created_at=now - timedelta(days=2)
+        )
+        older = Baggage.objects.create(passenger_name='Ann Quixote', created_at=now - timedelta(days=1))
+        newer = Baggage.objects.create(passenger_name='Ann Quixote', created_at=now)
+        self.assertEqual(self.search('quixote'), [both, newer, older])
+
+    def test_common_term_runs_the_index_query_once(self):
+        # Every seeded email shares its domain, so the term matches most bags
+        domain = Baggage.objects.exclude(passenger_email=None).first().passenger_email.split('@')[1]
+        expected = legacy_search(Baggage.objects.all(), domain)
+        self.assertGreater(expected.count(), 30)
+        queryset = search_baggage(Baggage.objects.all(), domain)
+        self.assertEqual(str(queryset.query).count('MATCH'), 1)
+        self.assertEqual(queryset.count(), expected.count())
+        self.assertEqual(set(queryset[:10]) - set(expected), set())
+        # Still a QuerySet that composes and nests
+        self.assertEqual(
+            Baggage.objects.filter(id__in=queryset.filter(current_status='ARRIVED').values('id')).count(),
+            expected.filter(current_status='ARRIVED').count()
+        )
+
+        self.authenticate(self.staff)
+        response = self.client.get(reverse('baggage_list_create'), {'search': domain, 'fields': 'id'})
+        self.assertEqual(response.data['count'], expected.count())
+
+    def test_renumbered_rows_are_detected_and_repaired(self):
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE tracking_baggage SET rowid = rowid + 1000000 WHERE id = %s', [self.baggage.id.hex])
+        self.assertNotIn(self.baggage, self.search(self.baggage.qr_code))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_search_index', verify_only=True, stdout=StringIO())
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertIn(self.baggage, self.search(self.baggage.qr_code))
+        call_command('rebuild_search_index', verify_only=True, stdout=StringIO())
+
+
+class KeysetPaginationTests(SeededAPITestCase):
+    """
+    Cursor pages cover every row once, in order, whatever the ties
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.staff)
+        self.url = reverse('baggage_list_create')
+
+    def walk(self, url, params, key='results', direction='next'):
+        """Follow ``direction`` links from the first page; returns the pages' ids"""
+        response = self.client.get(url, params)
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append([row['id'] for row in response.data[key]])
+            if not response.data[direction]:
+                return pages, response
+            response = self.client.get(response.data[direction])
+
+    def cursor(self, payload):
+        return urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+    def test_pages_across_equal_created_at(self):
+        now = timezone.now()
+        bags = list(Baggage.objects.order_by('id'))
+        for index, bag in enumerate(bags):
+            Baggage.objects.filter(pk=bag.pk).update(created_at=now - timedelta(minutes=index % 3))
+        expected = [str(pk) for pk in Baggage.objects.order_by('-created_at', '-id').values_list('id', flat=True)]
+
+        pages, last = self.walk(self.url, {'pagination': 'cursor', 'page_size': 7})
+        self.assertEqual([row for page in pages for row in page], expected)
+        self.assertEqual([len(page) for page in pages], [7] * 8 + [4])
+
+        # Walking back from the last page gives the same pages in reverse
+        back = [pages[-1]]
+        response = last
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            back.append([row['id'] for row in response.data['results']])
+        self.assertEqual(back, pages[::-1])
+
+    def test_page_boundaries(self):
+        bags = [Baggage.objects.create(passenger_name=f'Boundary {index}', flight_number='PG100') for index in range(4)]
+        params = {'pagination': 'cursor', 'flight_number': 'PG100'}
+
+        pages, response = self.walk(self.url, {**params, 'page_size': 4})
+        self.assertEqual(len(pages), 1)
+        self.assertIsNone(response.data['previous'])
+
+        pages, response = self.walk(self.url, {**params, 'page_size': 3})
+        self.assertEqual([len(page) for page in pages], [3, 1])
+        self.assertIsNotNone(response.data['previous'])
+        self.assertEqual(set(pages[0] + pages[1]), {str(bag.id) for bag in bags})
+        self.assertEqual([row['id'] for row in self.client.get(response.data['previous']).data['results']], pages[0])
+
+    def test_timeline_pages_across_equal_timestamps(self):
+        bag = Baggage.objects.create(passenger_name='Tied Timeline')
+        timestamp = timezone.now()
+        updates = [
+            StatusUpdate.objects.create(baggage=bag, status=status, timestamp=timestamp, updated_by=self.staff)
+            for status in ('CHECKED_IN', 'SECURITY_CLEARED', 'LOADED', 'IN_FLIGHT', 'ARRIVED')
+        ]
+        pages, _ = self.walk(
+            reverse('baggage_timeline', args=[bag.id]), {'pagination': 'cursor', 'page_size': 2}, key='timeline'
+        )
+        self.assertEqual([row for page in pages for row in page], [update.id for update in updates])
+
+    def test_invalid_cursors(self):
+        timeline_url = reverse('baggage_timeline', args=[self.baggage.id])
+        for cursor in (
+            'not a cursor',
+            self.cursor({'p': ['2024-01-01T00:00:00+00:00'], 'r': False}),
+            self.cursor({'p': 'flat', 'r': False}),
+            self.cursor({'p': ['yesterday', 'not-a-uuid'], 'r': False}),
+        ):
+            self.assertEqual(self.client.get(self.url, {'cursor': cursor}).status_code, 404, cursor)
+            self.assertEqual(self.client.get(timeline_url, {'cursor': cursor}).status_code, 404, cursor)
+
+
+class SparseFieldsetTests(SeededAPITestCase):
+    """
+    ``?fields=`` and ``?include=timeline`` pick the fields of baggage responses
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.staff)
+        self.urls = [
+            reverse('baggage_detail', args=[self.baggage.id]),
+            reverse('baggage_by_qr', args=[self.baggage.qr_code]),
+        ]
+
+    def test_all_fields_by_default(self):
+        for url in self.urls:
+            data = self.client.get(url).data
+            self.assertEqual(list(data), BaggageSerializer.Meta.fields, url)
+            self.assertTrue(data['status_timeline'])
+
+    def test_requested_fields_only(self):
+        for url in self.urls:
+            data = self.client.get(url, {'fields': 'id, qr_code,current_status'}).data
+            self.assertEqual(set(data), {'id', 'qr_code', 'current_status'}, url)
+
+            data = self.client.get(url, {'fields': 'qr_code', 'include': 'timeline'}).data
+            self.assertEqual(set(data), {'qr_code', 'status_timeline'}, url)
+            self.assertEqual(len(data['status_timeline']), self.baggage.status_updates.count())
+
+        results = self.client.get(reverse('baggage_list_create'), {'fields': 'id'}).data['results']
+        self.assertTrue(results)
+        self.assertTrue(all(set(row) == {'id'} for row in results))
+
+    def test_unknown_fields_are_rejected(self):
+        for url in self.urls + [reverse('baggage_list_create')]:
+            response = self.client.get(url, {'fields': 'id,colour,size'})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.data['fields'], ['Unknown field: colour', 'Unknown field: size'])
+
+
+class StatusLookupCacheTests(SeededAPITestCase):
+    """
+    The public QR lookup is cached and invalidated by every write path
+    """
+
+    def lookup(self):
+        return self.client.get(reverse('baggage_by_qr', args=[self.baggage.qr_code])).json()
+
+    def test_status_update_invalidates(self):
+        self.assertEqual(self.lookup()['current_status'], self.baggage.current_status)
+        self.authenticate(self.staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_baggage_status', args=[self.baggage.id]), {'status': 'CHECKED_IN'})
+        data = self.lookup()
+        self.assertEqual(data['current_status'], 'CHECKED_IN')
+        self.assertEqual(data['status_timeline'][-1]['status'], 'CHECKED_IN')
+
+    def test_batch_scan_invalidates(self):
+        self.lookup()
+        self.authenticate(self.staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('batch_scan_ingest'), {
+                'scans': [{'qr_code': self.baggage.qr_code, 'status': 'SECURITY_CLEARED'}]
+            }, format='json')
+        self.assertEqual(self.lookup()['current_status'], 'SECURITY_CLEARED')
+
+    def test_model_save_invalidates(self):
+        self.lookup()
+        self.baggage.destination = 'Nairobi'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.baggage.save()
+        self.assertEqual(self.lookup()['destination'], 'Nairobi')
+
+
+class ConditionalGetTests(SeededAPITestCase):
+    """
+    Read endpoints answer polls for unchanged bags with 304 Not Modified
+    """
+
+    def urls(self):
+        return [
+            reverse('baggage_detail', args=[self.baggage.id]),
+            reverse('baggage_by_qr', args=[self.baggage.qr_code]),
+            reverse('baggage_timeline', args=[self.baggage.id]),
+        ]
+
+    def test_unchanged_bag_is_not_modified(self):
+        self.authenticate(self.staff)
+        for url in self.urls():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+
+            etag_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(etag_response.status_code, 304)
+            self.assertEqual(etag_response.content, b'')
+
+            date_response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(date_response.status_code, 304)
+
+    def test_status_update_changes_validators(self):
+        self.authenticate(self.staff)
+        etags = [self.client.get(url)['ETag'] for url in self.urls()]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_baggage_status', args=[self.baggage.id]), {'status': 'CHECKED_IN'})
+        for url, etag in zip(self.urls(), etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_rendered_qr_image_changes_validators(self):
+        self.authenticate(self.staff)
+        etags = [self.client.get(url)['ETag'] for url in self.urls()]
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        render_queue = QRRenderQueue(workers=1)
+        render_queue.start()
+        with override_settings(MEDIA_ROOT=media_root), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(render_queue.render_batch([self.baggage.id]), 1)
+        for url, etag in zip(self.urls(), etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+        response = self.client.get(reverse('baggage_by_qr', args=[self.baggage.qr_code]))
+        self.assertEqual(response.data['qr_code_status'], 'ready')
+
+    def test_unknown_qr_image_is_not_found(self):
+        url = reverse('baggage_qr_image', args=[self.baggage.qr_code, 'svg'])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(
+            reverse('baggage_qr_image', args=['UNKNOWN', 'svg']), HTTP_IF_NONE_MATCH='*'
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class QRImageTests(SeededAPITestCase):
+    """
+    Stored and on-demand tag images encode the same data
+    """
+
+    def test_stored_and_on_demand_images_match(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        render_queue = QRRenderQueue(workers=1)
+        render_queue.start()
+        with override_settings(MEDIA_ROOT=media_root):
+            render_queue.render_batch([self.baggage.id])
+            with Baggage.objects.get(pk=self.baggage.pk).qr_code_image.open('rb') as stored:
+                stored_png = stored.read()
+        response = self.client.get(reverse('baggage_qr_image', args=[self.baggage.qr_code, 'png']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response), stored_png)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """
+    Concurrent misses for one entry trigger a single rebuild
+    """
+
+    def test_concurrent_misses_build_once(self):
+        cache = StatusLookupCache()
+        cache.cache.clear()
+        builds = []
+        start = threading.Barrier(8)
+
+        def build():
+            builds.append(1)
+            time.sleep(0.05)
+            return {'current_status': 'LOADED'}
+
+        def lookup(results):
+            start.wait()
+            results.append(cache.get_or_build('QR-SINGLE', 'all', build))
+
+        results = []
+        threads = [threading.Thread(target=lookup, args=(results,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(results, [{'current_status': 'LOADED'}] * 8)
+        stats = cache.stats()
+        self.assertEqual(stats['misses'] + stats['hits'] + stats['coalesced'], 8)
+        self.assertEqual(stats['misses'], 1)
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_PASSWORD_HASHERS,
+    QR_RENDER=ON_DEMAND_QR_RENDER,
+    WEBSOCKET_BROADCAST={'ENABLED': True, 'COALESCE_WINDOW': 0.3},
+)
+class BroadcastTests(ScannerFixtureMixin, TransactionTestCase):
+    """
+    Committed status changes reach WebSocket subscribers, coalesced per bag
+    """
+
+    fresh_singletons = [(broadcast, '_publisher')]
+
+    async def test_burst_is_sent_once(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/baggage/{self.baggage.id}/'
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'connection_established')
+
+        for new_status in ('SECURITY_CLEARED', 'LOADED'):
+            response = await sync_to_async(self.post_status)(new_status)
+            self.assertEqual(response.status_code, 200)
+
+        event = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(event['type'], 'baggage_update')
+        self.assertEqual(event['data']['status'], 'LOADED')
+        self.assertEqual(event['data']['updated_by'], 'scanner')
+        self.assertEqual(event['coalesced'], 2)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.5))
+        await communicator.disconnect()
+
+    async def test_groups_holding_different_messages_of_a_bag(self):
+        sent = {}
+
+        class RecordingLayer:
+            async def group_send(self, group, event):
+                sent[group] = json.loads(event['text'])['data']['update_id']
+
+        # A flush ran between publishing update 1 to the flight and update 2 to the bag
+        publisher = broadcast.BroadcastPublisher(window=60)
+        publisher.publish('flight_KL1', {'baggage_id': 'x', 'update_id': 1})
+        publisher.publish('baggage_x', {'baggage_id': 'x', 'update_id': 2})
+        with mock.patch.object(broadcast, 'get_channel_layer', return_value=RecordingLayer()):
+            await publisher.flush()
+        self.assertEqual(sent, {'flight_KL1': 1, 'baggage_x': 2})
+
+    async def test_flight_and_bag_subscriptions(self):
+        other = await sync_to_async(Baggage.objects.create)(passenger_name='John Doe', flight_number='ET302')
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/subscriptions/?flights=kl566&token={self.token}'
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual(snapshot['flights'], ['KL566'])
+        self.assertEqual([bag['id'] for bag in snapshot['baggage']], [str(self.baggage.id)])
+
+        await communicator.send_json_to({'type': 'subscribe', 'bags': [str(other.id), 'not-a-uuid']})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual([bag['id'] for bag in snapshot['baggage']], [str(other.id)])
+
+        await sync_to_async(self.post_status)('LOADED')
+        event = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(event['data']['baggage_id'], str(self.baggage.id))
+
+        await communicator.send_json_to({'type': 'unsubscribe', 'flights': ['KL566']})
+        self.assertEqual((await communicator.receive_json_from())['flights'], [])
+        await sync_to_async(self.post_status)('IN_FLIGHT')
+        self.assertTrue(await communicator.receive_nothing(timeout=0.5))
+
+        await communicator.send_json_to({'type': 'unsubscribe', 'bags': [str(other.id).upper()]})
+        self.assertEqual((await communicator.receive_json_from())['bags'], [])
+        await communicator.disconnect()
+
+    async def test_flight_snapshot_ignores_case(self):
+        await Baggage.objects.filter(pk=self.baggage.pk).aupdate(flight_number='kl566')
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/subscriptions/?flights=Kl566&token={self.token}'
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot['flights'], ['KL566'])
+        self.assertEqual([bag['id'] for bag in snapshot['baggage']], [str(self.baggage.id)])
+
+        await sync_to_async(self.post_status)('LOADED')
+        event = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(event['data']['baggage_id'], str(self.baggage.id))
+        await communicator.disconnect()
+
+    async def test_flights_need_a_staff_token(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/subscriptions/?flights=kl566&bags={self.baggage.id}'
+        )
+        await communicator.connect()
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'type': 'error', 'message': 'Following flights requires a staff access token'}
+        )
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot['flights'], [])
+        self.assertEqual([bag['id'] for bag in snapshot['baggage']], [str(self.baggage.id)])
+
+        passenger = await sync_to_async(User.objects.create_user)('traveller', password='traveller123')
+        await sync_to_async(UserProfile.objects.create)(user=passenger, role='PASSENGER')
+        for token, reply in (
+            ('not-a-token', {'type': 'authentication_failed', 'message': 'Invalid token'}),
+            (str(RefreshToken.for_user(passenger).access_token),
+             {'type': 'authenticated', 'user': 'traveller', 'is_staff': False}),
+        ):
+            await communicator.send_json_to({'type': 'authenticate', 'token': token})
+            self.assertEqual(await communicator.receive_json_from(), reply)
+            await communicator.send_json_to({'type': 'subscribe', 'flights': ['KL566']})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+            self.assertEqual((await communicator.receive_json_from())['flights'], [])
+
+        await communicator.send_json_to({'type': 'authenticate', 'token': self.token})
+        self.assertTrue((await communicator.receive_json_from())['is_staff'])
+        await communicator.send_json_to({'type': 'subscribe', 'flights': ['KL566']})
+        self.assertEqual((await communicator.receive_json_from())['flights'], ['KL566'])
+        await communicator.disconnect()
+
+    def test_rolled_back_updates_are_not_sent(self):
+        baggage = Baggage.objects.get(pk=self.baggage.pk)
+        try:
+            with transaction.atomic():
+                StatusUpdate.objects.create(baggage=baggage, status='LOADED', updated_by=self.staff)
+                broadcast.publish_baggage_update(baggage, baggage.status_updates.get())
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(broadcast.get_publisher().stats()['published'], 0)
+
+
+@override_settings(QR_RENDER=ON_DEMAND_QR_RENDER)
+class ConnectionStormTests(TransactionTestCase):
+    """
+    Many sockets opening at once share snapshot reads and are shed, not failed,
+    when connection setup is saturated
+    """
+
+    def setUp(self):
+        self.baggage = Baggage.objects.create(passenger_name='Jane Doe', flight_number='KL566')
+
+    def communicator(self):
+        return WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/baggage/{self.baggage.id}/')
+
+    async def test_concurrent_connects_share_one_snapshot_read(self):
+        communicators = [self.communicator() for _ in range(20)]
+        results = await asyncio.gather(*(communicator.connect() for communicator in communicators))
+        self.assertTrue(all(connected for connected, _ in results))
+        for communicator in communicators:
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['type'], 'connection_established')
+            self.assertEqual(message['baggage']['id'], str(self.baggage.id))
+            await communicator.disconnect()
+
+        counters = get_gate().counters
+        self.assertEqual(counters['snapshot_reads'], 1)
+        self.assertEqual(counters['snapshot_hits'], 19)
+        self.assertEqual(counters['admitted'], 20)
+
+    @override_settings(WEBSOCKET_ADMISSION={'MAX_CONNECTING': 1, 'MAX_WAITING': 1, 'WAIT_TIMEOUT': 0.2})
+    async def test_overload_defers_then_sheds(self):
+        gate = get_gate()
+        self.assertTrue(await gate.admit())  # a connection stuck in setup
+
+        deferred, shed = self.communicator(), self.communicator()
+        deferring = asyncio.ensure_future(deferred.connect())
+        await asyncio.sleep(0.05)
+        connected, _ = await shed.connect()
+        self.assertTrue(connected)
+        self.assertEqual(await shed.receive_json_from(), {'type': 'overloaded', 'retry_after': 5})
+        self.assertEqual((await shed.receive_output())['code'], CLOSE_TRY_AGAIN_LATER)
+
+        gate.release()
+        connected, _ = await deferring
+        self.assertTrue(connected)
+        self.assertEqual((await deferred.receive_json_from())['type'], 'connection_established')
+        await deferred.disconnect()
+        self.assertEqual(gate.counters['deferred'], 1)
+        self.assertEqual(gate.counters['shed'], 1)
+
+    async def test_snapshot_is_dropped_on_update(self):
+        gate = get_gate()
+        communicator = self.communicator()
+        await communicator.connect()
+        await communicator.receive_json_from()
+
+        await sync_to_async(Baggage.objects.filter(pk=self.baggage.pk).update)(current_status='LOADED')
+        await communicator.send_json_to({'type': 'get_status'})
+        self.assertEqual((await communicator.receive_json_from())['baggage']['current_status'], 'CHECKED_IN')
+
+        await get_channel_layer().group_send(
+            broadcast.baggage_group_name(self.baggage.id), {'type': 'baggage_update', 'text': '{}'}
+        )
+        await communicator.receive_from()
+        await communicator.send_json_to({'type': 'get_status'})
+        self.assertEqual((await communicator.receive_json_from())['baggage']['current_status'], 'LOADED')
+        self.assertEqual(gate.counters['snapshot_reads'], 2)
+        await communicator.disconnect()
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_PASSWORD_HASHERS,
+    QR_RENDER=ON_DEMAND_QR_RENDER,
+    EVENT_STREAMS={'HEARTBEAT': 0.2, 'RETRY': 1000},
+)
+class EventStreamTests(ScannerFixtureMixin, TransactionTestCase):
+    """
+    Server-Sent Events streams of bag and flight status changes
+    """
+
+    fresh_singletons = [(broadcast, '_publisher')]
+
+    async def next_frame(self, response, timeout=2):
+        """The next frame other than a heartbeat, as {field: value}"""
+        while True:
+            chunk = await asyncio.wait_for(anext(response.streaming_content), timeout)
+            if chunk != b': heartbeat\n\n':
+                return dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+
+    async def test_bag_stream(self):
+        response = await self.async_client.get(reverse('baggage_events', args=[self.baggage.id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(await anext(response.streaming_content), b'retry: 1000\n\n')
+        snapshot = await self.next_frame(response)
+        self.assertEqual(snapshot['event'], 'snapshot')
+        self.assertEqual(json.loads(snapshot['data'])['current_status'], 'CHECKED_IN')
+
+        await sync_to_async(self.post_status)('LOADED')
+        frame = await self.next_frame(response)
+        update = await StatusUpdate.objects.aget(status='LOADED')
+        self.assertEqual(frame['event'], 'baggage_update')
+        self.assertEqual(frame['id'], str(update.id))
+        self.assertEqual(json.loads(frame['data'])['data']['status'], 'LOADED')
+
+        self.assertEqual(
+            await asyncio.wait_for(anext(response.streaming_content), 2), b': heartbeat\n\n'
+        )
+        await response.streaming_content.aclose()
+
+    async def test_resume_from_last_event_id(self):
+        for new_status in ('SECURITY_CLEARED', 'LOADED', 'IN_FLIGHT'):
+            await sync_to_async(self.post_status)(new_status)
+        first = await StatusUpdate.objects.filter(status='SECURITY_CLEARED').aget()
+
+        response = await self.async_client.get(
+            reverse('flight_events', args=['kl566']),
+            {'token': self.token},
+            headers={'Last-Event-ID': str(first.id)}
+        )
+        await anext(response.streaming_content)
+        replayed = [await self.next_frame(response) for _ in range(2)]
+        self.assertEqual(
+            [json.loads(frame['data'])['data']['status'] for frame in replayed], ['LOADED', 'IN_FLIGHT']
+        )
+        self.assertTrue(all(int(frame['id']) > first.id for frame in replayed))
+        await response.streaming_content.aclose()
+
+    async def test_flight_numbers_stored_in_lowercase(self):
+        await Baggage.objects.filter(pk=self.baggage.pk).aupdate(flight_number='kl566')
+        await sync_to_async(self.post_status)('LOADED')
+        update = await StatusUpdate.objects.aget(status='LOADED')
+
+        url = reverse('flight_events', args=['KL566'])
+
+        response = await self.async_client.get(url, {'token': self.token})
+        await anext(response.streaming_content)
+        snapshot = await self.next_frame(response)
+        self.assertEqual(snapshot['event'], 'snapshot')
+        self.assertEqual([bag['id'] for bag in json.loads(snapshot['data'])], [str(self.baggage.id)])
+        await response.streaming_content.aclose()
+
+        response = await self.async_client.get(
+            url, {'token': self.token}, headers={'Last-Event-ID': str(update.id - 1)}
+        )
+        await anext(response.streaming_content)
+        self.assertEqual((await self.next_frame(response))['id'], str(update.id))
+        await response.streaming_content.aclose()
+
+    async def test_unknown_bag(self):
+        response = await self.async_client.get(reverse('baggage_events', args=[uuid.uuid4()]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_flight_stream_is_staff_only(self):
+        url = reverse('flight_events', args=['KL566'])
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, {'token': 'not-a-token'})).status_code, 401)
+
+        passenger = await sync_to_async(User.objects.create_user)('traveller', password='traveller123')
+        await sync_to_async(UserProfile.objects.create)(user=passenger, role='PASSENGER')
+        token = RefreshToken.for_user(passenger).access_token
+        response = await self.async_client.get(url, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 403)
+
+        response = await self.async_client.get(url, headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        await response.streaming_content.aclose()
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_PASSWORD_HASHERS,
+    QR_RENDER=ON_DEMAND_QR_RENDER,
+    STATUS_GROUP_COMMIT={'ENABLED': True, 'MAX_DELAY': 0.05},
+)
+class GroupCommitTests(ScannerFixtureMixin, TransactionTestCase):
+    """
+    Status updates queued by concurrent requests are committed in groups
+    """
+
+    fresh_singletons = [(writer, '_writer')]
+
+    def setUp(self):
+        super().setUp()
+        self.bags = [Baggage.objects.create(passenger_name=f'Passenger {index}') for index in range(10)]
+
+    def test_writes_are_grouped(self):
+        futures = [
+            writer.get_writer().submit({'baggage_id': bag.id, 'status': 'LOADED'}, self.staff)
+            for bag in self.bags
+        ]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual({result['result'] for result in results}, {'updated'})
+        self.assertEqual(
+            sorted(result['status_update_id'] for result in results),
+            sorted(StatusUpdate.objects.values_list('id', flat=True))
+        )
+        self.assertEqual(Baggage.objects.filter(current_status='LOADED').count(), 10)
+        self.assertEqual(StatusUpdate.objects.filter(updated_by=self.staff).count(), 10)
+        self.assertLess(writer.get_writer().stats()['groups'], 10)
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_failed_group_is_retried_one_by_one(self):
+        def fail_on_bad_scans(scans):
+            if any(scan['status'] == 'BAD' for scan in scans):
+                raise ValueError('bad scan')
+            return ingest_scans(scans)
+
+        with mock.patch.object(writer, 'ingest_scans', side_effect=fail_on_bad_scans), \
+                self.assertLogs('tracking.writer', 'WARNING'):
+            good = writer.get_writer().submit({'baggage_id': self.bags[0].id, 'status': 'LOADED'})
+            bad = writer.get_writer().submit({'baggage_id': self.bags[1].id, 'status': 'BAD'})
+            self.assertEqual(good.result(timeout=5)['result'], 'updated')
+            with self.assertRaises(ValueError):
+                bad.result(timeout=5)
+        stats = writer.get_writer().stats()
+        self.assertEqual((stats['committed'], stats['failed']), (1, 1))
+
+    def test_status_update_view(self):
+        response = self.client.post(
+            reverse('update_baggage_status', args=[self.bags[0].id]), {'status': 'LOADED', 'location': 'Gate 3'}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        update = StatusUpdate.objects.get()
+        self.assertEqual(response.data['status_update']['id'], update.id)
+        self.assertEqual(response.data['status_update']['updated_by_name'], 'scanner')
+        self.assertEqual(response.data['baggage']['current_status'], 'LOADED')
+        self.assertEqual(update.location, 'Gate 3')
+        # The committed rows are returned, not the values sent to the writer
+        self.assertEqual(
+            parse_datetime(response.data['baggage']['updated_at']),
+            Baggage.objects.get(pk=self.bags[0].pk).updated_at
+        )
+        self.assertEqual(parse_datetime(response.data['status_update']['timestamp']), update.timestamp)
+
+    @override_settings(STATUS_GROUP_COMMIT={'ENABLED': True, 'TIMEOUT': 0.1})
+    def test_queued_write_is_cancelled_on_timeout(self):
+        url = reverse('update_baggage_status', args=[self.bags[0].id])
+        # Nothing takes writes off the queue
+        with mock.patch.object(writer.GroupCommitWriter, 'start'):
+            response = self.client.post(url, {'status': 'LOADED'})
+            self.assertEqual(response.status_code, 503, response.content)
+            self.assertEqual(writer.get_writer()._next_group(), [])
+        self.assertEqual(writer.get_writer().stats()['cancelled'], 1)
+        self.assertFalse(StatusUpdate.objects.exists())
+
+    @override_settings(STATUS_GROUP_COMMIT={'ENABLED': True, 'TIMEOUT': 0.1})
+    def test_write_in_progress_is_accepted_on_timeout(self):
+        release = threading.Event()
+
+        def slow_ingest(scans):
+            release.wait(5)
+            return ingest_scans(scans)
+
+        url = reverse('update_baggage_status', args=[self.bags[0].id])
+        with mock.patch.object(writer, 'ingest_scans', side_effect=slow_ingest):
+            response = self.client.post(url, {'status': 'LOADED'})
+            self.assertEqual(response.status_code, 202, response.content)
+            self.assertEqual(response.data['status_update']['status'], 'LOADED')
+            self.assertTrue(response.data['timeline'].endswith(
+                reverse('baggage_timeline', args=[self.bags[0].id])
+            ))
+            release.set()
+            deadline = time.monotonic() + 5
+            while writer.get_writer().stats()['committed'] < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        update = StatusUpdate.objects.get()
+        self.assertEqual(update.timestamp, response.data['status_update']['timestamp'])
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_PASSWORD_HASHERS,
+    QR_RENDER=ON_DEMAND_QR_RENDER,
+    REPLICA_ROUTING={'REPLICAS': ['replica'], 'STICKY_SECONDS': 5},
+)
+class ReplicaRoutingTests(ScannerFixtureMixin, TransactionTestCase):
+    """
+    Read-only views read from the replica, unless the client has just written
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        status_lookup_cache.cache.clear()
+
+    def queries_by_alias(self, method, url, data=None):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 400, response.content)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_the_replica(self):
+        for url in (
+            reverse('baggage_detail', args=[self.baggage.id]),
+            reverse('baggage_timeline', args=[self.baggage.id]),
+            reverse('staff_dashboard_stats'),
+            reverse('throughput_analytics'),
+        ):
+            primary, replica = self.queries_by_alias('get', url)
+            self.assertEqual(primary, 0, url)
+            self.assertGreater(replica, 0, url)
+
+        # Views that aren't marked read-only stay on the primary
+        primary, replica = self.queries_by_alias('get', reverse('baggage_list_create'))
+        self.assertEqual(replica, 0)
+
+    def test_cached_status_lookups_are_built_from_the_primary(self):
+        url = reverse('baggage_by_qr', args=[self.baggage.qr_code])
+        primary, replica = self.queries_by_alias('get', url)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        # The signed-in client's token is checked on the primary; the bag comes from the cache
+        self.assertEqual(self.queries_by_alias('get', url), (1, 0))
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        primary, replica = self.queries_by_alias(
+            'post', reverse('update_baggage_status', args=[self.baggage.id]), {'status': 'LOADED'}
+        )
+        self.assertEqual(replica, 0)
+        self.assertIn('primary_reads', self.client.cookies)
+
+        primary, replica = self.queries_by_alias('get', reverse('baggage_detail', args=[self.baggage.id]))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        self.client.cookies.clear()
+        primary, replica = self.queries_by_alias('get', reverse('baggage_detail', args=[self.baggage.id]))
+        self.assertEqual(primary, 0)
+
+    def test_migrations_skip_replicas(self):
+        self.assertFalse(ReplicaRouter().allow_migrate('replica', 'tracking'))
+        self.assertTrue(ReplicaRouter().allow_migrate('default', 'tracking'))
+
+
+def _echo_worker(path, reply_channel, ready):
+    """Another process that answers group messages on the reply channel"""
+    async def run():
+        layer = UnixSocketChannelLayer(path=path)
+        channel = await layer.new_channel()
+        await layer.group_add('echo', channel)
+        ready.set()
+        message = await layer.receive(channel)
+        await layer.send(reply_channel, {'type': 'echo.reply', 'text': message['text'], 'pid': os.getpid()})
+        await layer.close()
+
+    asyncio.run(run())
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    """
+    Channel layer conformance, plus delivery between processes
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+
+    def make_layer(self, **kwargs):
+        layer = UnixSocketChannelLayer(path=self.path, **kwargs)
+        self.addCleanup(asyncio.run, layer.close())
+        return layer
+
+    async def assertReceivesNothing(self, layer, channel):
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.1)
+
+    def test_refuses_a_shared_directory(self):
+        os.chmod(self.path, 0o777)
+        with self.assertRaises(ImproperlyConfigured):
+            asyncio.run(self.make_layer().new_channel())
+
+        link = os.path.join(tempfile.gettempdir(), f'layer-link-{os.getpid()}')
+        os.chmod(self.path, 0o700)
+        os.symlink(self.path, link)
+        self.addCleanup(os.unlink, link)
+        layer = UnixSocketChannelLayer(path=link)
+        with self.assertRaises(ImproperlyConfigured):
+            asyncio.run(layer.new_channel())
+
+    async def test_send_receive(self):
+        layer = self.make_layer()
+        await layer.send('test-channel-1', {'type': 'test.message', 'text': 'Ahoy-hoy!'})
+        message = await layer.receive('test-channel-1')
+        self.assertEqual(message, {'type': 'test.message', 'text': 'Ahoy-hoy!'})
+
+    async def test_send_capacity(self):
+        layer = self.make_layer(capacity=3)
+        for _ in range(3):
+            await layer.send('test-channel-1', {'type': 'test.message'})
+        with self.assertRaises(ChannelFull):
+            await layer.send('test-channel-1', {'type': 'test.message'})
+
+    async def test_channel_capacity_patterns(self):
+        layer = self.make_layer(capacity=1, channel_capacity={'big-*': 2})
+        await layer.send('big-channel', {'type': 'test.message'})
+        await layer.send('big-channel', {'type': 'test.message'})
+        with self.assertRaises(ChannelFull):
+            await layer.send('big-channel', {'type': 'test.message'})
+
+    async def test_process_local_send_receive(self):
+        layer = self.make_layer()
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'test.message', 'text': 'Local only please'})
+        self.assertEqual((await layer.receive(channel))['text'], 'Local only please')
+
+    async def test_multi_send_receive(self):
+        layer = self.make_layer()
+        for text in ('one', 'two', 'three'):
+            await layer.send('test-channel-3', {'type': 'message.' + text})
+        received = [(await layer.receive('test-channel-3'))['type'] for _ in range(3)]
+        self.assertEqual(received, ['message.one', 'message.two', 'message.three'])
+
+    async def test_groups_basic(self):
+        layer = self.make_layer()
+        channels = [await layer.new_channel() for _ in range(3)]
+        for channel in channels:
+            await layer.group_add('test-group', channel)
+        await layer.group_discard('test-group', channels[1])
+        await layer.group_send('test-group', {'type': 'message.1'})
+
+        self.assertEqual((await layer.receive(channels[0]))['type'], 'message.1')
+        self.assertEqual((await layer.receive(channels[2]))['type'], 'message.1')
+        await self.assertReceivesNothing(layer, channels[1])
+
+    async def test_groups_channel_full(self):
+        layer = self.make_layer(capacity=2)
+        channel = await layer.new_channel()
+        await layer.group_add('test-group', channel)
+        for _ in range(5):
+            await layer.group_send('test-group', {'type': 'message.1'})
+        self.assertEqual(layer.dropped, 3)
+
+    async def test_expiry_single(self):
+        layer = self.make_layer(expiry=0.1)
+        await layer.send('test-channel-1', {'type': 'message.1'})
+        await asyncio.sleep(0.2)
+        await self.assertReceivesNothing(layer, 'test-channel-1')
+
+    async def test_expiry_removes_from_groups(self):
+        layer = self.make_layer(expiry=0.1)
+        channel = await layer.new_channel()
+        await layer.group_add('test-group', channel)
+        await layer.group_send('test-group', {'type': 'message.1'})
+        await asyncio.sleep(0.2)
+        await layer.group_send('test-group', {'type': 'message.2'})
+        await self.assertReceivesNothing(layer, channel)
+
+    async def test_flush(self):
+        layer = self.make_layer()
+        channel = await layer.new_channel()
+        await layer.group_add('test-group', channel)
+        await layer.send('test-channel-1', {'type': 'message.1'})
+        await layer.flush()
+        await layer.group_send('test-group', {'type': 'message.2'})
+        await self.assertReceivesNothing(layer, 'test-channel-1')
+        await self.assertReceivesNothing(layer, channel)
+
+    async def test_receive_on_another_event_loop(self):
+        layer = self.make_layer()
+        channel = await layer.new_channel()
+        receiving = asyncio.ensure_future(layer.receive(channel))
+        await asyncio.sleep(0)
+        sender = threading.Thread(target=asyncio.run, args=(layer.send(channel, {'type': 'message.1'}),))
+        sender.start()
+        sender.join()
+        self.assertEqual((await asyncio.wait_for(receiving, 1))['type'], 'message.1')
+
+    async def test_group_send_between_layers(self):
+        first, second = self.make_layer(), self.make_layer()
+        first_channel, second_channel = await first.new_channel(), await second.new_channel()
+        await first.group_add('test-group', first_channel)
+        await second.group_add('test-group', second_channel)
+
+        await first.group_send('test-group', {'type': 'message.1', 'data': b'\x00\x01'})
+        self.assertEqual((await first.receive(first_channel))['data'], b'\x00\x01')
+        self.assertEqual((await asyncio.wait_for(second.receive(second_channel), 1))['data'], b'\x00\x01')
+
+        await first.send(second_channel, {'type': 'message.2'})
+        self.assertEqual((await asyncio.wait_for(second.receive(second_channel), 1))['type'], 'message.2')
+
+    async def test_dead_peer_is_removed(self):
+        layer = self.make_layer()
+        await layer.group_add('test-group', await layer.new_channel())
+        stale = os.path.join(self.path, 'gone.sock')
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        dead.bind(stale)
+        dead.close()
+
+        await layer.group_send('test-group', {'type': 'message.1'})
+        self.assertFalse(os.path.exists(stale))
+
+    async def test_group_send_between_processes(self):
+        layer = self.make_layer(peer_refresh=0)
+        reply_channel = await layer.new_channel()
+        context = multiprocessing.get_context('fork')
+        ready = context.Event()
+        worker = context.Process(target=_echo_worker, args=(self.path, reply_channel, ready))
+        worker.start()
+        self.addCleanup(worker.join, 5)
+        self.assertTrue(await sync_to_async(ready.wait)(5))
+
+        await layer.group_send('echo', {'type': 'echo.message', 'text': 'ping'})
+        reply = await asyncio.wait_for(layer.receive(reply_channel), 5)
+        self.assertEqual(reply['text'], 'ping')
+        self.assertEqual(reply['pid'], worker.pid)
+
+
+class DeltaSyncTests(SeededAPITestCase):
+    """
+    Bags and status updates changed after a cursor, in bounded batches
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.staff)
+        self.url = reverse('baggage_changes')
+
+    def sync(self, since=None, limit=None):
+        params = {key: value for key, value in (('since', since), ('limit', limit)) if value}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    @override_settings(CHANGE_SYNC={'SETTLE_WINDOW': 0})
+    def test_full_then_delta_sync(self):
+        bags, updates, cursor = set(), set(), None
+        while True:
+            changes = self.sync(cursor, limit=25)
+            self.assertLessEqual(len(changes['baggage']), 25)
+            bags.update(bag['id'] for bag in changes['baggage'])
+            updates.update(update['id'] for update in changes['status_updates'])
+            cursor = changes['cursor']
+            if not changes['has_more']:
+                break
+        self.assertEqual(len(bags), Baggage.objects.count())
+        self.assertEqual(len(updates), StatusUpdate.objects.count())
+        self.assertNotIn('status_timeline', self.sync(limit=1)['baggage'][0])
+
+        self.assertEqual(self.sync(cursor)['baggage'], [])
+        self.client.post(reverse('update_baggage_status', args=[self.baggage.id]), {'status': 'ARRIVED'})
+        changes = self.sync(cursor)
+        self.assertEqual([bag['id'] for bag in changes['baggage']], [str(self.baggage.id)])
+        self.assertEqual([update['status'] for update in changes['status_updates']], ['ARRIVED'])
+        self.assertEqual(changes['status_updates'][0]['baggage'], self.baggage.id)
+
+    def test_recent_changes_are_sent_again(self):
+        with self.settings(CHANGE_SYNC={'SETTLE_WINDOW': 0}):
+            cursor = self.sync(limit=500)['cursor']
+        self.client.post(reverse('update_baggage_status', args=[self.baggage.id]), {'status': 'ARRIVED'})
+
+        first = self.sync(cursor)
+        second = self.sync(first['cursor'])
+        self.assertEqual([bag['id'] for bag in second['baggage']], [str(self.baggage.id)])
+        self.assertEqual(second['status_updates'], [])
+        self.assertFalse(second['has_more'])
+
+    @override_settings(CHANGE_SYNC={'SETTLE_WINDOW': 0})
+    def test_archived_bags_are_sent_as_tombstones(self):
+        cursor = self.sync(limit=500)['cursor']
+        self.assertEqual(self.sync(cursor)['archived'], [])
+        bags = list(Baggage.objects.filter(current_status='ARRIVED')[:3])
+        Baggage.objects.filter(pk__in=[bag.pk for bag in bags]).update(
+            updated_at=timezone.now() - timedelta(days=31)
+        )
+        archive.archive_baggage()
+
+        archived, cursor_before = [], cursor
+        while True:
+            changes = self.sync(cursor, limit=2)
+            self.assertLessEqual(len(changes['archived']), 2)
+            archived.extend(changes['archived'])
+            cursor = changes['cursor']
+            if not changes['has_more']:
+                break
+        self.assertEqual(sorted(archived), sorted(str(bag.id) for bag in bags))
+        self.assertEqual(self.sync(cursor)['archived'], [])
+        self.assertEqual(len(self.sync(limit=500)['archived']), 3)
+        self.assertEqual(len(self.sync(cursor_before, limit=500)['archived']), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'since': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RfidAggregationTests(SeededAPITestCase):
+    """
+    Raw RFID reads are debounced per tag and location and recorded only as transitions
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(rfid, '_aggregator', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.authenticate(self.staff)
+        self.bag = Baggage.objects.create(passenger_name='Jane Doe', flight_number='KL566', tag_number='0074123456')
+
+    def post_reads(self, reads):
+        response = self.client.post(reverse('rfid_read_ingest'), {'reads': reads}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_duplicate_reads_become_one_transition(self):
+        reads = [{'tag': '0074123456', 'location': 'SECURITY-BELT-1'}] * 40
+        reads += [{'tag': '0074123456', 'location': 'UNKNOWN-PORTAL'}, {'tag': '0099999999', 'location': 'MAKEUP-BELT-1'}]
+        counts = self.post_reads(reads)
+        self.assertEqual(counts['reads_in'], 42)
+        self.assertEqual(counts['duplicates_dropped'], 39)
+        self.assertEqual(counts['unmapped_dropped'], 1)
+        self.assertEqual(counts['transitions_out'], 1)
+        self.assertEqual(counts['unknown_tags'], 1)
+        self.assertEqual(list(self.bag.status_updates.values_list('status', 'location')), [
+            ('SECURITY_CLEARED', 'SECURITY-BELT-1')
+        ])
+
+        # Still under the portal: nothing new reaches the database
+        counts = self.post_reads([{'tag': '0074123456', 'location': 'SECURITY-BELT-1'}] * 10)
+        self.assertEqual(counts['duplicates_dropped'], 10)
+        self.assertEqual(self.bag.status_updates.count(), 1)
+
+        stats = self.client.get(reverse('rfid_status')).data
+        self.assertEqual(stats['reads_in'], 52)
+        self.assertEqual(stats['transitions_out'], 1)
+        self.assertEqual(stats['duplicates_dropped'], 49)
+
+    @override_settings(RFID_AGGREGATION={**settings.RFID_AGGREGATION, 'WINDOW': 0})
+    def test_reads_after_the_window_that_change_nothing(self):
+        self.post_reads([{'tag': '0074123456', 'location': 'MAKEUP-BELT-1'}])
+        counts = self.post_reads([{'tag': '0074123456', 'location': 'MAKEUP-BELT-1'}])
+        self.assertEqual(counts['duplicates_dropped'], 0)
+        self.assertEqual(counts['unchanged'], 1)
+        self.assertEqual(self.bag.status_updates.count(), 1)
+        self.bag.refresh_from_db()
+        self.assertEqual(self.bag.current_status, 'LOADED')
+
+    def test_reads_are_debounced_on_their_timestamps(self):
+        aggregator = rfid.ReadAggregator(window=30, readers={'BELT': 'LOADED'})
+        taken = timezone.now() - timedelta(minutes=10)
+        # One upload with two passes under the portal, out of order
+        reads = [
+            {'tag': '0074123456', 'location': 'BELT', 'timestamp': taken + timedelta(seconds=seconds)}
+            for seconds in (100, 5, 0, 102, 20)
+        ]
+        scans, counts = aggregator.debounce(reads)
+        self.assertEqual([scan['timestamp'] for scan in scans], [taken, taken + timedelta(seconds=100)])
+        self.assertEqual(counts['duplicates_dropped'], 3)
+
+        # A live read is not a duplicate of reads taken minutes before
+        scans, _ = aggregator.debounce([{'tag': '0074123456', 'location': 'BELT'}])
+        self.assertEqual(len(scans), 1)
+        # ...and a delayed read taken right after it is
+        scans, _ = aggregator.debounce([{'tag': '0074123456', 'location': 'BELT', 'timestamp': timezone.now()}])
+        self.assertEqual(scans, [])
+
+    def test_read_map_is_bounded(self):
+        aggregator = rfid.ReadAggregator(max_tracked=2, readers={'BELT': 'LOADED'})
+        scans, counts = aggregator.debounce([{'tag': str(tag), 'location': 'BELT'} for tag in range(5)])
+        self.assertEqual(len(scans), 5)
+        self.assertEqual(counts['evicted'], 3)
+        self.assertEqual(aggregator.stats()['tracked'], 2)
+
+
+class ArchivalTests(SeededAPITestCase):
+    """
+    Bags long in a terminal status move to the archive and stay readable
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.arrived = list(Baggage.objects.filter(current_status='ARRIVED').order_by('created_at'))
+        self.assertGreater(len(self.arrived), 3)
+
+    def age(self, bags, days=31):
+        Baggage.objects.filter(pk__in=[bag.pk for bag in bags]).update(
+            updated_at=timezone.now() - timedelta(days=days)
+        )
+
+    def test_moves_old_terminal_bags_with_their_timelines(self):
+        in_transit = Baggage.objects.exclude(current_status='ARRIVED').first()
+        self.age(self.arrived[:-1])
+        self.age([in_transit])
+        self.age(self.arrived[-1:], days=5)
+        hot_count = Baggage.objects.count()
+        update_count = StatusUpdate.objects.filter(baggage__in=self.arrived[:-1]).count()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_baggage', days=30, batch_size=2, stdout=StringIO())
+
+        archived_ids = set(ArchivedBaggage.objects.values_list('id', flat=True))
+        self.assertEqual(archived_ids, {bag.id for bag in self.arrived[:-1]})
+        self.assertEqual(Baggage.objects.count(), hot_count - len(archived_ids))
+        self.assertFalse(StatusUpdate.objects.filter(baggage_id__in=archived_ids).exists())
+        self.assertTrue(Baggage.objects.filter(pk=in_transit.pk).exists())
+        self.assertTrue(Baggage.objects.filter(pk=self.arrived[-1].pk).exists())
+        self.assertEqual(
+            sum(len(archived.get_status_timeline()) for archived in ArchivedBaggage.objects.all()),
+            update_count
+        )
+        self.assertEqual(counter_mismatches(), {})
+
+        # The search index lost the archived bags with them
+        self.authenticate(self.staff)
+        response = self.client.get(reverse('baggage_list_create'), {'search': self.arrived[0].qr_code})
+        self.assertEqual(response.data['count'], 0)
+
+    def test_lookups_fall_back_to_the_archive(self):
+        bag = self.arrived[0]
+        detail_url = reverse('baggage_detail', args=[bag.id])
+        qr_url = reverse('baggage_by_qr', args=[bag.qr_code])
+        before = self.client.get(detail_url).data
+        self.age([bag])
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_baggage()
+
+        for url in (detail_url, qr_url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['id'], before['id'])
+            self.assertEqual(response.data['current_status'], 'ARRIVED')
+            self.assertEqual(response.data['status_timeline'], before['status_timeline'])
+            self.assertIn('archived_at', response.data)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.get(qr_url, {'fields': 'qr_code,current_status'})
+        self.assertEqual(response.data, {'qr_code': bag.qr_code, 'current_status': 'ARRIVED'})
+        self.assertEqual(self.client.get(reverse('baggage_qr_image', args=[bag.qr_code, 'svg'])).status_code, 200)
+
+        with self.assertNumQueries(2):
+            self.client.get(detail_url)
+        with self.assertNumQueries(0):
+            self.client.get(qr_url)
+
+    def test_dry_run(self):
+        self.age(self.arrived)
+        out = StringIO()
+        call_command('archive_baggage', dry_run=True, stdout=out)
+        self.assertIn(f'{len(self.arrived)} bags', out.getvalue())
+        self.assertFalse(ArchivedBaggage.objects.exists())
+
+    def test_batch_with_a_changed_bag_is_rolled_back(self):
+        self.age(self.arrived)
+        copy = archive.archived_copy
+
+        def copy_after_a_write(baggage):
+            # A scan lands between reading the batch and moving it
+            Baggage.objects.filter(pk=self.arrived[0].pk).update(updated_at=timezone.now())
+            return copy(baggage)
+
+        ids = [bag.id for bag in self.arrived]
+        with mock.patch.object(archive, 'archived_copy', copy_after_a_write):
+            with self.assertRaises(archive.ArchiveConflict):
+                archive.archive_batch(ids)
+        self.assertFalse(ArchivedBaggage.objects.exists())
+        self.assertEqual(Baggage.objects.filter(id__in=ids).count(), len(ids))
+        self.assertEqual(counter_mismatches(), {})
+
+    def test_stored_qr_images_are_deleted_on_commit(self):
+        bag = self.arrived[0]
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        render_queue = QRRenderQueue(workers=1)
+        render_queue.start()
+        with override_settings(MEDIA_ROOT=media_root):
+            render_queue.render_batch([bag.id])
+            image = Baggage.objects.get(pk=bag.pk).qr_code_image.path
+            self.assertTrue(os.path.exists(image))
+            self.age([bag])
+            with self.captureOnCommitCallbacks() as callbacks:
+                archive.archive_baggage()
+            # Still there until the batch commits
+            self.assertTrue(os.path.exists(image))
+            for callback in callbacks:
+                callback()
+        self.assertFalse(os.path.exists(image))
+        self.assertTrue(ArchivedBaggage.objects.filter(pk=bag.pk).exists())
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class DwellTimeAnalyticsTests(SeededAPITestCase):
+    """
+    Per-stage dwell-time percentiles match a row-by-row computation
+    """
+
+    day = date(2024, 3, 5)
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.staff)
+        self.url = reverse('dwell_time_analytics')
+        start = timezone.make_aware(datetime(2024, 3, 5))
+        rng = random.Random(7)
+        self.expected = {('CHECKED_IN', 'SECURITY_CLEARED'): [], ('SECURITY_CLEARED', 'LOADED'): []}
+        self.by_flight_hour = {}
+
+        for index in range(40):
+            flight = 'ZZ100' if index % 2 else 'ZZ200'
+            checked_in = start + timedelta(hours=9 + index % 3, minutes=rng.randint(0, 59))
+            bag = Baggage.objects.create(passenger_name=f'Passenger {index}', flight_number=flight)
+            StatusUpdate.objects.create(baggage=bag, status='CHECKED_IN', timestamp=checked_in, location='Desk 1')
+            if index % 5 == 4:
+                continue
+            security = rng.randint(60, 3600)
+            cleared = checked_in + timedelta(seconds=security)
+            StatusUpdate.objects.create(baggage=bag, status='SECURITY_CLEARED', timestamp=cleared, location='Security')
+            # A repeated scan does not restart the stage
+            StatusUpdate.objects.create(
+                baggage=bag, status='SECURITY_CLEARED', timestamp=cleared + timedelta(minutes=5), location='Security'
+            )
+            loading = rng.randint(600, 7200)
+            StatusUpdate.objects.create(
+                baggage=bag, status='LOADED', timestamp=cleared + timedelta(seconds=loading), location='Bay 2'
+            )
+            self.expected[('CHECKED_IN', 'SECURITY_CLEARED')].append(security)
+            self.expected[('SECURITY_CLEARED', 'LOADED')].append(loading)
+            self.by_flight_hour.setdefault((flight, 9 + index % 3), []).append(security)
+
+        # Checked in the day before: its stages do not count for this day
+        late = Baggage.objects.create(passenger_name='Late', flight_number='ZZ100')
+        StatusUpdate.objects.create(baggage=late, status='CHECKED_IN', timestamp=start - timedelta(minutes=30))
+        StatusUpdate.objects.create(baggage=late, status='SECURITY_CLEARED', timestamp=start + timedelta(minutes=30))
+
+    def report(self, **params):
+        response = self.client.get(self.url, {'date': self.day.isoformat(), **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_overall_percentiles(self):
+        report = self.report()
+        for stage in report['stages']:
+            values = self.expected[(stage['from'], stage['to'])]
+            self.assertEqual(stage['overall']['count'], len(values))
+            self.assertAlmostEqual(stage['overall']['mean_seconds'], sum(values) / len(values), places=0)
+            for p in report['percentiles']:
+                self.assertAlmostEqual(stage['overall'][f'p{p}_seconds'], percentile(values, p), places=0)
+
+    def test_grouped_by_flight_and_hour(self):
+        stage = self.report(group_by='flight,hour')['stages'][0]
+        groups = {
+            (group['flight_number'], group['hour'].hour): group for group in stage['groups']
+        }
+        self.assertEqual(set(groups), set(self.by_flight_hour))
+        for key, values in self.by_flight_hour.items():
+            self.assertEqual(groups[key]['count'], len(values))
+            self.assertAlmostEqual(groups[key]['p50_seconds'], percentile(values, 50), places=0)
+
+        by_location = self.report(group_by='location', flight_number='ZZ100')['stages'][1]['groups']
+        self.assertEqual([group['location'] for group in by_location], ['Security'])
+
+    def test_reports_are_cached_per_bucket(self):
+        first = self.report()
+        StatusUpdate.objects.filter(status='LOADED').delete()
+        self.assertEqual(self.report(), first)
+        status_lookup_cache.cache.clear()
+        self.assertIsNone(self.report()['stages'][1]['overall'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'group_by': 'gate'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'date': '05/03/2024'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'date': '2024-02-30'}).status_code, 400)
+        self.authenticate(self.passenger)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class ThroughputRollupTests(SeededAPITestCase):
+    """
+    Rollups advanced from the watermark match a recount of the status updates
+    """
+
+    def stored(self):
+        return {
+            (row.hour, row.location, row.status, row.flight_number): row.count
+            for row in ThroughputRollup.objects.all()
+        }
+
+    def recount(self):
+        return rollups.hourly_counts(StatusUpdate.objects.all())
+
+    def test_advances_incrementally(self):
+        self.assertEqual(rollups.advance_rollups(batch_size=25), StatusUpdate.objects.count())
+        self.assertEqual(self.stored(), self.recount())
+        self.assertEqual(rollups.advance_rollups(), 0)
+
+        bags = list(Baggage.objects.order_by('created_at')[:10])
+        ingest_scans([{'baggage_id': bag.id, 'status': 'ARRIVED', 'location': 'Carousel 2'} for bag in bags])
+        StatusUpdate.objects.create(baggage=self.baggage, status='IN_FLIGHT')
+        self.assertEqual(rollups.advance_rollups(), 11)
+        self.assertEqual(self.stored(), self.recount())
+
+        self.assertEqual(rollups.rebuild_rollups(), len(self.recount()))
+        self.assertEqual(self.stored(), self.recount())
+
+    def test_watermark_moved_by_another_process(self):
+        rollups.advance_rollups()
+        before = self.stored()
+        with mock.patch.object(rollups, 'watermark', side_effect=[0, rollups.watermark()]):
+            self.assertEqual(rollups.advance_rollups(), 0)
+        self.assertEqual(self.stored(), before)
+
+    def test_rebuild_since_keeps_earlier_hours(self):
+        rollups.advance_rollups()
+        before = self.stored()
+        since = timezone.now() - timedelta(days=1)
+        StatusUpdate.objects.filter(timestamp__lt=since - timedelta(hours=1)).delete()
+        StatusUpdate.objects.create(baggage=self.baggage, status='IN_FLIGHT', location='Gate 3')
+
+        call_command('rebuild_throughput_rollups', since=since.date().isoformat(), stdout=StringIO())
+        hour = since.replace(minute=0, second=0, microsecond=0)
+        cutoff = timezone.make_aware(datetime.combine(since.date(), datetime.min.time()))
+        stored = self.stored()
+        recount = self.recount()
+        self.assertEqual(
+            {key: count for key, count in stored.items() if key[0] < cutoff},
+            {key: count for key, count in before.items() if key[0] < cutoff}
+        )
+        self.assertEqual(
+            {key: count for key, count in stored.items() if key[0] >= hour},
+            {key: count for key, count in recount.items() if key[0] >= hour}
+        )
+
+    def test_endpoint_only_reads(self):
+        self.authenticate(self.staff)
+        url = reverse('throughput_analytics')
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in captured), captured.captured_queries)
+        self.assertFalse(ThroughputRollup.objects.exists())
+
+        call_command('rebuild_throughput_rollups', catch_up=True, stdout=StringIO())
+        before = self.stored()
+        StatusUpdate.objects.create(baggage=self.baggage, status='IN_FLIGHT')
+        self.client.get(url)
+        self.assertEqual(self.stored(), before)
+        call_command('rebuild_throughput_rollups', catch_up=True, stdout=StringIO())
+        self.assertEqual(self.stored(), self.recount())
+
+    def test_catch_up_interval(self):
+        out = StringIO()
+        with mock.patch('time.sleep', side_effect=[None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('rebuild_throughput_rollups', catch_up=True, interval=60, stdout=out)
+        self.assertEqual(out.getvalue().count('Folded'), 2)
+        self.assertEqual(self.stored(), self.recount())
+        with self.assertRaises(CommandError):
+            call_command('rebuild_throughput_rollups', interval=60, stdout=StringIO())
+
+    def test_invalid_since(self):
+        for since in ('yesterday', '2024-02-30'):
+            with self.assertRaises(CommandError):
+                call_command('rebuild_throughput_rollups', since=since, stdout=StringIO())
+
+    def test_endpoint(self):
+        self.authenticate(self.staff)
+        url = reverse('throughput_analytics')
+        rollups.advance_rollups()
+        start = timezone.now() - timedelta(days=4)
+        response = self.client.get(url, {'start': start.isoformat(), 'group_by': 'location'})
+        self.assertEqual(response.status_code, 200, response.content)
+        buckets = response.data['buckets']
+        self.assertEqual(sum(bucket['count'] for bucket in buckets), StatusUpdate.objects.count())
+        self.assertEqual(set(buckets[0]), {'hour', 'location', 'count'})
+
+        response = self.client.get(url, {'start': start.isoformat(), 'location': 'Security Checkpoint'})
+        self.assertEqual(
+            sum(bucket['count'] for bucket in response.data['buckets']),
+            StatusUpdate.objects.filter(location='Security Checkpoint').count()
+        )
+        self.assertEqual({bucket['status'] for bucket in response.data['buckets']}, {'SECURITY_CLEARED'})
+
+        self.assertEqual(self.client.get(url, {'group_by': 'gate'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2024-01-01', 'end': '2024-06-01'}).status_code, 400)
+
+
+@override_settings(BAGGAGE_EXPORT={'CHUNK_SIZE': 7, 'BUFFER_SIZE': 512})
+class ExportTests(SeededAPITestCase):
+    """
+    Streamed CSV and NDJSON exports cover every bag and status update in range
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.staff).access_token}'}
+
+    async def export(self, **params):
+        response = await self.async_client.get(reverse('baggage_export'), params, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = [chunk async for chunk in response.streaming_content]
+        return response, chunks
+
+    async def test_csv(self):
+        bag = await Baggage.objects.aget(pk=self.baggage.pk)
+        bag.passenger_name = '=HYPERLINK("http://example.com")'
+        await bag.asave(update_fields=['passenger_name'])
+
+        response, chunks = await self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="baggage-all.csv"', response['Content-Disposition'])
+        self.assertGreater(len(chunks), 1)
+        rows = list(csv.DictReader(StringIO(b''.join(chunks).decode())))
+
+        update_count = await StatusUpdate.objects.acount()
+        bare_count = await Baggage.objects.filter(status_updates__isnull=True).acount()
+        self.assertEqual(len(rows), update_count + bare_count)
+        self.assertEqual(
+            {row['update_id'] for row in rows if row['update_id']},
+            {str(pk) async for pk in StatusUpdate.objects.values_list('id', flat=True)}
+        )
+        names = {row['passenger_name'] for row in rows if row['id'] == str(bag.id)}
+        self.assertEqual(names, {"'" + bag.passenger_name})
+
+    async def test_ndjson_with_range_and_archive(self):
+        bags = [bag async for bag in Baggage.objects.order_by('created_at')]
+        start, end = bags[5].created_at, bags[-5].created_at
+        archived = bags[10]
+        await Baggage.objects.filter(pk=archived.pk).aupdate(
+            current_status='ARRIVED', updated_at=timezone.now() - timedelta(days=31)
+        )
+        timeline_length = await StatusUpdate.objects.filter(baggage=archived).acount()
+        await sync_to_async(archive.archive_batch)([archived.pk])
+
+        response, chunks = await self.export(
+            **{'format': 'ndjson', 'from': start.isoformat(), 'to': end.isoformat()}
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual(
+            {line['id'] for line in lines},
+            {str(bag.id) for bag in bags if start <= bag.created_at < end}
+        )
+        self.assertEqual(lines[-1]['id'], str(archived.id))
+        self.assertTrue(lines[-1]['archived'])
+        self.assertEqual(len(lines[-1]['status_timeline']), timeline_length)
+        self.assertFalse(any(line['archived'] for line in lines[:-1]))
+        first = lines[0]
+        live = await StatusUpdate.objects.filter(baggage_id=first['id']).acount()
+        self.assertEqual(len(first['status_timeline']), live)
+
+    async def test_invalid_requests(self):
+        url = reverse('baggage_export')
+        for params in ({'format': 'json'}, {'from': 'yesterday'}, {'from': '2024-06-01', 'to': '2024-01-01'}):
+            response = await self.async_client.get(url, params, headers=self.headers)
+            self.assertEqual(response.status_code, 400, params)
+        passenger_token = RefreshToken.for_user(self.passenger).access_token
+        response = await self.async_client.get(url, headers={'Authorization': f'Bearer {passenger_token}'})
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS, QR_RENDER=ON_DEMAND_QR_RENDER)
+class BulkSeedTests(TestCase):
+    """
+    Bulk seeding builds consistent bags, deterministically per seed
+    """
+
+    def seed(self, *args):
+        call_command(
+            'seed_baggage_data', '--bulk', '--baggage-count', '300', '--chunk-size', '70', '--days', '3',
+            *args, stdout=StringIO()
+        )
+        return {
+            bag.id: (bag.passenger_name, bag.flight_number, bag.current_status, bag.created_at, bag.updated_at)
+            for bag in Baggage.objects.all()
+        }
+
+    def test_bags_match_their_timelines(self):
+        now = timezone.now()
+        bags = self.seed()
+        self.assertEqual(len(bags), 300)
+        self.assertGreater(StatusUpdate.objects.count(), 600)
+        self.assertGreater(len({flight for _, flight, *_ in bags.values()}), 5)
+
+        for bag in Baggage.objects.with_timeline():
+            timeline = bag.get_status_timeline()
+            self.assertEqual(timeline[0].status, 'CHECKED_IN')
+            self.assertEqual(timeline[0].timestamp, bag.created_at)
+            self.assertEqual(timeline[-1].status, bag.current_status)
+            self.assertEqual(timeline[-1].timestamp, bag.updated_at)
+            self.assertLessEqual(bag.updated_at, now)
+            self.assertEqual(bag.qr_code, f'BAG-{str(bag.id)[:8].upper()}')
+        self.assertEqual(counter_mismatches(), {})
+        self.assertFalse(Baggage.objects.exclude(qr_code_image='').exclude(qr_code_image__isnull=True).exists())
+
+        bag = Baggage.objects.first()
+        self.assertIn(bag, search_baggage(Baggage.objects.all(), bag.qr_code))
+
+    def test_same_seed_same_bags(self):
+        # Seeded times count back from the current hour
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()):
+            first = self.seed('--seed', '7')
+            self.assertEqual(self.seed('--clear', '--seed', '7'), first)
+            self.assertEqual(counter_mismatches(), {})
+            self.assertNotEqual(set(self.seed('--clear', '--seed', '8')), set(first))
+
+
+class QueryPlanTests(SeededAPITestCase):
+    """
+    Fail when a hot query falls back to a full table scan
+    """
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite')
+
+    def assertNoFullScans(self, method, url, data=None, **kwargs):
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(url, data, **kwargs)
+        self.assertLess(response.status_code, 500, response.content)
+        self.assertNoFullScansIn(captured)
+
+    def assertNoFullScansIn(self, captured):
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                match = FULL_SCAN.match(step)
+                if match and not match.group(1).startswith('auth_'):
+                    self.fail(f'Full scan of {match.group(1)} in:\n{sql}\nPlan: {plan}')
+
+    def test_baggage_list(self):
+        self.authenticate(self.staff)
+        url = reverse('baggage_list_create')
+        self.assertNoFullScans('get', url)
+        self.assertNoFullScans('get', url, {'status': 'LOADED'})
+        self.assertNoFullScans('get', url, {'flight_number': 'KL566'})
+        self.assertNoFullScans('get', url, {'search': 'son'})
+        self.assertNoFullScans('get', url, {'pagination': 'cursor'})
+
+        cursor_page = self.client.get(url, {'pagination': 'cursor'}).json()
+        self.assertNoFullScans('get', cursor_page['next'])
+
+    def test_baggage_reads(self):
+        self.assertNoFullScans('get', reverse('baggage_detail', args=[self.baggage.id]))
+        self.assertNoFullScans('get', reverse('baggage_by_qr', args=[self.baggage.qr_code]))
+
+        self.authenticate(self.staff)
+        timeline_url = reverse('baggage_timeline', args=[self.baggage.id])
+        self.assertNoFullScans('get', timeline_url)
+        self.assertNoFullScans('get', timeline_url, {'pagination': 'cursor', 'page_size': 1})
+
+    def test_archived_reads(self):
+        bag = Baggage.objects.filter(current_status='ARRIVED').first()
+        Baggage.objects.filter(pk=bag.pk).update(updated_at=timezone.now() - timedelta(days=31))
+        archive.archive_baggage()
+        self.assertNoFullScans('get', reverse('baggage_detail', args=[bag.id]))
+        self.assertNoFullScans('get', reverse('baggage_by_qr', args=[bag.qr_code]))
+
+    def test_export(self):
+        async def consume(**params):
+            async for _ in export.export_stream('ndjson', **params):
+                pass
+
+        start = timezone.now() - timedelta(days=2)
+        for params in ({}, {'start': start}, {'start': start, 'end': timezone.now()}):
+            with CaptureQueriesContext(connection) as captured:
+                async_to_sync(consume)(**params)
+            self.assertGreaterEqual(len(captured), 3)
+            self.assertNoFullScansIn(captured)
+
+    def test_delta_sync(self):
+        self.authenticate(self.staff)
+        url = reverse('baggage_changes')
+        self.assertNoFullScans('get', url)
+        cursor = self.client.get(url, {'limit': 10}).data['cursor']
+        self.assertNoFullScans('get', url, {'since': cursor})
+
+    def test_writes(self):
+        self.authenticate(self.staff)
+        self.assertNoFullScans('post', reverse('update_baggage_status', args=[self.baggage.id]), {
+            'status': 'ARRIVED',
+        })
+        scans = [{'qr_code': bag.qr_code, 'status': 'ARRIVED'} for bag in Baggage.objects.all()[:20]]
+        self.assertNoFullScans('post', reverse('batch_scan_ingest'), {'scans': scans}, format='json')
+
+    def test_dashboard(self):
+        self.authenticate(self.staff)
+        self.assertNoFullScans('get', reverse('staff_dashboard_stats'))
+        self.assertNoFullScans('get', reverse('staff_dashboard_stats'), {'flight_number': 'KL566'})
+        self.assertNoFullScans('get', reverse('staff_dashboard_stats'), {'date': '2024-01-01'})
+        self.assertNoFullScans('get', reverse('dwell_time_analytics'), {'group_by': 'flight'})
+        self.assertNoFullScans('get', reverse('dwell_time_analytics'), {'flight_number': 'KL566'})
+        self.assertNoFullScans('get', reverse('throughput_analytics'))
+        self.assertNoFullScans('get', reverse('throughput_analytics'), {'location': 'Security Checkpoint'})
+        self.assertNoFullScans('get', reverse('throughput_analytics'), {'flight_number': 'KL566'})
 
-# Create your tests here.
@@ -0,0 +1,39 @@
+"""
+Access token checks for the streaming endpoints
+
+WebSocket and EventSource clients cannot set an Authorization header, so
+the streams that need a staff user also take the JWT access token from a
+``token`` query parameter, and sockets from an ``authenticate`` message.
+"""
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from .models import UserProfile
+
+
+def user_for_token(raw_token):
+    """The active user a JWT access token belongs to, or None"""
+    if not raw_token:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, TokenError):
+        return None
+
+
+def bearer_token(request):
+    """Access token from the Authorization header or the ``token`` query parameter"""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):].strip()
+    return request.GET.get('token')
+
+
+def is_staff_member(user):
+    """Whether ``user`` is signed in with a staff profile"""
+    if user is None or not user.is_authenticated:
+        return False
+    try:
+        return user.profile.is_staff_member
+    except UserProfile.DoesNotExist:
+        return False
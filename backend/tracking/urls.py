@@ -12,9 +12,22 @@ from .views import (
     BaggageListCreateView,
     BaggageDetailView,
     baggage_status_by_qr,
+    baggage_qr_image,
     update_baggage_status,
+    batch_scan_ingest,
+    bsm_ingest,
+    rfid_read_ingest,
     baggage_timeline,
+    baggage_changes,
+    baggage_events,
+    flight_events,
     staff_dashboard_stats,
+    qr_render_status,
+    status_cache_status,
+    rfid_status,
+    dwell_time_analytics,
+    throughput_analytics,
+    baggage_export,
     health_check
 )
 
@@ -35,9 +48,22 @@ urlpatterns = [
     path('baggage/', BaggageListCreateView.as_view(), name='baggage_list_create'),
     path('baggage/<uuid:id>/', BaggageDetailView.as_view(), name='baggage_detail'),
     path('baggage/qr/<str:qr_code>/', baggage_status_by_qr, name='baggage_by_qr'),
+    path('baggage/qr/<str:qr_code>/image.<str:image_format>', baggage_qr_image, name='baggage_qr_image'),
     path('baggage/<uuid:baggage_id>/update/', update_baggage_status, name='update_baggage_status'),
     path('baggage/<uuid:baggage_id>/timeline/', baggage_timeline, name='baggage_timeline'),
+    path('baggage/<uuid:baggage_id>/events/', baggage_events, name='baggage_events'),
+    path('flights/<str:flight_number>/events/', flight_events, name='flight_events'),
+    path('baggage/changes/', baggage_changes, name='baggage_changes'),
+    path('baggage/scans/batch/', batch_scan_ingest, name='batch_scan_ingest'),
+    path('baggage/bsm/', bsm_ingest, name='bsm_ingest'),
+    path('baggage/rfid/reads/', rfid_read_ingest, name='rfid_read_ingest'),
     
     # Staff dashboard
     path('staff/dashboard/stats/', staff_dashboard_stats, name='staff_dashboard_stats'),
+    path('staff/qr-render/status/', qr_render_status, name='qr_render_status'),
+    path('staff/status-cache/status/', status_cache_status, name='status_cache_status'),
+    path('staff/rfid/status/', rfid_status, name='rfid_status'),
+    path('staff/analytics/dwell-times/', dwell_time_analytics, name='dwell_time_analytics'),
+    path('staff/analytics/throughput/', throughput_analytics, name='throughput_analytics'),
+    path('staff/export/', baggage_export, name='baggage_export'),
 ]
\ No newline at end of file
@@ -1,21 +1,90 @@
 from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from django.db import router
+from django.db.models import prefetch_related_objects
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-# from channels.layers import get_channel_layer  # temporarily disabled
-# from asgiref.sync import async_to_sync  # temporarily disabled
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_GET
+from django.utils.http import parse_etags
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+import hashlib
 import json
-from .models import Baggage, StatusUpdate, UserProfile
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from .analytics import GROUP_BY_CHOICES, dwell_time_report
+from .broadcast import baggage_group_name, flight_group_name, publish_baggage_update
+from .bsm import ingest_bsm
+from .cache import status_lookup_cache
+from .conditional import (
+    archived_baggage_validators,
+    baggage_validators,
+    not_modified_response,
+    set_validators,
+    validators_for,
+    with_latest_update
+)
+from .consumers import baggage_snapshot
+from .counters import status_counts
+from .events import event_stream_response
+from .export import EXPORT_FORMATS, CSVExportRenderer, NDJSONExportRenderer, export_response
+from .models import ArchivedBaggage, Baggage, StatusUpdate, UserProfile, on_flights, timeline_prefetch
+from .pagination import KeysetPagination, wants_cursor_pagination
+from .qr import (
+    IMAGE_CONTENT_TYPES,
+    get_render_queue,
+    qr_image_cache,
+    qr_image_etag,
+    render_qr_image
+)
+from .scans import ingest_scans
+from .rfid import get_aggregator
+from .rollups import (
+    THROUGHPUT_GROUP_BY_CHOICES,
+    throughput,
+    throughput_rollup_settings
+)
+from .routers import replica_reads
+from .search import search_baggage
+from .sync import InvalidCursor, change_sync_settings, changes_since
+from .tokens import bearer_token, is_staff_member, user_for_token
+from .writer import WriteCancelled, WritePending, group_commit_settings, submit_status_update
 from .serializers import (
+    ArchivedBaggageSerializer,
     BaggageSerializer, 
     BaggageCreateSerializer,
+    BaggageChangeSerializer,
     StatusUpdateSerializer,
-    StatusUpdateCreateSerializer
+    StatusUpdateChangeSerializer,
+    StatusUpdateCreateSerializer,
+    ScanSerializer,
+    BatchScanSerializer,
+    RfidReadBatchSerializer
 )
 
 
+def staff_permission_error(request, permission):
+    """
+    Return an error response unless the user's profile grants ``permission``
+    """
+    try:
+        profile = request.user.profile
+        if not getattr(profile, permission):
+            return Response({
+                'error': 'Permission denied. Staff privileges required.'
+            }, status=status.HTTP_403_FORBIDDEN)
+    except UserProfile.DoesNotExist:
+        return Response({
+            'error': 'User profile not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return None
+
+
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
@@ -31,6 +100,16 @@ class BaggageListCreateView(generics.ListCreateAPIView):
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticated]
     
+    @property
+    def paginator(self):
+        # Opt-in keyset pagination with ?pagination=cursor
+        if not hasattr(self, '_paginator'):
+            if wants_cursor_pagination(self.request):
+                self._paginator = KeysetPagination(ordering=('-created_at', '-id'))
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return BaggageCreateSerializer
@@ -39,20 +118,25 @@ class BaggageListCreateView(generics.ListCreateAPIView):
     def get_queryset(self):
         queryset = Baggage.objects.all()
         
+        # Load timelines in one prefetch instead of one query per bag
+        if self.request.method == 'GET' and BaggageSerializer.includes_timeline(self.request):
+            queryset = queryset.with_timeline()
+        
         # Filter by status
         status_filter = self.request.query_params.get('status')
         if status_filter:
             queryset = queryset.filter(current_status=status_filter)
         
-        # Search by passenger name, QR code, or flight number
+        # Filter by flight
+        flight_filter = self.request.query_params.get('flight_number')
+        if flight_filter:
+            queryset = queryset.filter(flight_number=flight_filter)
+        
+        # Search by passenger name, QR code, flight number or email,
+        # ranked by relevance
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(passenger_name__icontains=search) |
-                Q(qr_code__icontains=search) |
-                Q(flight_number__icontains=search) |
-                Q(passenger_email__icontains=search)
-            )
+            return search_baggage(queryset, search)
         
         return queryset.order_by('-created_at')
     
@@ -70,6 +154,7 @@ class BaggageListCreateView(generics.ListCreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
+@method_decorator(replica_reads, name='dispatch')
 class BaggageDetailView(generics.RetrieveAPIView):
     """
     Retrieve specific baggage details
@@ -78,6 +163,47 @@ class BaggageDetailView(generics.RetrieveAPIView):
     serializer_class = BaggageSerializer
     permission_classes = [permissions.AllowAny]  # Allow passengers to check their baggage
     lookup_field = 'id'
+    
+    def get_queryset(self):
+        queryset = Baggage.objects.all()
+        if BaggageSerializer.includes_timeline(self.request):
+            queryset = queryset.with_timeline()
+        return queryset
+    
+    def retrieve(self, request, *args, **kwargs):
+        # Answer polls for unchanged bags before loading or serializing them
+        validators = baggage_validators(id=kwargs[self.lookup_field])
+        if validators is None:
+            return self.retrieve_archived(request, kwargs[self.lookup_field])
+        response = not_modified_response(request, validators)
+        if response is not None:
+            return response
+        return set_validators(super().retrieve(request, *args, **kwargs), validators)
+    
+    def retrieve_archived(self, request, baggage_id):
+        """Serve bags that have been moved to the archive"""
+        entry = archived_status(request, id=baggage_id)
+        if entry is None:
+            raise Http404
+        response = not_modified_response(request, entry['validators'])
+        if response is not None:
+            return response
+        return set_validators(Response(entry['data']), entry['validators'])
+
+
+def archived_status(request, **lookup):
+    """
+    Validators and serialized data of the archived bag matching ``lookup``,
+    or ``None`` if it is not in the archive either
+    """
+    archived = ArchivedBaggage.objects.filter(**lookup)
+    if not BaggageSerializer.includes_timeline(request):
+        archived = archived.defer('timeline')
+    archived = archived.first()
+    if archived is None:
+        return None
+    serializer = ArchivedBaggageSerializer(archived, context={'request': request})
+    return {'validators': archived_baggage_validators(archived), 'data': serializer.data}
 
 
 @api_view(['GET'])
@@ -85,15 +211,93 @@ class BaggageDetailView(generics.RetrieveAPIView):
 def baggage_status_by_qr(request, qr_code):
     """
     Get baggage status by QR code (for passenger app)
+    
+    Responses are served from a read-through cache that is invalidated
+    whenever the bag or its timeline changes. Bags that are no longer in
+    the hot tables are looked up in the archive.
+    
+    Entries are rebuilt from the primary, not a replica: a lagging replica
+    would store pre-write data under the new generation and serve it to
+    every client until the entry expires.
     """
-    try:
-        baggage = Baggage.objects.get(qr_code=qr_code)
+    include_timeline = BaggageSerializer.includes_timeline(request)
+    
+    def build():
+        validators = baggage_validators(qr_code=qr_code)
+        if validators is None:
+            return archived_status(request, qr_code=qr_code)
+        queryset = Baggage.objects.all()
+        if include_timeline:
+            queryset = queryset.with_timeline()
+        baggage = queryset.filter(qr_code=qr_code).first()
+        if baggage is None:
+            return None
         serializer = BaggageSerializer(baggage, context={'request': request})
-        return Response(serializer.data)
-    except Baggage.DoesNotExist:
+        return {'validators': validators, 'data': serializer.data}
+    
+    # Cached entries carry their validators, so a poll for an unchanged bag
+    # that hits the cache is answered without touching the database
+    entry = status_lookup_cache.get_or_build(qr_code, status_lookup_variant(request), build)
+    if entry is None:
         return Response({
             'error': 'Baggage not found'
         }, status=status.HTTP_404_NOT_FOUND)
+    response = not_modified_response(request, entry['validators'])
+    if response is not None:
+        return response
+    return set_validators(Response(entry['data']), entry['validators'])
+
+
+def status_lookup_variant(request):
+    """
+    Cache variant of a status lookup: the requested fields plus the host,
+    which ends up in absolute image URLs
+    """
+    requested = BaggageSerializer.requested_fields(request)
+    fields = ','.join(sorted(requested)) if requested is not None else '*'
+    variant = f'{request.scheme}://{request.get_host()}|{fields}'
+    return hashlib.sha1(variant.encode()).hexdigest()[:16]
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def baggage_qr_image(request, qr_code, image_format):
+    """
+    Render a baggage tag QR code as PNG or SVG
+    
+    The image only depends on the QR code value, so it is served with a
+    strong ETag and cached as immutable.
+    """
+    if image_format not in IMAGE_CONTENT_TYPES:
+        return Response({
+            'error': 'Unsupported image format. Use png or svg.'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    # Only codes of existing bags reach the image cache, so a hit needs no query
+    cache_key = (qr_code, image_format)
+    image = qr_image_cache.get(cache_key)
+    if image is None and not (
+        Baggage.objects.filter(qr_code=qr_code).exists()
+        or ArchivedBaggage.objects.filter(qr_code=qr_code).exists()
+    ):
+        return Response({
+            'error': 'Baggage not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    etag = qr_image_etag(qr_code, image_format)
+    cache_headers = {
+        'ETag': etag,
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    }
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        return HttpResponseNotModified(headers=cache_headers)
+    
+    if image is None:
+        image = render_qr_image(qr_code, image_format)
+        qr_image_cache.put(cache_key, image)
+    
+    return HttpResponse(image, content_type=IMAGE_CONTENT_TYPES[image_format], headers=cache_headers)
 
 
 @api_view(['POST'])
@@ -103,16 +307,9 @@ def update_baggage_status(request, baggage_id):
     Update baggage status (staff only)
     """
     # Check if user is staff
-    try:
-        profile = request.user.profile
-        if not profile.can_update_baggage_status:
-            return Response({
-                'error': 'Permission denied. Staff privileges required.'
-            }, status=status.HTTP_403_FORBIDDEN)
-    except UserProfile.DoesNotExist:
-        return Response({
-            'error': 'User profile not found'
-        }, status=status.HTTP_404_NOT_FOUND)
+    error_response = staff_permission_error(request, 'can_update_baggage_status')
+    if error_response:
+        return error_response
     
     # Get baggage
     baggage = get_object_or_404(Baggage, id=baggage_id)
@@ -124,26 +321,34 @@ def update_baggage_status(request, baggage_id):
     )
     
     if serializer.is_valid():
-        status_update = serializer.save()
-        
-        # Send real-time update via WebSocket - temporarily disabled
-        # channel_layer = get_channel_layer()
-        # async_to_sync(channel_layer.group_send)(
-        #     f'baggage_{baggage_id}',
-        #     {
-        #         'type': 'baggage_update',
-        #         'message': {
-        #             'baggage_id': str(baggage.id),
-        #             'qr_code': baggage.qr_code,
-        #             'status': status_update.status,
-        #             'status_display': status_update.get_status_display(),
-        #             'timestamp': status_update.timestamp.isoformat(),
-        #             'updated_by': status_update.updated_by.username,
-        #             'notes': status_update.notes,
-        #             'location': status_update.location,
-        #         }
-        #     }
-        # )
+        if group_commit_settings()['ENABLED']:
+            # Committed together with concurrent updates by the writer thread,
+            # which also broadcasts it
+            try:
+                status_update = submit_status_update(baggage, serializer.validated_data, request.user)
+            except Baggage.DoesNotExist:
+                raise Http404
+            except WriteCancelled:
+                return Response({
+                    'error': 'Timed out waiting for the status update to be recorded. It was not recorded; try again.'
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except WritePending as pending:
+                # The update will still commit, so the client must not resend it
+                return Response({
+                    'message': 'Status update accepted and still being recorded. Do not send it again.',
+                    'status_update': {
+                        'baggage': baggage.id,
+                        'status': pending.scan['status'],
+                        'timestamp': pending.scan['timestamp'],
+                    },
+                    'timeline': reverse('baggage_timeline', args=[baggage.id], request=request),
+                }, status=status.HTTP_202_ACCEPTED)
+            baggage = status_update.baggage
+        else:
+            status_update = serializer.save()
+            
+            # Broadcast to WebSocket subscribers once the update commits
+            publish_baggage_update(baggage, status_update)
         
         # Return updated baggage data
         baggage_serializer = BaggageSerializer(baggage, context={'request': request})
@@ -157,25 +362,224 @@ def update_baggage_status(request, baggage_id):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def baggage_changes(request):
+    """
+    Get bags and status updates changed since a cursor (delta sync)
+    
+    Start without ``?since=`` and pass the returned ``cursor`` on the next
+    sync; repeat straight away while ``has_more`` is true. ``archived`` lists
+    the ids of bags moved to the archive, which clients should drop.
+    """
+    config = change_sync_settings()
+    try:
+        limit = max(1, min(int(request.query_params['limit']), config['MAX_PAGE_SIZE']))
+    except (KeyError, ValueError):
+        limit = config['PAGE_SIZE']
+    
+    try:
+        changes = changes_since(request.query_params.get('since'), limit)
+    except InvalidCursor:
+        return Response({
+            'error': 'Invalid cursor'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'baggage': BaggageChangeSerializer(changes['baggage'], many=True, context={'request': request}).data,
+        'status_updates': StatusUpdateChangeSerializer(changes['status_updates'], many=True).data,
+        'archived': changes['archived'],
+        'cursor': changes['cursor'],
+        'has_more': changes['has_more'],
+    })
+
+
+# Server-Sent Events streams are plain async views, so an idle stream holds
+# no worker thread. A bag's stream is open to anyone with its id, like its
+# WebSocket route; flight streams list every passenger and are staff only.
+
+@require_GET
+async def baggage_events(request, baggage_id):
+    """
+    Stream status changes of one bag as Server-Sent Events
+    """
+    if not await Baggage.objects.filter(id=baggage_id).aexists():
+        return JsonResponse({'error': 'Baggage not found'}, status=404)
+    
+    async def snapshot():
+        return baggage_snapshot(await Baggage.objects.aget(id=baggage_id))
+    
+    return event_stream_response(
+        request,
+        baggage_group_name(baggage_id),
+        StatusUpdate.objects.filter(baggage_id=baggage_id),
+        snapshot
+    )
+
+
+@require_GET
+async def flight_events(request, flight_number):
+    """
+    Stream status changes of every bag on a flight as Server-Sent Events (staff only)
+    
+    EventSource cannot send headers, so the access token may also be passed
+    as ``?token=``.
+    """
+    user = await sync_to_async(user_for_token)(bearer_token(request))
+    if user is None:
+        return JsonResponse({'error': 'A valid access token is required.'}, status=401)
+    if not await sync_to_async(is_staff_member)(user):
+        return JsonResponse({'error': 'Permission denied. Staff privileges required.'}, status=403)
+    
+    flight_number = flight_number.upper()
+    
+    async def snapshot():
+        queryset = Baggage.objects.filter(on_flights([flight_number])).order_by('created_at')
+        return [baggage_snapshot(baggage) async for baggage in queryset]
+    
+    return event_stream_response(
+        request,
+        flight_group_name(flight_number),
+        StatusUpdate.objects.filter(on_flights([flight_number], 'baggage__flight_number')),
+        snapshot
+    )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_scan_ingest(request):
+    """
+    Record a batch of scans from handheld scanners and conveyor readers (staff only)
+    """
+    # Permissions are checked once for the whole batch
+    error_response = staff_permission_error(request, 'can_update_baggage_status')
+    if error_response:
+        return error_response
+    
+    batch_serializer = BatchScanSerializer(data=request.data)
+    batch_serializer.is_valid(raise_exception=True)
+    
+    # Validate each scan on its own so one bad item doesn't reject the batch
+    valid_scans = []
+    valid_indexes = []
+    results = {}
+    for index, item in enumerate(batch_serializer.validated_data['scans']):
+        scan_serializer = ScanSerializer(data=item)
+        if scan_serializer.is_valid():
+            valid_scans.append(scan_serializer.validated_data)
+            valid_indexes.append(index)
+        else:
+            results[index] = {
+                'index': index,
+                'result': 'invalid',
+                'errors': scan_serializer.errors,
+            }
+    
+    for result in ingest_scans(valid_scans, user=request.user):
+        result['index'] = valid_indexes[result['index']]
+        results[result['index']] = result
+    
+    ordered_results = [results[index] for index in sorted(results)]
+    updated_count = sum(1 for result in ordered_results if result['result'] == 'updated')
+    
+    return Response({
+        'message': f'Processed {len(ordered_results)} scans',
+        'updated': updated_count,
+        'failed': len(ordered_results) - updated_count,
+        'results': ordered_results
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def rfid_read_ingest(request):
+    """
+    Turn a batch of raw RFID portal reads into status updates (staff only)
+    
+    Repeated reads of a tag at the same portal are dropped and only reads
+    that change a bag's status are recorded.
+    """
+    error_response = staff_permission_error(request, 'can_update_baggage_status')
+    if error_response:
+        return error_response
+    
+    serializer = RfidReadBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    counts = get_aggregator().ingest(serializer.validated_data['reads'], user=request.user)
+    return Response(counts, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bsm_ingest(request):
+    """
+    Create baggage from a stream of IATA BSM telegrams (staff only)
+    
+    The request body is plain BSM text and is parsed as it is read.
+    """
+    error_response = staff_permission_error(request, 'can_update_baggage_status')
+    if error_response:
+        return error_response
+    
+    if request.stream is None:
+        return Response({
+            'error': 'Request body must contain BSM messages'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    stats = ingest_bsm(request.stream)
+    
+    return Response({
+        'message': f'Processed {stats["messages"]} BSM messages',
+        **stats
+    }, status=status.HTTP_200_OK)
+
+
+@replica_reads
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def baggage_timeline(request, baggage_id):
     """
     Get complete timeline for a specific baggage
     """
-    baggage = get_object_or_404(Baggage, id=baggage_id)
-    timeline = baggage.get_status_timeline()
+    # One query loads the bag and what its validators are built from
+    baggage = get_object_or_404(
+        with_latest_update(Baggage.objects.only('id', 'qr_code', 'passenger_name', 'current_status', 'updated_at')),
+        id=baggage_id
+    )
+    validators = validators_for(baggage.id, baggage.updated_at, baggage.latest_update_id)
+    response = not_modified_response(request, validators)
+    if response is not None:
+        return response
+    
+    # Opt-in keyset pagination with ?pagination=cursor
+    if wants_cursor_pagination(request):
+        paginator = KeysetPagination(ordering=('timestamp', 'id'))
+        timeline = paginator.paginate_queryset(
+            StatusUpdate.objects.filter(baggage=baggage).select_related('updated_by'),
+            request
+        )
+        pagination_links = {
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+        }
+    else:
+        prefetch_related_objects([baggage], timeline_prefetch())
+        timeline = baggage.get_status_timeline()
+        pagination_links = {}
     serializer = StatusUpdateSerializer(timeline, many=True)
     
-    return Response({
+    return set_validators(Response({
         'baggage_id': str(baggage.id),
         'qr_code': baggage.qr_code,
         'passenger_name': baggage.passenger_name,
         'current_status': baggage.current_status,
-        'timeline': serializer.data
-    })
+        'timeline': serializer.data,
+        **pagination_links
+    }), validators)
 
 
+@replica_reads
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def staff_dashboard_stats(request):
@@ -183,25 +587,28 @@ def staff_dashboard_stats(request):
     Get dashboard statistics for staff
     """
     # Check if user is staff
-    try:
-        profile = request.user.profile
-        if not profile.is_staff_member:
+    error_response = staff_permission_error(request, 'is_staff_member')
+    if error_response:
+        return error_response
+    
+    # Optional breakdown by flight and/or check-in day
+    flight_number = request.query_params.get('flight_number') or None
+    day = request.query_params.get('date') or None
+    if day is not None:
+        day = parse_date_param(day)
+        if day is None:
             return Response({
-                'error': 'Permission denied. Staff privileges required.'
-            }, status=status.HTTP_403_FORBIDDEN)
-    except UserProfile.DoesNotExist:
-        return Response({
-            'error': 'User profile not found'
-        }, status=status.HTTP_404_NOT_FOUND)
+                'error': 'Invalid date. Use YYYY-MM-DD.'
+            }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get statistics
-    total_baggage = Baggage.objects.count()
-    status_counts = {}
+    # Get statistics from the incrementally maintained counters
+    counts = status_counts(flight_number=flight_number, day=day)
+    total_baggage = sum(counts.values())
+    status_counts_data = {}
     
     for status_code, status_display in Baggage.STATUS_CHOICES:
-        count = Baggage.objects.filter(current_status=status_code).count()
-        status_counts[status_code] = {
-            'count': count,
+        status_counts_data[status_code] = {
+            'count': counts[status_code],
             'display': status_display
         }
     
@@ -210,11 +617,193 @@ def staff_dashboard_stats(request):
     
     return Response({
         'total_baggage': total_baggage,
-        'status_counts': status_counts,
+        'status_counts': status_counts_data,
         'recent_updates': recent_updates_data
     })
 
 
+@replica_reads
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def dwell_time_analytics(request):
+    """
+    Get stage dwell-time percentiles for one day (staff only)
+    
+    ``?date=YYYY-MM-DD`` picks the day (default today), ``?flight_number=``
+    narrows it to one flight and ``?group_by=flight,location,hour`` breaks
+    every stage down by any of those.
+    """
+    error_response = staff_permission_error(request, 'is_staff_member')
+    if error_response:
+        return error_response
+    
+    day = request.query_params.get('date')
+    if day:
+        day = parse_date_param(day)
+        if day is None:
+            return Response({
+                'error': 'Invalid date. Use YYYY-MM-DD.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        day = timezone.localdate()
+    
+    group_by = [name.strip() for name in request.query_params.get('group_by', '').split(',') if name.strip()]
+    if any(name not in GROUP_BY_CHOICES for name in group_by) or len(set(group_by)) != len(group_by):
+        return Response({
+            'error': f'Invalid group_by. Use any of {", ".join(GROUP_BY_CHOICES)}.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    flight_number = request.query_params.get('flight_number') or None
+    return Response(dwell_time_report(day, flight_number=flight_number, group_by=group_by))
+
+
+def parse_date_param(value):
+    """Date from a ``YYYY-MM-DD`` query parameter, or None if it isn't a valid date"""
+    try:
+        return parse_date(value)
+    except ValueError:
+        # Well formed but impossible, like 2024-02-30
+        return None
+
+
+def parse_time_param(value, default):
+    """Aware datetime from a ``YYYY-MM-DD`` or ISO 8601 query parameter"""
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+@replica_reads
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def throughput_analytics(request):
+    """
+    Get hourly status update counts per checkpoint from the rollups (staff only)
+    
+    ``?start=`` and ``?end=`` (dates or ISO times) bound the chart, the last
+    24 hours by default. ``?group_by=`` takes any of location, status and
+    flight_number (default status); ``?location=``, ``?status=`` and
+    ``?flight_number=`` filter it. The view only reads: new status updates
+    are folded into the rollups by ``rebuild_throughput_rollups --catch-up``,
+    run periodically or kept running with ``--interval``.
+    """
+    error_response = staff_permission_error(request, 'is_staff_member')
+    if error_response:
+        return error_response
+    
+    now = timezone.now()
+    try:
+        end = parse_time_param(request.query_params.get('end'), now)
+        start = parse_time_param(request.query_params.get('start'), end - timedelta(hours=24))
+    except ValueError:
+        return Response({
+            'error': 'Invalid start or end. Use YYYY-MM-DD or an ISO 8601 time.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    max_days = throughput_rollup_settings()['MAX_RANGE_DAYS']
+    if not start < end <= start + timedelta(days=max_days):
+        return Response({
+            'error': f'start must be before end and at most {max_days} days apart.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    group_by = [name.strip() for name in request.query_params.get('group_by', 'status').split(',') if name.strip()]
+    if any(name not in THROUGHPUT_GROUP_BY_CHOICES for name in group_by) or len(set(group_by)) != len(group_by):
+        return Response({
+            'error': f'Invalid group_by. Use any of {", ".join(THROUGHPUT_GROUP_BY_CHOICES)}.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    filters = {
+        name: request.query_params[name]
+        for name in THROUGHPUT_GROUP_BY_CHOICES if request.query_params.get(name)
+    }
+    
+    return Response({
+        'start': start,
+        'end': end,
+        'group_by': group_by,
+        'buckets': throughput(start, end, group_by, **filters),
+    })
+
+
+@replica_reads
+@api_view(['GET'])
+@renderer_classes([JSONRenderer, CSVExportRenderer, NDJSONExportRenderer])
+@permission_classes([permissions.IsAuthenticated])
+def baggage_export(request):
+    """
+    Stream bags created in a time range with their status histories (staff only)
+    
+    ``?from=`` and ``?to=`` take dates or ISO times; ``?format=csv`` (the
+    default) writes one row per status update, ``?format=ndjson`` one bag
+    with its timeline per line.
+    """
+    error_response = staff_permission_error(request, 'is_staff_member')
+    if error_response:
+        return error_response
+    
+    export_format = request.query_params.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({
+            'error': f'Invalid format. Use {" or ".join(EXPORT_FORMATS)}.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start = parse_time_param(request.query_params.get('from'), None)
+        end = parse_time_param(request.query_params.get('to'), None)
+    except ValueError:
+        return Response({
+            'error': 'Invalid from or to. Use YYYY-MM-DD or an ISO 8601 time.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if start is not None and end is not None and start >= end:
+        return Response({
+            'error': 'from must be before to.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return export_response(export_format, start, end, using=router.db_for_read(Baggage))
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def qr_render_status(request):
+    """
+    Get QR image render queue depth and lag (staff only)
+    """
+    error_response = staff_permission_error(request, 'is_staff_member')
+    if error_response:
+        return error_response
+    
+    return Response(get_render_queue().stats())
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def rfid_status(request):
+    """
+    Get RFID read aggregation counters (staff only)
+    """
+    error_response = staff_permission_error(request, 'is_staff_member')
+    if error_response:
+        return error_response
+    
+    return Response(get_aggregator().stats())
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def status_cache_status(request):
+    """
+    Get hit and miss counters of the QR status lookup cache (staff only)
+    """
+    error_response = staff_permission_error(request, 'is_staff_member')
+    if error_response:
+        return error_response
+    
+    return Response(status_lookup_cache.stats())
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def health_check(request):
@@ -0,0 +1,210 @@
+"""
+Group commit of single status updates
+
+SQLite lets one connection write at a time, so scanners updating bags one
+request each queue up on the write lock, and every update is a transaction
+of its own. With group commit enabled, request threads hand their status
+writes to one writer thread and wait on a future. The writer collects the
+writes that arrive within ``MAX_DELAY`` seconds, up to ``MAX_BATCH`` of
+them, and records them with ``ingest_scans`` in a single transaction.
+
+If a group fails, its writes are retried one by one so that one bad write
+only fails its own caller.
+
+A caller that times out cancels its write if the writer has not taken it
+yet, so nothing is recorded and the request can be retried. Once the writer
+has taken a write it can no longer be withdrawn: the caller is told the
+update is still being recorded and must not send it again.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import Baggage, StatusUpdate
+from .scans import ingest_scans
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GROUP_COMMIT_SETTINGS = {
+    'ENABLED': False,
+    'MAX_BATCH': 200,
+    'MAX_DELAY': 0.005,
+    'TIMEOUT': 10,
+}
+
+
+def group_commit_settings():
+    return {**DEFAULT_GROUP_COMMIT_SETTINGS, **getattr(settings, 'STATUS_GROUP_COMMIT', {})}
+
+
+class WriteCancelled(Exception):
+    """A queued write timed out before the writer took it and was withdrawn"""
+
+
+class WritePending(Exception):
+    """A write timed out while the writer was recording it; it may still commit"""
+
+    def __init__(self, scan):
+        super().__init__(scan)
+        self.scan = scan
+
+
+class GroupCommitWriter:
+    """
+    Single writer thread that commits queued status writes in groups
+    """
+
+    def __init__(self, max_batch=200, max_delay=0.005):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = deque()  # (scan, future)
+        self._condition = threading.Condition()
+        self._thread = None
+        self._submitted = 0
+        self._committed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._groups = 0
+        self._largest_group = 0
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='status-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, scan, user=None):
+        """
+        Queue a scan for ``ingest_scans``; the future resolves to its result
+        """
+        future = Future()
+        with self._condition:
+            self._pending.append(({**scan, 'updated_by': user}, future))
+            self._submitted += 1
+            self._condition.notify()
+        self.start()
+        return future
+
+    def stats(self):
+        with self._condition:
+            return {
+                'queue_depth': len(self._pending),
+                'submitted': self._submitted,
+                'committed': self._committed,
+                'failed': self._failed,
+                'cancelled': self._cancelled,
+                'groups': self._groups,
+                'largest_group': self._largest_group,
+                'running': self._thread is not None and self._thread.is_alive(),
+            }
+
+    def _next_group(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            # Give concurrent writers a moment to join the group
+            deadline = time.monotonic() + self.max_delay
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            group = []
+            while self._pending and len(group) < self.max_batch:
+                scan, future = self._pending.popleft()
+                # Writes cancelled by callers that gave up are dropped; the
+                # rest can't be cancelled from here on
+                if future.set_running_or_notify_cancel():
+                    group.append((scan, future))
+                else:
+                    self._cancelled += 1
+            return group
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            if not group:
+                continue
+            try:
+                committed, failed = self.commit_group(group)
+            finally:
+                close_old_connections()
+            with self._condition:
+                self._committed += committed
+                self._failed += failed
+                self._groups += 1
+                self._largest_group = max(self._largest_group, len(group))
+
+    def commit_group(self, group):
+        """Record ``group`` in one transaction; returns (committed, failed) counts"""
+        try:
+            results = ingest_scans([scan for scan, _ in group])
+        except Exception as error:
+            if len(group) == 1:
+                logger.exception('Failed to record a status update')
+                group[0][1].set_exception(error)
+                return 0, 1
+            logger.warning('Group of %d status updates failed, retrying one by one', len(group))
+            committed = failed = 0
+            for item in group:
+                item_committed, item_failed = self.commit_group([item])
+                committed += item_committed
+                failed += item_failed
+            return committed, failed
+
+        for (_, future), result in zip(group, results):
+            future.set_result(result)
+        return len(group), 0
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Process-wide writer, created on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            config = group_commit_settings()
+            _writer = GroupCommitWriter(max_batch=config['MAX_BATCH'], max_delay=config['MAX_DELAY'])
+        return _writer
+
+
+def submit_status_update(baggage, data, user=None):
+    """
+    Record a status update of ``baggage`` through the writer and wait for
+    it to commit. Returns the committed ``StatusUpdate`` with its bag, both
+    read back after the commit.
+
+    Raises ``WriteCancelled`` if the write timed out and was withdrawn, and
+    ``WritePending`` if it timed out but is already being recorded.
+    """
+    timestamp = timezone.now()
+    scan = {
+        'baggage_id': baggage.id,
+        'status': data['status'],
+        'notes': data.get('notes'),
+        'location': data.get('location'),
+        'timestamp': timestamp,
+    }
+    future = get_writer().submit(scan, user)
+    try:
+        result = future.result(timeout=group_commit_settings()['TIMEOUT'])
+    except FutureTimeoutError:
+        if future.cancel():
+            raise WriteCancelled(scan)
+        if not future.done():
+            raise WritePending(scan)
+        # Committed just after the timeout
+        result = future.result()
+    if result['result'] != 'updated':
+        raise Baggage.DoesNotExist(f'Baggage {baggage.id} no longer exists')
+
+    return StatusUpdate.objects.select_related('baggage', 'updated_by').get(id=result['status_update_id'])